@@ -1,5 +1,11 @@
+import os
+import sys
+import time
+from datetime import date, timedelta
+import click
 from app import create_app, db
-from app.models import StockTransaction
+from app.models import StockTransaction, ImportJob, Position, LotSale, ArchivedDay, archived_transactions, derived_columns_generated
+from app.cache import mark_data_changed
 
 app = create_app('development')
 
@@ -13,6 +19,110 @@ def init_db():
     db.create_all()
     print("Database tables created successfully!")
 
+@app.cli.command()
+def upgrade_schema():
+    """Add the tables, columns and indexes an existing database is missing."""
+    from app.schema import upgrade_schema as upgrade
+    
+    changes = upgrade()
+    for change in changes:
+        print(change.capitalize() + '.')
+    print(f"Schema is up to date ({len(changes)} changes made).")
+
+@app.cli.command()
+def backfill_search_names():
+    """Fill the normalized search name on rows created before it existed."""
+    updated = StockTransaction.query.filter(
+        StockTransaction.search_name.is_(None)
+    ).update(
+        {StockTransaction.search_name: db.func.upper(db.func.trim(StockTransaction.stock_name))},
+        synchronize_session=False
+    )
+    mark_data_changed(db.session)
+    db.session.commit()
+    print(f"Backfilled search names on {updated} transactions.")
+
+@app.cli.command()
+def backfill_import_keys():
+    """Set the import key CSV re-imports match on, for rows stored before it existed."""
+    from app.importer import backfill_import_keys as backfill
+    
+    updated = backfill()
+    db.session.commit()
+    print(f"Backfilled import keys on {updated} transactions.")
+
+@app.cli.command()
+def recalc():
+    """Recompute the derived columns of every transaction in one UPDATE."""
+    from app.bulk import recalculate_derived
+    
+    if derived_columns_generated():
+        print("Derived columns are generated by the database; nothing to recalculate.")
+        return
+    updated = recalculate_derived()
+    mark_data_changed(db.session)
+    db.session.commit()
+    print(f"Recalculated derived columns on {updated} transactions.")
+
+@app.cli.command()
+@click.option('--check', is_flag=True, help='Only report differences; leave the ledger as it is.')
+def rebuild_positions(check):
+    """Check the positions ledger against a full recompute, then rebuild it."""
+    from app.positions import ledger_differences, refresh_positions
+    
+    connection = db.session.connection()
+    differences = ledger_differences(connection)
+    for name, ledger, expected in differences:
+        print(f"{name}: ledger {ledger} != recomputed {expected}")
+    print(f"{len(differences)} positions differ from a full recompute.")
+    
+    if check:
+        sys.exit(1 if differences else 0)
+    refresh_positions(connection)
+    mark_data_changed(db.session)
+    db.session.commit()
+    print(f"Rebuilt the ledger with {Position.query.count()} positions.")
+
+@app.cli.command()
+@click.option('--older-than', type=int, required=True, help='Archive lots closed more than this many days ago.')
+@click.option('--batch-size', type=int, default=None, help='Lots moved per transaction (default ARCHIVE_BATCH_SIZE).')
+def archive(older_than, batch_size):
+    """Move fully sold lots out of the live transactions table into the archive."""
+    from app.archive import archive_closed_lots
+    
+    closed_before = date.today() - timedelta(days=older_than)
+    started = time.perf_counter()
+    
+    def progress(moved):
+        print(f"{moved} lots archived ({moved / (time.perf_counter() - started):,.0f} lots/s)")
+    
+    moved = archive_closed_lots(closed_before, batch_size or app.config['ARCHIVE_BATCH_SIZE'], progress)
+    live = StockTransaction.query.count()
+    archived = db.session.execute(db.select(db.func.count()).select_from(archived_transactions)).scalar()
+    print(f"Archived {moved} lots closed before {closed_before}; {live} live and {archived} archived transactions.")
+
+@app.cli.command()
+@click.argument('files', nargs=-1, required=True, type=click.Path(exists=True, dir_okay=False))
+def import_prices(files):
+    """Ingest daily close CSV files (symbol, date, close) into the price store."""
+    from app.prices import import_price_files, get_store
+    
+    result = import_price_files(files)
+    summary = get_store().summary()
+    print(f"Imported {result['rows_imported']} closes ({result['rows_skipped']} rows skipped).")
+    print(f"Price store: {summary['symbols']} symbols, {summary['points']} closes "
+          f"from {summary['first_date']} to {summary['last_date']}.")
+
+def clear_transactions():
+    """Delete every transaction, with the sales, positions and archive kept from them."""
+    # Bulk deletes fire no ORM events, so nothing else is kept in step
+    LotSale.query.delete()
+    StockTransaction.query.delete()
+    Position.query.delete()
+    db.session.execute(archived_transactions.delete())
+    ArchivedDay.query.delete()
+    mark_data_changed(db.session)
+
 @app.cli.command()
 def seed_db():
     """Seed the database with sample data."""
@@ -29,7 +139,7 @@ def seed_db():
     ]
     
     # Clear existing data
-    StockTransaction.query.delete()
+    clear_transactions()
     
     # Create sample transactions
     for i, stock in enumerate(stocks):
@@ -68,5 +178,60 @@ def seed_db():
     db.session.commit()
     print(f"Database seeded with {len(stocks) * 2} sample transactions!")
 
+@app.cli.command()
+@click.option('--rows', default=100000, help='Transactions to generate.')
+@click.option('--symbols', default=500, help='Distinct stock symbols.')
+@click.option('--seed', default=42, help='Random seed, for repeatable data.')
+@click.option('--years', default=5, help='Years of buy dates, ending today.')
+@click.option('--append', is_flag=True, help='Keep existing transactions.')
+def gen_data(rows, symbols, seed, years, append):
+    """Bulk-generate realistic transactions for performance testing."""
+    from app.datagen import generate_transactions
+    
+    if not append:
+        clear_transactions()
+        db.session.commit()
+    
+    started = time.perf_counter()
+    
+    def progress(written):
+        elapsed = time.perf_counter() - started
+        print(f"{written}/{rows} rows ({written / elapsed:,.0f} rows/s)")
+    
+    generate_transactions(rows, symbols, seed=seed, years=years, progress=progress)
+    print(f"Generated {rows} transactions over {symbols} symbols in {time.perf_counter() - started:.1f}s.")
+
+@app.cli.command()
+def resume_imports():
+    """Resume chunked CSV imports interrupted before they finished."""
+    from app.importer import run_import_job
+    
+    jobs = ImportJob.query.filter(ImportJob.status.in_(['queued', 'running'])).all()
+    for job in jobs:
+        print(f"Resuming import {job.id} ({job.filename}) after chunk {job.chunks_committed}...")
+        run_import_job(
+            job.id,
+            app.config['IMPORT_CHUNK_SIZE'],
+            app.config['IMPORT_BATCH_SIZE'],
+            app.config['IMPORT_MAX_ERRORS']
+        )
+        job = db.session.get(ImportJob, job.id)
+        print(f"Import {job.id} {job.status}: {job.rows_imported} imported, {job.rows_failed} failed")
+    
+    print(f"Resumed {len(jobs)} import jobs.")
+
+@app.cli.command()
+@click.option('--runs', default=5, help='Fresh interpreters to measure.')
+@click.option('--config-name', default='development', help='Config passed to create_app().')
+def check_startup(runs, config_name):
+    """Fail if startup exceeds STARTUP_TIME_BUDGET or loads a lazy module."""
+    import pytest
+    
+    # tests/test_startup.py does the measuring; these options tune it
+    os.environ['STARTUP_CHECK_RUNS'] = str(runs)
+    os.environ['STARTUP_CHECK_CONFIG'] = config_name
+    test = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'tests', 'test_startup.py')
+    sys.exit(pytest.main(['-q', test]))
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
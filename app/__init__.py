@@ -1,21 +1,55 @@
+import time
+_import_started = time.perf_counter()
+
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_cors import CORS
 from config import config
+from werkzeug.utils import import_string
+from app.routing import RoutingSession, REPLICA_BIND, remember_write
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 migrate = Migrate()
+_import_seconds = time.perf_counter() - _import_started
 
 def create_app(config_name='default'):
+    started = time.perf_counter()
     app = Flask(__name__)
     app.config.from_object(config[config_name])
     
+    # Optional read replica, registered as an extra bind
+    if app.config.get('SQLALCHEMY_REPLICA_URI'):
+        binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+        binds[REPLICA_BIND] = app.config['SQLALCHEMY_REPLICA_URI']
+        app.config['SQLALCHEMY_BINDS'] = binds
+    
     db.init_app(app)
     migrate.init_app(app, db)
     CORS(app)
+    app.after_request(remember_write)
+    
+    from app.cache import init_cache
+    init_cache(app)
+    
+    from app.metrics import init_metrics
+    init_metrics(app)
+    
+    from app.analytics import init_timeseries
+    init_timeseries(app)
+    
+    from app.live import init_live
+    init_live(app)
     
     from app.routes import main
     app.register_blueprint(main)
     
+    # App creation plus, for the first app only, importing this package
+    global _import_seconds
+    startup_seconds = time.perf_counter() - started + _import_seconds
+    _import_seconds = 0.0
+    app.extensions['startup_seconds'] = startup_seconds
+    if app.config.get('STARTUP_HOOK'):
+        import_string(app.config['STARTUP_HOOK'])(app, startup_seconds)
+    
     return app
\ No newline at end of file
@@ -0,0 +1,316 @@
+import threading
+import time
+from datetime import timedelta
+from flask import current_app
+from sqlalchemy import func, case, select, or_, literal, type_coerce
+from app import db
+from app.archive import with_archived
+from app.cache import data_changed, data_version
+from app.models import StockTransaction, Position, LotSale, ArchivedDay
+from app.positions import as_decimal
+
+TIMESERIES_BUCKETS = ('day', 'week', 'month')
+
+def stats_statement():
+    t = StockTransaction
+    has_percentage = (t.profit_loss_percentage != 0) & t.profit_loss_percentage.isnot(None)
+
+    return select(
+        func.count(t.id),
+        func.sum(t.total_cost),
+        func.sum(t.total_selling_cost),
+        func.sum(t.realized_profit_loss),
+        func.sum(case((t.remaining_quantity > 0, 1), else_=0)),
+        func.sum(t.remaining_quantity),
+        # Read unrounded, to add archived totals to before rounding once
+        type_coerce(func.sum(case((has_percentage, t.profit_loss_percentage), else_=0)), ArchivedDay.percentage_total.type),
+        func.sum(case((has_percentage, 1), else_=0)),
+        func.sum(case((t.profit_loss_percentage > 0, 1), else_=0))
+    )
+
+def archived_stats_statement():
+    """What the archived lots add to each stats_statement column."""
+    a = ArchivedDay
+    return select(
+        func.sum(a.transactions),
+        func.sum(a.total_cost),
+        func.sum(a.total_selling_cost),
+        func.sum(a.realized_profit_loss),
+        # Archived lots are closed: nothing left active or held
+        literal(0),
+        literal(0),
+        func.sum(a.percentage_total),
+        func.sum(a.percentage_count),
+        func.sum(a.profitable_transactions)
+    )
+
+def stats_from_row(row, archived=None):
+    if archived is not None:
+        row = [as_decimal(value) + as_decimal(extra) for value, extra in zip(row, archived)]
+    # At the scale of the column it sums
+    percentage_total = round(as_decimal(row[6]), 4)
+    percentage_count = int(row[7] or 0)
+    return {
+        'total_transactions': int(row[0] or 0),
+        'total_investment': float(row[1] or 0.0),
+        'total_returns': float(row[2] or 0.0),
+        'net_profit_loss': float(row[3] or 0.0),
+        'active_stocks': int(row[4] or 0),
+        'total_shares': int(row[5] or 0),
+        'avg_profit_loss_percentage': float(percentage_total) / percentage_count if percentage_count else 0.0,
+        'profitable_transactions': int(row[8] or 0)
+    }
+
+def columnar_replica():
+    """The up-to-date columnar replica, or None when it is switched off."""
+    if not current_app.config['COLUMNAR_REPLICA_ENABLED']:
+        return None
+    # numpy is only loaded once the replica is used
+    from app.columnar import get_replica
+    return get_replica()
+
+def compute_stats():
+    """Dashboard totals and per-transaction averages in one aggregate query."""
+    replica = columnar_replica()
+    row = replica.stats_row() if replica is not None else db.session.execute(stats_statement()).one()
+    return stats_from_row(row, db.session.execute(archived_stats_statement()).one())
+
+def holdings_statement():
+    # From the positions ledger: one row per stock, however many lots
+    return select(
+        Position.stock_name,
+        Position.quantity,
+        Position.open_lots
+    ).where(
+        Position.quantity > 0
+    ).order_by(
+        Position.quantity.desc(),
+        Position.stock_name
+    )
+
+def holdings_from_rows(rows):
+    return [
+        {'stock_name': name, 'remaining_quantity': int(quantity), 'open_lots': lots}
+        for name, quantity, lots in rows
+    ]
+
+def compute_holdings():
+    """Remaining quantity per stock, for stocks still held."""
+    replica = columnar_replica()
+    if replica is not None:
+        return replica.holdings()
+    return holdings_from_rows(db.session.execute(holdings_statement()).all())
+
+def open_positions_statement():
+    """Held shares and their cost per stock, from the positions ledger."""
+    return select(
+        Position.stock_name,
+        Position.quantity,
+        Position.cost_basis
+    ).where(
+        Position.quantity > 0
+    ).order_by(
+        Position.quantity.desc(),
+        Position.stock_name
+    )
+
+def positions_as_of_statement(as_of):
+    """Held shares and their cost per stock at the end of ``as_of``.
+
+    Lots bought later are left out and sales after it undone. Lot sales
+    count from their own dates; shares sold straight on the lot count from
+    its first lot sale, or else its sell date (its buy date without one).
+    Archived lots count too, as they may have been held on ``as_of``.
+    """
+    t = StockTransaction
+    lot_sales = select(
+        LotSale.transaction_id,
+        func.sum(case((LotSale.sell_date <= as_of, LotSale.quantity), else_=0)).label('sold_by'),
+        func.sum(LotSale.quantity).label('sold'),
+        func.min(LotSale.sell_date).label('first_sold_on')
+    ).group_by(LotSale.transaction_id).subquery()
+
+    direct = func.coalesce(t.sell_quantity, 0) - func.coalesce(lot_sales.c.sold, 0)
+    direct_on = func.coalesce(lot_sales.c.first_sold_on, t.sell_date, t.buy_date)
+    sold = func.coalesce(lot_sales.c.sold_by, 0) + case((direct_on <= as_of, direct), else_=0)
+    lots = with_archived(select(
+        t.stock_name,
+        t.buy_price_per_stock,
+        (t.buy_quantity - sold).label('held')
+    ).outerjoin(
+        lot_sales, lot_sales.c.transaction_id == t.id
+    ).where(
+        t.buy_date <= as_of
+    )).subquery()
+
+    open_quantity = case((lots.c.held > 0, lots.c.held), else_=0)
+    positions = select(
+        lots.c.stock_name,
+        func.sum(open_quantity).label('quantity'),
+        func.sum(lots.c.buy_price_per_stock * open_quantity).label('cost_basis')
+    ).group_by(lots.c.stock_name).subquery()
+
+    return select(positions).where(
+        positions.c.quantity > 0
+    ).order_by(
+        positions.c.quantity.desc(),
+        positions.c.stock_name
+    )
+
+def deployed_statement(days=None):
+    """Cost of the lots bought on each day."""
+    t = StockTransaction
+    statement = select(t.buy_date, func.sum(t.total_cost)).group_by(t.buy_date)
+    if days is not None:
+        statement = statement.where(t.buy_date.in_(days))
+    return statement
+
+def sold_statement(days=None):
+    """Realized P&L and buy cost of the shares sold on each day.
+
+    Sales recorded without a sell date count on the day they were bought.
+    """
+    t = StockTransaction
+    sold_on = func.coalesce(t.sell_date, t.buy_date)
+    cost_sold = t.total_cost * 1.0 * t.sell_quantity / t.buy_quantity
+
+    statement = select(
+        sold_on, func.sum(t.realized_profit_loss), func.sum(cost_sold)
+    ).where(t.sell_quantity > 0).group_by(sold_on)
+    if days is not None:
+        statement = statement.where(or_(t.sell_date.in_(days), t.sell_date.is_(None) & t.buy_date.in_(days)))
+    return statement
+
+def archived_days_statement(days=None):
+    """What the archived lots add to each day's totals."""
+    a = ArchivedDay
+    statement = select(a.day, a.total_cost, a.realized_profit_loss, a.cost_sold)
+    if days is not None:
+        statement = statement.where(a.day.in_(days))
+    return statement
+
+def add_archived_days(totals, days=None):
+    """``totals`` with the archived lots' share of each day added."""
+    totals = {day: list(values) for day, values in totals.items()}
+    for day, *values in db.session.execute(archived_days_statement(days)):
+        entry = totals.setdefault(day, [0.0, 0.0, 0.0])
+        for i, value in enumerate(values):
+            entry[i] += float(value or 0.0)
+    return totals
+
+def load_day_totals(days=None):
+    """Day -> [capital deployed, realized P&L, cost of shares sold]."""
+    totals = {day: [0.0, 0.0, 0.0] for day in days or ()}
+    for day, deployed in db.session.execute(deployed_statement(days)):
+        totals.setdefault(day, [0.0, 0.0, 0.0])[0] = float(deployed or 0.0)
+    for day, realized, cost_sold in db.session.execute(sold_statement(days)):
+        entry = totals.setdefault(day, [0.0, 0.0, 0.0])
+        entry[1] = float(realized or 0.0)
+        entry[2] = float(cost_sold or 0.0)
+    return add_archived_days(totals, days)
+
+class DayTotalsCache:
+    """Per-day totals kept between requests and patched after writes.
+
+    A commit made in this process that reports the dates it touched, right
+    after the version the totals were built at, only has those days queried
+    again. Any other change of the data version (such as a write by another
+    worker), or a cache older than ``ttl`` seconds, rebuilds every day.
+    """
+
+    def __init__(self, ttl, max_patch_days):
+        self.ttl = ttl
+        self.max_patch_days = max_patch_days
+        self._days = None
+        self._version = None
+        self._dirty = set()
+        self._built = 0.0
+        self._lock = threading.Lock()
+
+    def changed(self, version, previous, dates):
+        with self._lock:
+            if self._days is None:
+                return
+            if dates is None or previous != self._version:
+                self._days = None
+                return
+            self._dirty |= dates
+            self._version = version
+
+    def totals(self):
+        with self._lock:
+            version = data_version()
+            stale = time.monotonic() - self._built > self.ttl
+            if self._days is None or self._version != version or stale or len(self._dirty) > self.max_patch_days:
+                self._days = load_day_totals()
+                self._built = time.monotonic()
+            elif self._dirty:
+                self._days.update(load_day_totals(sorted(self._dirty)))
+            self._version = version
+            self._dirty = set()
+            return {day: values for day, values in self._days.items() if any(values)}
+
+def _dates_changed(app, version, previous, dates, **extra):
+    app.extensions['day_totals'].changed(version, previous, dates)
+
+def init_timeseries(app):
+    ttl = app.config['TIMESERIES_CACHE_TTL']
+    if not app.extensions['response_cache'].shared_version:
+        # Other workers' writes cannot change this process's version, so
+        # keep totals no longer than the response cache keeps bodies
+        ttl = min(ttl, app.config['RESPONSE_CACHE_TTL'])
+    app.extensions['day_totals'] = DayTotalsCache(ttl, app.config['TIMESERIES_MAX_PATCH_DAYS'])
+    data_changed.connect(_dates_changed, app)
+
+def bucket_start(day, bucket):
+    if bucket == 'week':
+        return day - timedelta(days=day.weekday())
+    if bucket == 'month':
+        return day.replace(day=1)
+    return day
+
+def next_bucket(start, bucket):
+    if bucket == 'week':
+        return start + timedelta(days=7)
+    if bucket == 'month':
+        return (start + timedelta(days=32)).replace(day=1)
+    return start + timedelta(days=1)
+
+def compute_timeseries(bucket):
+    """Realized P&L, capital deployed and open-position cost per bucket.
+
+    Buckets run without gaps from the first to the last active one; the
+    running totals are as of each bucket's end.
+    """
+    replica = columnar_replica()
+    if replica is not None:
+        days = add_archived_days(replica.day_totals())
+    else:
+        days = current_app.extensions['day_totals'].totals()
+    buckets = {}
+    for day, values in days.items():
+        entry = buckets.setdefault(bucket_start(day, bucket), [0.0, 0.0, 0.0])
+        for i, value in enumerate(values):
+            entry[i] += value
+
+    series = []
+    if not buckets:
+        return series
+
+    deployed_total = realized_total = sold_total = 0.0
+    start, last = min(buckets), max(buckets)
+    while start <= last:
+        deployed, realized, cost_sold = buckets.get(start, (0.0, 0.0, 0.0))
+        deployed_total += deployed
+        realized_total += realized
+        sold_total += cost_sold
+        series.append({
+            'period': start.isoformat(),
+            'realized_profit_loss': round(realized, 4),
+            'capital_deployed': round(deployed, 4),
+            'open_position_cost': round(deployed_total - sold_total, 4),
+            'cumulative_realized_profit_loss': round(realized_total, 4),
+            'cumulative_capital_deployed': round(deployed_total, 4)
+        })
+        start = next_bucket(start, bucket)
+    return series
@@ -0,0 +1,134 @@
+from decimal import Decimal
+from sqlalchemy import event, select, func, case, union_all, exists, type_coerce
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.util import ClauseAdapter
+from app import db
+from app.cache import mark_data_changed
+from app.models import StockTransaction, LotSale, ArchivedDay, archived_transactions
+
+# ArchivedDay columns added up from the lots bought on a day, and from the
+# lots sold on it
+BOUGHT_COLUMNS = (
+    'transactions', 'total_cost', 'total_selling_cost',
+    'percentage_total', 'percentage_count', 'profitable_transactions'
+)
+SOLD_COLUMNS = ('realized_profit_loss', 'cost_sold')
+DECIMAL_COLUMNS = ('total_cost', 'total_selling_cost', 'percentage_total', 'realized_profit_loss', 'cost_sold')
+
+def include_archived(args):
+    return args.get('include_archived') == 'true'
+
+def with_archived(statement):
+    """``statement`` reading the live and the archived transactions as one table.
+
+    Every reference to stock_transactions is pointed at a UNION ALL of both
+    tables, so filters, ordering and column lists work unchanged.
+    """
+    live = StockTransaction.__table__
+    transactions = union_all(select(live), select(archived_transactions)).subquery('all_transactions')
+    return ClauseAdapter(transactions).traverse(statement)
+
+@event.listens_for(Session, 'do_orm_execute')
+def _read_archived(state):
+    # Queries run with execution_options(include_archived=True) see both tables
+    if state.is_select and state.execution_options.get('include_archived'):
+        state.statement = with_archived(state.statement)
+
+def archivable_statement(closed_before, limit):
+    """Ids of fully sold lots closed before ``closed_before``, oldest id first.
+
+    Lots with LotSale rows stay live: the sales reference them, and would
+    go with them.
+    """
+    t = StockTransaction
+    return select(t.id).where(
+        t.remaining_quantity == 0,
+        func.coalesce(t.sell_date, t.buy_date) < closed_before,
+        ~exists().where(LotSale.transaction_id == t.id)
+    ).order_by(t.id).limit(limit)
+
+def day_contributions(ids):
+    """ArchivedDay values (day -> column -> value) that lots ``ids`` add.
+
+    Same rules as analytics.stats_statement for the bought side and
+    analytics.sold_statement for the sold side.
+    """
+    t = StockTransaction
+    has_percentage = (t.profit_loss_percentage != 0) & t.profit_loss_percentage.isnot(None)
+    bought = select(
+        t.buy_date,
+        func.count(t.id),
+        func.sum(t.total_cost),
+        func.sum(t.total_selling_cost),
+        func.sum(case((has_percentage, t.profit_loss_percentage), else_=0)),
+        func.sum(case((has_percentage, 1), else_=0)),
+        func.sum(case((t.profit_loss_percentage > 0, 1), else_=0))
+    ).where(t.id.in_(ids)).group_by(t.buy_date)
+
+    sold_on = func.coalesce(t.sell_date, t.buy_date)
+    sold = select(
+        sold_on,
+        func.sum(t.realized_profit_loss),
+        func.sum(t.total_cost * 1.0 * t.sell_quantity / t.buy_quantity)
+    ).where(t.id.in_(ids), t.sell_quantity > 0).group_by(sold_on)
+
+    days = {}
+    for columns, statement in ((BOUGHT_COLUMNS, bought), (SOLD_COLUMNS, sold)):
+        # Read back at the stored scale, not rounded to the summed column's
+        statement = statement.with_only_columns(statement.selected_columns[0], *(
+            type_coerce(total, ArchivedDay.__table__.c[name].type)
+            for name, total in zip(columns, list(statement.selected_columns)[1:])
+        ))
+        for day, *values in db.session.execute(statement):
+            entry = days.setdefault(day, {})
+            entry.update((name, Decimal(str(value or 0)) if name in DECIMAL_COLUMNS else int(value or 0))
+                         for name, value in zip(columns, values))
+    return days
+
+def add_to_archived_days(days):
+    existing = {row.day: row for row in ArchivedDay.query.filter(ArchivedDay.day.in_(list(days)))}
+    for day, values in days.items():
+        row = existing.get(day)
+        if row is None:
+            row = ArchivedDay(day=day, **{name: 0 for name in BOUGHT_COLUMNS + SOLD_COLUMNS})
+            db.session.add(row)
+        for name, value in values.items():
+            setattr(row, name, (getattr(row, name) or 0) + value)
+
+def archive_batch(closed_before, batch_size):
+    """Move one batch of closed lots to the archive; returns how many moved.
+
+    The copy, the day totals and the delete commit together, so the
+    dashboard never counts a lot twice or not at all. The positions
+    ledger is left as it is: a closed lot only adds realized P&L, which
+    stays in the ledger.
+    """
+    live = StockTransaction.__table__
+    ids = db.session.execute(archivable_statement(closed_before, batch_size).with_for_update()).scalars().all()
+    if not ids:
+        return 0
+
+    days = day_contributions(ids)
+    db.session.execute(archived_transactions.insert().from_select(
+        [c.name for c in live.columns], select(live).where(live.c.id.in_(ids))
+    ))
+    add_to_archived_days(days)
+    db.session.execute(live.delete().where(live.c.id.in_(ids)))
+    mark_data_changed(db.session, days, ids)
+    db.session.commit()
+    return len(ids)
+
+def archive_closed_lots(closed_before, batch_size=1000, progress=None):
+    """Archive every fully sold lot closed before ``closed_before``, in batches."""
+    moved = 0
+    try:
+        while True:
+            count = archive_batch(closed_before, batch_size)
+            if not count:
+                return moved
+            moved += count
+            if progress is not None:
+                progress(moved)
+    except Exception:
+        db.session.rollback()
+        raise
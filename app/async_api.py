@@ -0,0 +1,502 @@
+import asyncio
+import math
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from email.utils import formatdate
+from functools import wraps
+from a2wsgi import WSGIMiddleware
+from sqlalchemy import select, func, desc, asc
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route, Mount
+from werkzeug.exceptions import NotFound
+from app.models import StockTransaction
+from app.archive import include_archived, with_archived
+from app.cache import data_version, cache_key, etag_matches
+from app.analytics import stats_statement, archived_stats_statement, stats_from_row, holdings_statement, holdings_from_rows, open_positions_statement, compute_stats, compute_holdings
+from app.exports import (
+    EXPORT_HEADERS, ARROW_MIMETYPE, PARQUET_MIMETYPE, export_row, export_statement, export_condition,
+    export_schema, columnar_statement, record_batch, arrow_writer, parquet_writer, ChunkSink, csv_text,
+    gzip_compressor
+)
+from app.live import parse_seq, aiter_sse, async_long_poll
+from app.metrics import start_asgi_request, debug_headers, record_request
+from app.pagination import SORTABLE_COLUMNS, keyset_query, page_cursor, decode_cursor, lookup_count, store_count
+from app.routing import recently_wrote
+from app.search import search_condition
+from app.serializers import parse_fields, transaction_columns, serialize_rows, dumps
+
+# Sync driver -> asyncio driver for the same database
+ASYNC_DRIVERS = {
+    'mysql': 'mysql+aiomysql',
+    'mysql+pymysql': 'mysql+aiomysql',
+    'sqlite': 'sqlite+aiosqlite',
+    'sqlite+pysqlite': 'sqlite+aiosqlite'
+}
+
+def async_url(uri):
+    url = make_url(uri)
+    driver = ASYNC_DRIVERS.get(url.drivername)
+    return url.set(drivername=driver) if driver else url
+
+def create_engines(flask_app):
+    config = flask_app.config
+    options = config.get('SQLALCHEMY_ENGINE_OPTIONS', {})
+
+    primary = create_async_engine(
+        async_url(config['ASYNC_DATABASE_URI'] or config['SQLALCHEMY_DATABASE_URI']), **options
+    )
+    replica_uri = config['ASYNC_REPLICA_URI'] or config['SQLALCHEMY_REPLICA_URI']
+    replica = create_async_engine(async_url(replica_uri), **options) if replica_uri else None
+    return primary, replica
+
+def read_engine(request):
+    # Same routing as replica_read: the replica unless this client just wrote
+    state = request.app.state
+    if state.replica is not None and not recently_wrote(request.cookies):
+        return state.replica
+    return state.primary
+
+def replica_may_lag(request, last_write):
+    # As routing.replica_may_lag, for a read through read_engine()
+    state = request.app.state
+    window = state.flask_app.config['REPLICA_STICKY_SECONDS']
+    return read_engine(request) is state.replica and time.time() - last_write < window
+
+async def in_app_context(flask_app, func, *args):
+    """Run a sync helper that needs the Flask app context, off the event loop."""
+    def call():
+        with flask_app.app_context():
+            return func(*args)
+    return await asyncio.to_thread(call)
+
+def json_body(request, payload, status=200):
+    # Byte-for-byte what the Flask views return for the same payload
+    flask_app = request.app.state.flask_app
+    return Response(dumps(payload, flask_app), status_code=status, media_type=flask_app.json.mimetype)
+
+def measured(route):
+    """Record a handler in the metrics, as the request signals do for Flask views.
+
+    ``route`` is the Flask view's rule, so both serving modes add to the
+    same series.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            flask_app = request.app.state.flask_app
+            stats = start_asgi_request(flask_app)
+            response = await handler(request)
+            if stats is None:
+                return response
+
+            labels = (route, request.method, str(response.status_code))
+            if isinstance(response, StreamingResponse):
+                # Record once the whole body has been sent
+                response.background = BackgroundTask(record_request, flask_app, labels, stats)
+            else:
+                response.headers.update(debug_headers(flask_app, stats))
+                record_request(flask_app, labels, stats)
+            return response
+        return wrapper
+    return decorator
+
+def cached(endpoint, per_day=False):
+    """Async counterpart of cache.cached_response, sharing its entries.
+
+    ``endpoint`` is the Flask view's, so a request gets the same body and
+    ETag whichever app serves it.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        async def wrapper(request):
+            flask_app = request.app.state.flask_app
+            if not flask_app.config['RESPONSE_CACHE_ENABLED']:
+                return await handler(request)
+
+            backend = flask_app.extensions['response_cache']
+            if backend.shared_version:
+                # Read from the database, off the event loop
+                version, modified = await in_app_context(flask_app, backend.state)
+            else:
+                version, modified = backend.state()
+            key = cache_key(
+                endpoint, request.path_params, request.query_params.multi_items(),
+                request.headers.get('Accept-Encoding', ''), per_day
+            )
+            etag = f'{version}-{key[:16]}'
+
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                response = Response(status_code=304)
+            else:
+                stored = backend.get(f'{version}:{key}')
+                if stored is not None:
+                    body, status, headers = stored
+                    response = Response(body, status_code=status, headers=dict(headers))
+                else:
+                    response = await handler(request)
+                    if response.status_code != 200:
+                        return response
+                    storable = not isinstance(response, StreamingResponse)
+                    if storable and not replica_may_lag(request, modified):
+                        headers = [(name, value) for name, value in response.headers.items() if name != 'set-cookie']
+                        backend.set(f'{version}:{key}', (response.body, 200, headers))
+
+            response.headers['ETag'] = f'"{etag}"'
+            response.headers['Last-Modified'] = formatdate(modified, usegmt=True)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+def arg_int(args, name, default):
+    try:
+        return int(args.get(name, default))
+    except (TypeError, ValueError):
+        return default
+
+def count_statement(statement):
+    return select(func.count()).select_from(statement.order_by(None).subquery())
+
+async def cached_count(request, conn, statement, key):
+    """Async counterpart of pagination.cached_count, sharing its cache."""
+    flask_app = request.app.state.flask_app
+    # A shared backend reads the version from the database
+    key = (await in_app_context(flask_app, data_version), key)
+    total = lookup_count(key, flask_app.config['COUNT_CACHE_TTL'])
+    if total is None:
+        total = (await conn.execute(count_statement(statement))).scalar()
+        store_count(key, total)
+    return total
+
+async def filtered(request, statement, search, archived=False):
+    if not search:
+        return statement
+    condition = await in_app_context(request.app.state.flask_app, search_condition, search, archived)
+    return statement if condition is None else statement.where(condition)
+
+@measured('/api/transactions')
+@cached('main.get_transactions')
+async def get_transactions(request):
+    if 'draw' in request.query_params:
+        return await get_transactions_datatables(request)
+
+    args = request.query_params
+    try:
+        page = arg_int(args, 'page', 1)
+        per_page = arg_int(args, 'per_page', 10)
+        search = args.get('search', '')
+        sort_by = args.get('sort_by', 'created_at')
+        sort_order = args.get('sort_order', 'desc')
+        fields = parse_fields(args.get('fields'))
+        archived = include_archived(args)
+
+        statement = await filtered(request, select(*transaction_columns(fields)), search, archived)
+
+        if hasattr(StockTransaction, sort_by):
+            if sort_order == 'desc':
+                statement = statement.order_by(desc(getattr(StockTransaction, sort_by)))
+            else:
+                statement = statement.order_by(asc(getattr(StockTransaction, sort_by)))
+        if archived:
+            statement = with_archived(statement)
+
+        async with read_engine(request).connect() as conn:
+            if per_page == -1:
+                transactions = (await conn.execute(statement)).all()
+                total = len(transactions)
+                pages = 1
+            else:
+                # Same clamping as Flask-SQLAlchemy's paginate(error_out=False)
+                number = max(page, 1)
+                size = per_page if per_page >= 1 else 20
+                page_statement = statement.limit(size).offset((number - 1) * size)
+                transactions = (await conn.execute(page_statement)).all()
+                total = (await conn.execute(count_statement(statement))).scalar()
+                pages = math.ceil(total / size) if total else 0
+
+        return json_body(request, {
+            'transactions': serialize_rows(transactions, fields),
+            'total': total,
+            'pages': pages,
+            'current_page': page
+        })
+    except ValueError as e:
+        return json_body(request, {'error': str(e)}, 400)
+    except Exception as e:
+        return json_body(request, {'error': str(e)}, 500)
+
+async def get_transactions_datatables(request):
+    args = request.query_params
+    draw = arg_int(args, 'draw', 0)
+    try:
+        start = max(arg_int(args, 'start', 0), 0)
+        length = arg_int(args, 'length', 25)
+        search = args.get('search[value]', '').strip()
+
+        order_index = arg_int(args, 'order[0][column]', None)
+        sort_by = args.get(f'columns[{order_index}][data]', 'created_at')
+        sort_order = 'asc' if args.get('order[0][dir]') == 'asc' else 'desc'
+        if sort_by not in SORTABLE_COLUMNS:
+            sort_by, sort_order = 'created_at', 'desc'
+
+        if length < 1:
+            length = 25
+
+        fields = parse_fields(args.get('fields'))
+        archived = include_archived(args)
+        statement = select(*transaction_columns(fields, extra=(sort_by, 'id')))
+
+        try:
+            cursor = decode_cursor(args.get('cursor'), sort_by)
+        except (ValueError, TypeError):
+            cursor = None
+
+        async with read_engine(request).connect() as conn:
+            every_row = select(StockTransaction.id)
+            records_total = await cached_count(
+                request, conn, with_archived(every_row) if archived else every_row, ('', archived)
+            )
+
+            if search:
+                statement = await filtered(request, statement, search, archived)
+                searched = with_archived(statement) if archived else statement
+                records_filtered = await cached_count(request, conn, searched, (search, archived))
+            else:
+                records_filtered = records_total
+
+            page_statement, reverse = keyset_query(
+                statement, sort_by, sort_order, length,
+                cursor=cursor, start=start, total=records_filtered
+            )
+            if archived:
+                # After keyset_query, so its seek and ordering read both tables too
+                page_statement = with_archived(page_statement)
+            transactions = (await conn.execute(page_statement)).all()
+            if reverse:
+                transactions.reverse()
+
+        return json_body(request, {
+            'draw': draw,
+            'recordsTotal': records_total,
+            'recordsFiltered': records_filtered,
+            'data': serialize_rows(transactions, fields),
+            'next_cursor': page_cursor(transactions, sort_by)
+        })
+    except ValueError as e:
+        return json_body(request, {'draw': draw, 'error': str(e)}, 400)
+    except Exception as e:
+        return json_body(request, {'draw': draw, 'error': str(e)}, 500)
+
+@measured('/api/transactions/<int:transaction_id>')
+@cached('main.get_transaction')
+async def get_transaction(request):
+    try:
+        fields = parse_fields(request.query_params.get('fields'))
+        statement = select(*transaction_columns(fields)).where(
+            StockTransaction.id == request.path_params['transaction_id']
+        )
+        if include_archived(request.query_params):
+            statement = with_archived(statement)
+        async with read_engine(request).connect() as conn:
+            row = (await conn.execute(statement)).first()
+        if row is None:
+            return json_body(request, {'error': str(NotFound())}, 404)
+        return json_body(request, serialize_rows([row], fields)[0])
+    except ValueError as e:
+        return json_body(request, {'error': str(e)}, 400)
+    except Exception as e:
+        return json_body(request, {'error': str(e)}, 500)
+
+@measured('/api/dashboard/stats')
+@cached('main.dashboard_stats')
+async def dashboard_stats(request):
+    try:
+        flask_app = request.app.state.flask_app
+        if flask_app.config['COLUMNAR_REPLICA_ENABLED']:
+            stats = await in_app_context(flask_app, compute_stats)
+        else:
+            async with read_engine(request).connect() as conn:
+                stats = stats_from_row(
+                    (await conn.execute(stats_statement())).one(),
+                    (await conn.execute(archived_stats_statement())).one()
+                )
+
+        return json_body(request, {
+            'total_transactions': stats['total_transactions'],
+            'total_investment': stats['total_investment'],
+            'total_returns': stats['total_returns'],
+            'net_profit_loss': stats['net_profit_loss'],
+            'active_stocks': stats['active_stocks']
+        })
+    except Exception as e:
+        return json_body(request, {'error': str(e)}, 500)
+
+def valuation_totals(positions):
+    # numpy is loaded on first use, as in the Flask views
+    from app.prices import get_store, value_positions
+    return value_positions(positions, get_store())['totals']
+
+@measured('/api/dashboard/summary')
+@cached('main.dashboard_summary')
+async def dashboard_summary(request):
+    try:
+        flask_app = request.app.state.flask_app
+        columnar = flask_app.config['COLUMNAR_REPLICA_ENABLED']
+        async with read_engine(request).connect() as conn:
+            if not columnar:
+                stats = stats_from_row(
+                    (await conn.execute(stats_statement())).one(),
+                    (await conn.execute(archived_stats_statement())).one()
+                )
+                holdings = holdings_from_rows((await conn.execute(holdings_statement())).all())
+            positions = (await conn.execute(open_positions_statement())).all()
+        if columnar:
+            # From the replica's arrays, off the event loop
+            stats = await in_app_context(flask_app, compute_stats)
+            holdings = await in_app_context(flask_app, compute_holdings)
+        valuation = await in_app_context(flask_app, valuation_totals, positions)
+
+        return json_body(request, {'stats': stats, 'holdings': holdings, 'valuation': valuation})
+    except Exception as e:
+        return json_body(request, {'error': str(e)}, 500)
+
+@measured('/api/stream/dashboard')
+async def stream_dashboard(request):
+    # Same events as the Flask view; waiting viewers hold no thread
+    flask_app = request.app.state.flask_app
+    seq = parse_seq(request.headers.get('Last-Event-ID') or request.query_params.get('since'))
+    events = aiter_sse(flask_app.extensions['dashboard_feed'], seq, flask_app.config['LIVE_HEARTBEAT_SECONDS'])
+    return StreamingResponse(
+        events, media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@measured('/api/stream/dashboard/poll')
+async def poll_dashboard(request):
+    try:
+        flask_app = request.app.state.flask_app
+        seq = parse_seq(request.query_params.get('since'))
+        payload = await async_long_poll(flask_app.extensions['dashboard_feed'], seq, flask_app.config['LIVE_POLL_TIMEOUT'])
+        return json_body(request, payload)
+    except Exception as e:
+        return json_body(request, {'error': str(e)}, 500)
+
+async def iter_csv(engine, batch_size, include_archived=False):
+    today = datetime.now().date()
+    yield csv_text([EXPORT_HEADERS])
+    async with engine.connect() as conn:
+        result = await conn.stream(export_statement(include_archived).execution_options(yield_per=batch_size))
+        async for partition in result.partitions(batch_size):
+            yield csv_text([export_row(t, today) for t in partition])
+
+async def gzip_chunks(chunks):
+    compressor = gzip_compressor()
+    async for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+@measured('/api/export/csv')
+@cached('main.export_csv', per_day=True)
+async def export_csv(request):
+    try:
+        config = request.app.state.flask_app.config
+        chunks = iter_csv(read_engine(request), config['EXPORT_BATCH_SIZE'], include_archived(request.query_params))
+
+        accepts_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+        use_gzip = config['EXPORT_GZIP'] and accepts_gzip
+        if use_gzip:
+            chunks = gzip_chunks(chunks)
+
+        headers = {
+            'Content-Disposition': 'attachment; filename=stock_transactions.csv',
+            'Vary': 'Accept-Encoding'
+        }
+        if use_gzip:
+            headers['Content-Encoding'] = 'gzip'
+
+        return StreamingResponse(chunks, media_type='text/csv', headers=headers)
+    except Exception as e:
+        return json_body(request, {'error': str(e)}, 500)
+
+async def aiter_columnar(new_writer, engine, condition, batch_size, include_archived=False):
+    # As exports.iter_arrow and iter_parquet, reading on the asyncio engine
+    schema = export_schema()
+    today = datetime.now().date()
+    statement = columnar_statement(condition, include_archived).execution_options(yield_per=batch_size)
+    sink = ChunkSink()
+    with new_writer(sink, schema) as writer:
+        async with engine.connect() as conn:
+            result = await conn.stream(statement)
+            async for partition in result.partitions(batch_size):
+                writer.write_batch(record_batch(partition, schema, today))
+                yield sink.take()
+    yield sink.take()
+
+def columnar_export(request, new_writer, mimetype, filename):
+    try:
+        condition = export_condition(request.query_params)
+    except ValueError as e:
+        return json_body(request, {'error': str(e)}, 400)
+
+    chunks = aiter_columnar(
+        new_writer, read_engine(request), condition,
+        request.app.state.flask_app.config['EXPORT_COLUMNAR_BATCH_SIZE'], include_archived(request.query_params)
+    )
+    return StreamingResponse(chunks, media_type=mimetype, headers={'Content-Disposition': f'attachment; filename={filename}'})
+
+@measured('/api/export/arrow')
+@cached('main.export_arrow', per_day=True)
+async def export_arrow(request):
+    try:
+        return columnar_export(request, arrow_writer, ARROW_MIMETYPE, 'stock_transactions.arrows')
+    except Exception as e:
+        return json_body(request, {'error': str(e)}, 500)
+
+@measured('/api/export/parquet')
+@cached('main.export_parquet', per_day=True)
+async def export_parquet(request):
+    try:
+        return columnar_export(request, parquet_writer, PARQUET_MIMETYPE, 'stock_transactions.parquet')
+    except Exception as e:
+        return json_body(request, {'error': str(e)}, 500)
+
+def create_asgi_app(flask_app):
+    """ASGI app serving the read-only endpoints on the asyncio engine.
+
+    They share the Flask views' response cache, ETags and metrics. Every
+    other route, including the Excel export and all writes, falls through
+    to ``flask_app``, which runs in a thread pool.
+    """
+    primary, replica = create_engines(flask_app)
+
+    @asynccontextmanager
+    async def lifespan(asgi_app):
+        yield
+        await primary.dispose()
+        if replica is not None:
+            await replica.dispose()
+
+    routes = [
+        Route('/api/transactions', get_transactions, methods=['GET']),
+        Route('/api/transactions/{transaction_id:int}', get_transaction, methods=['GET']),
+        Route('/api/dashboard/stats', dashboard_stats, methods=['GET']),
+        Route('/api/dashboard/summary', dashboard_summary, methods=['GET']),
+        Route('/api/stream/dashboard', stream_dashboard, methods=['GET']),
+        Route('/api/stream/dashboard/poll', poll_dashboard, methods=['GET']),
+        Route('/api/export/csv', export_csv, methods=['GET']),
+        Route('/api/export/arrow', export_arrow, methods=['GET']),
+        Route('/api/export/parquet', export_parquet, methods=['GET']),
+        Mount('/', app=WSGIMiddleware(flask_app, workers=flask_app.config['ASYNC_WSGI_WORKERS']))
+    ]
+
+    asgi_app = Starlette(routes=routes, lifespan=lifespan)
+    asgi_app.state.flask_app = flask_app
+    asgi_app.state.primary = primary
+    asgi_app.state.replica = replica
+    return asgi_app
@@ -0,0 +1,332 @@
+from datetime import datetime
+from sqlalchemy import and_, bindparam, literal, select
+from app import db
+from app.cache import mark_data_changed
+from app.models import StockTransaction, GENERATED, derived_expressions, derived_columns_generated, normalize_symbol
+from app.positions import LEDGER_INPUTS, add_contribution, add_to_positions, refresh_positions
+
+REQUIRED_FIELDS = ('stock_name', 'buy_quantity', 'buy_price_per_stock', 'buy_date')
+
+def parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def optional_date(value):
+    return parse_date(value) if value else None
+
+# Columns a bulk update may set, with the same parsing as the single-row routes
+UPDATABLE_FIELDS = {
+    'stock_name': str,
+    'buy_quantity': int,
+    'buy_price_per_stock': float,
+    'buy_date': parse_date,
+    'sell_quantity': lambda value: int(value or 0),
+    'sell_price_per_stock': lambda value: float(value or 0.0),
+    'sell_date': optional_date
+}
+
+def parse_new_transaction(data):
+    """Column values for a new transaction, checked as POST /api/transactions does."""
+    if not isinstance(data, dict):
+        raise ValueError('Each transaction must be an object')
+    for field in REQUIRED_FIELDS:
+        if field not in data or data[field] is None:
+            raise ValueError(f'Missing required field: {field}')
+    
+    try:
+        buy_date = parse_date(data['buy_date'])
+    except (TypeError, ValueError):
+        raise ValueError('Invalid buy_date format. Use YYYY-MM-DD')
+    try:
+        sell_date = optional_date(data.get('sell_date'))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid sell_date format. Use YYYY-MM-DD')
+    
+    try:
+        return {
+            'stock_name': data['stock_name'],
+            'buy_quantity': int(data['buy_quantity']),
+            'buy_price_per_stock': float(data['buy_price_per_stock']),
+            'buy_date': buy_date,
+            'sell_quantity': int(data.get('sell_quantity', 0)),
+            'sell_price_per_stock': float(data.get('sell_price_per_stock', 0.0)),
+            'sell_date': sell_date
+        }
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid number: {e}')
+
+def parse_changes(data):
+    if not isinstance(data, dict) or not data:
+        raise ValueError('Give the columns to change in "set"')
+    
+    changes = {}
+    for name, value in data.items():
+        parser = UPDATABLE_FIELDS.get(name)
+        if parser is None:
+            raise ValueError(f'Unknown or read-only column: {name}')
+        try:
+            changes[name] = parser(value)
+        except (TypeError, ValueError):
+            raise ValueError(f'Invalid value for {name}: {value!r}')
+    return changes
+
+def bulk_condition(data):
+    """Which rows to update: any of ids, stock_name and a buy date range."""
+    conditions = []
+    try:
+        if data.get('ids') is not None:
+            conditions.append(StockTransaction.id.in_([int(i) for i in data['ids']]))
+        if data.get('stock_name'):
+            conditions.append(StockTransaction.search_name == normalize_symbol(data['stock_name']))
+        if data.get('buy_date_from'):
+            conditions.append(StockTransaction.buy_date >= parse_date(data['buy_date_from']))
+        if data.get('buy_date_to'):
+            conditions.append(StockTransaction.buy_date <= parse_date(data['buy_date_to']))
+    except (TypeError, ValueError):
+        raise ValueError('Invalid selection; use a list of ids and dates as YYYY-MM-DD')
+    
+    if not conditions:
+        raise ValueError('Select the rows to update with ids, stock_name or buy_date_from/buy_date_to')
+    return and_(*conditions)
+
+def derived_values(changes=None):
+    """Derived column values for an UPDATE, in SQL.
+
+    Changed inputs are bound as parameters rather than read back from their
+    columns, so the result is the same whatever order the database applies
+    the SET clauses in.
+    """
+    changes = changes or {}
+    table = StockTransaction.__table__
+    
+    def value(name):
+        if name in changes:
+            return literal(changes[name], table.c[name].type)
+        return table.c[name]
+    
+    return {getattr(StockTransaction, name): expression for name, expression in derived_expressions(value).items()}
+
+def bulk_update(condition, changes):
+    """Apply ``changes`` to every matching row in one UPDATE; return the count.
+
+    Nothing is loaded into the session, so the derived columns are either
+    generated by the database or set in the same statement.
+    """
+    values = {getattr(StockTransaction, name): value for name, value in changes.items()}
+    if 'stock_name' in changes:
+        values[StockTransaction.search_name] = normalize_symbol(changes['stock_name'])
+    if not derived_columns_generated():
+        values.update(derived_values(changes))
+    
+    # The stocks whose positions move; they are recomputed after the UPDATE
+    stocks = set()
+    if changes.keys() & LEDGER_INPUTS:
+        stocks = set(db.session.execute(
+            select(StockTransaction.stock_name).where(condition).distinct()
+        ).scalars())
+        if 'stock_name' in changes:
+            stocks.add(changes['stock_name'])
+    
+    updated = StockTransaction.query.filter(condition).update(values, synchronize_session=False)
+    refresh_positions(db.session.connection(), stocks)
+    return updated
+
+def recalculate_derived():
+    """Recompute the derived columns of every row in one UPDATE."""
+    return StockTransaction.query.update(derived_values(), synchronize_session=False)
+
+def item_list(data, name):
+    items = data.get(name) or []
+    if not isinstance(items, list):
+        raise ValueError(f'"{name}" must be a list')
+    return items
+
+class Batch:
+    """Creates, partial updates and deletes checked up front, then applied together.
+
+    Items that fail validation get an error in their result; ``apply`` writes
+    the rest with one executemany per statement shape, updates the positions
+    ledger once, and leaves the commit to the caller.
+    """
+    
+    def __init__(self, data, max_items):
+        if not isinstance(data, dict):
+            raise ValueError('Send an object with "create", "update" and "delete" lists')
+        creates = item_list(data, 'create')
+        updates = item_list(data, 'update')
+        deletes = item_list(data, 'delete')
+        if len(creates) + len(updates) + len(deletes) > max_items:
+            raise ValueError(f'A batch may hold at most {max_items} items')
+        
+        self.results = {'created': [], 'updated': [], 'deleted': []}
+        self.creates = []
+        self.updates = []
+        self.deletes = []
+        
+        for index, item in enumerate(creates):
+            try:
+                self.creates.append((index, parse_new_transaction(item)))
+            except ValueError as e:
+                self._fail('created', index, None, e)
+        
+        delete_ids = {}
+        for index, item in enumerate(deletes):
+            try:
+                transaction_id = int(item)
+            except (TypeError, ValueError):
+                self._fail('deleted', index, None, 'Ids to delete must be integers')
+                continue
+            if transaction_id in delete_ids:
+                self._fail('deleted', index, transaction_id, f'Transaction {transaction_id} is deleted more than once')
+            else:
+                delete_ids[transaction_id] = index
+        
+        update_ids = set()
+        for index, item in enumerate(updates):
+            try:
+                if not isinstance(item, dict) or 'id' not in item:
+                    raise ValueError('Each update needs the "id" of the transaction')
+                transaction_id = int(item['id'])
+                if transaction_id in update_ids:
+                    raise ValueError(f'Transaction {transaction_id} is updated more than once')
+                if transaction_id in delete_ids:
+                    raise ValueError(f'Transaction {transaction_id} is also being deleted')
+                fields = {name: value for name, value in item.items() if name != 'id'}
+                if not fields:
+                    raise ValueError('No fields to update')
+                self.updates.append((index, transaction_id, parse_changes(fields)))
+                update_ids.add(transaction_id)
+            except (TypeError, ValueError) as e:
+                self._fail('updated', index, item.get('id') if isinstance(item, dict) else None, e)
+        
+        # The stored rows, for existence checks and the ledger's old values
+        self.stored = self._load(update_ids | set(delete_ids))
+        for index, transaction_id, changes in list(self.updates):
+            if transaction_id not in self.stored:
+                self.updates.remove((index, transaction_id, changes))
+                self._fail('updated', index, transaction_id, f'Transaction {transaction_id} not found')
+        for transaction_id, index in delete_ids.items():
+            if transaction_id in self.stored:
+                self.deletes.append((index, transaction_id))
+            else:
+                self._fail('deleted', index, transaction_id, f'Transaction {transaction_id} not found')
+    
+    @property
+    def failed(self):
+        return sum(1 for results in self.results.values() for result in results if 'error' in result)
+    
+    @property
+    def pending(self):
+        """Whether any item passed validation, so ``apply`` has something to write."""
+        return bool(self.creates or self.updates or self.deletes)
+    
+    def _fail(self, kind, index, transaction_id, error):
+        self.results[kind].append({'index': index, 'id': transaction_id, 'error': str(error)})
+    
+    def _load(self, ids):
+        if not ids:
+            return {}
+        table = StockTransaction.__table__
+        columns = [table.c.id] + [table.c[name] for name in LEDGER_INPUTS] + [table.c.buy_date, table.c.sell_date]
+        rows = db.session.execute(select(*columns).where(table.c.id.in_(sorted(ids))))
+        return {row.id: row._mapping for row in rows}
+    
+    def apply(self):
+        """Write every valid item; return the per-item results.
+
+        With no valid items nothing is written, so neither the positions nor
+        the data version move.
+        """
+        if not self.pending:
+            return self._sorted_results()
+        
+        deltas = {}
+        dates = set()
+        
+        for index, transaction_id, changes in self.updates:
+            stored = self.stored[transaction_id]
+            add_contribution(deltas, [stored[name] for name in LEDGER_INPUTS], -1)
+            add_contribution(deltas, [changes.get(name, stored[name]) for name in LEDGER_INPUTS])
+            dates.update((stored['buy_date'], stored['sell_date'], changes.get('buy_date'), changes.get('sell_date')))
+        for index, transaction_id in self.deletes:
+            stored = self.stored[transaction_id]
+            add_contribution(deltas, [stored[name] for name in LEDGER_INPUTS], -1)
+            dates.update((stored['buy_date'], stored['sell_date']))
+        for index, values in self.creates:
+            add_contribution(deltas, [values[name] for name in LEDGER_INPUTS])
+            dates.update((values['buy_date'], values['sell_date']))
+        
+        created = self._insert([values for _, values in self.creates])
+        self._update()
+        self._delete()
+        add_to_positions(db.session.connection(), deltas)
+        dates.discard(None)
+        mark_data_changed(db.session, dates, [transaction_id for _, transaction_id in self.deletes])
+        
+        self.results['created'] += [{'index': index, 'id': new_id} for (index, _), new_id in zip(self.creates, created)]
+        self.results['updated'] += [{'index': index, 'id': transaction_id} for index, transaction_id, _ in self.updates]
+        self.results['deleted'] += [{'index': index, 'id': transaction_id} for index, transaction_id in self.deletes]
+        return self._sorted_results()
+    
+    def _sorted_results(self):
+        for results in self.results.values():
+            results.sort(key=lambda result: result['index'])
+        return self.results
+    
+    def _insert(self, rows):
+        if not rows:
+            return []
+        table = StockTransaction.__table__
+        generated = derived_columns_generated()
+        columns = list(rows[0]) + ['search_name']
+        if not generated:
+            columns += list(GENERATED)
+        
+        # calculate_totals fills in the same values the single-row route stores
+        records = []
+        for values in rows:
+            transaction = StockTransaction(**values)
+            records.append({name: getattr(transaction, name) for name in columns})
+        
+        connection = db.session.connection()
+        if connection.dialect.insert_executemany_returning_sort_by_parameter_order:
+            statement = table.insert().returning(table.c.id, sort_by_parameter_order=True)
+            return list(connection.execute(statement, records).scalars())
+        return [connection.execute(table.insert(), record).inserted_primary_key[0] for record in records]
+    
+    def _update(self):
+        table = StockTransaction.__table__
+        generated = derived_columns_generated()
+        
+        # Items setting the same columns share one executemany
+        shapes = {}
+        for _, transaction_id, changes in self.updates:
+            shapes.setdefault(tuple(sorted(changes)), []).append((transaction_id, changes))
+        
+        for names, items in shapes.items():
+            def value(name):
+                if name in names:
+                    return bindparam(f'new_{name}', type_=table.c[name].type)
+                return table.c[name]
+            
+            values = {table.c[name]: value(name) for name in names}
+            if 'stock_name' in names:
+                values[table.c.search_name] = bindparam('new_search_name')
+            if not generated:
+                values.update({table.c[name]: expression for name, expression in derived_expressions(value).items()})
+            
+            parameters = []
+            for transaction_id, changes in items:
+                row = {f'new_{name}': changes[name] for name in names}
+                row['target_id'] = transaction_id
+                if 'stock_name' in names:
+                    row['new_search_name'] = normalize_symbol(changes['stock_name'])
+                parameters.append(row)
+            
+            statement = table.update().where(table.c.id == bindparam('target_id')).values(values)
+            db.session.execute(statement, parameters)
+    
+    def _delete(self):
+        if self.deletes:
+            table = StockTransaction.__table__
+            ids = [transaction_id for _, transaction_id in self.deletes]
+            db.session.execute(table.delete().where(table.c.id.in_(ids)))
@@ -0,0 +1,276 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+from email.utils import formatdate
+from blinker import Namespace
+from flask import current_app, request, make_response, has_app_context
+from sqlalchemy import event, inspect, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
+from werkzeug.http import parse_etags
+from werkzeug.utils import import_string
+from app import db
+from app.models import StockTransaction, DataVersion
+from app.routing import replica_may_lag
+
+# Query args that never change a response (jQuery's cache buster)
+IGNORED_ARGS = {'_'}
+
+# Sent with the app after each bump, with the new and the previous version,
+# the buy and sell dates the commit touched (None when they are not known)
+# and the ids of the transactions it deleted
+data_changed = Namespace().signal('stock-data-changed')
+
+class InProcessBackend:
+    """Response cache held in this process, with LRU and TTL eviction.
+
+    A backend also owns the data version. This one keeps it in the process
+    too, so it only suits a single worker: writes handled by other workers
+    are not seen until entries expire. A backend for several workers must
+    share the version; see DatabaseVersionBackend.
+    """
+
+    # Whether every worker sees the same data version
+    shared_version = False
+
+    def __init__(self, max_entries=256, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._boot = uuid.uuid4().hex[:8]
+        self._counter = 0
+        self._modified = time.time()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def state(self):
+        """(data version, time of the last write) as one consistent read."""
+        with self._lock:
+            return f'{self._boot}-{self._counter}', self._modified
+
+    def version(self):
+        return self.state()[0]
+
+    def last_modified(self):
+        return self.state()[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def bump(self):
+        """Start a new data version; returns (previous, new) version."""
+        # Entries of older versions can never be hit again, so drop them
+        with self._lock:
+            previous = f'{self._boot}-{self._counter}'
+            self._counter += 1
+            self._modified = time.time()
+            self._entries.clear()
+            return previous, f'{self._boot}-{self._counter}'
+
+class DatabaseVersionBackend(InProcessBackend):
+    """Per-process response cache under a data version kept in the database.
+
+    Every worker reads the version from the data_version row (one primary
+    key lookup per cached request) and bumps it after its own writes, so
+    entries cached under an older version are never served again, whichever
+    worker made the write.
+    """
+
+    shared_version = True
+
+    def state(self):
+        with db.engine.connect() as connection:
+            row = connection.execute(select(DataVersion.token, DataVersion.counter, DataVersion.modified)).first()
+        if row is None:
+            # Nothing written since the table was created
+            return 'initial', 0.0
+        return f'{row.token}-{row.counter}', float(row.modified)
+
+    def bump(self):
+        table = DataVersion.__table__
+        now = time.time()
+        for _ in range(2):
+            try:
+                with db.engine.begin() as connection:
+                    # The UPDATE holds the row until commit, so counter - 1
+                    # is exactly the version this write followed
+                    updated = connection.execute(
+                        table.update().values(counter=table.c.counter + 1, modified=now)
+                    ).rowcount
+                    if not updated:
+                        connection.execute(table.insert().values(id=1, token=uuid.uuid4().hex[:8], counter=1, modified=now))
+                    token, counter = connection.execute(select(table.c.token, table.c.counter)).one()
+                break
+            except IntegrityError:
+                # Another worker created the row first; bump that one
+                continue
+        else:
+            raise RuntimeError('Could not bump the shared data version')
+        self.clear()
+        return f'{token}-{counter - 1}' if counter > 1 else 'initial', f'{token}-{counter}'
+
+def init_cache(app):
+    backend_class = import_string(app.config['RESPONSE_CACHE_BACKEND'])
+    app.extensions['response_cache'] = backend_class(
+        max_entries=app.config['RESPONSE_CACHE_MAX_ENTRIES'],
+        ttl=app.config['RESPONSE_CACHE_TTL']
+    )
+
+def get_backend():
+    return current_app.extensions['response_cache']
+
+def data_version():
+    return get_backend().version()
+
+def mark_data_changed(session, dates=None, deleted=()):
+    """Flag ``session`` so the data version bumps once it commits.
+
+    ORM writes are flagged by the model events below; Core bulk statements
+    run through the session must call this themselves, passing the dates
+    they touched if they know them and the ids of any rows they deleted.
+    """
+    touched = session.info.get('stock_dates_changed', set())
+    session.info['stock_data_changed'] = True
+    session.info['stock_dates_changed'] = None if touched is None or dates is None else touched | set(dates)
+    if deleted:
+        session.info.setdefault('stock_rows_deleted', set()).update(deleted)
+
+def bump_data_version(dates=None, deleted=frozenset()):
+    """Start a new data version now, for changes made outside a session."""
+    previous, version = get_backend().bump()
+    data_changed.send(
+        current_app._get_current_object(), version=version, previous=previous, dates=dates, deleted=deleted
+    )
+
+def touched_dates(target):
+    """Buy and sell dates of ``target`` before and after this flush."""
+    state = inspect(target)
+    if state.unloaded & {'buy_date', 'sell_date'}:
+        return None
+    dates = set()
+    for name in ('buy_date', 'sell_date'):
+        history = state.attrs[name].history
+        dates.update(history.added or (), history.unchanged or (), history.deleted or ())
+    dates.discard(None)
+    return dates
+
+def _flag_write(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        mark_data_changed(session, touched_dates(target))
+
+def _flag_delete(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        mark_data_changed(session, touched_dates(target), (target.id,))
+
+event.listen(StockTransaction, 'after_insert', _flag_write)
+event.listen(StockTransaction, 'after_update', _flag_write)
+event.listen(StockTransaction, 'after_delete', _flag_delete)
+
+@event.listens_for(Session, 'after_commit')
+def _bump_after_commit(session):
+    changed = session.info.pop('stock_data_changed', False)
+    dates = session.info.pop('stock_dates_changed', None)
+    deleted = session.info.pop('stock_rows_deleted', set())
+    # Bumping only after commit keeps readers from caching uncommitted state
+    if changed and has_app_context():
+        bump_data_version(dates, frozenset(deleted))
+
+@event.listens_for(Session, 'after_rollback')
+def _forget_rollback(session):
+    session.info.pop('stock_data_changed', None)
+    session.info.pop('stock_dates_changed', None)
+    session.info.pop('stock_rows_deleted', None)
+
+def cache_key(endpoint, view_args, args, accept_encoding='', per_day=False):
+    """Key for a response, from the parts of the request that can change it.
+
+    ``args`` are the query's (name, value) pairs. The async handlers pass
+    their Flask view's endpoint, so both serving modes share entries and ETags.
+    """
+    args = sorted((name, value) for name, value in args if name not in IGNORED_ARGS)
+    parts = [endpoint, repr(sorted(view_args.items())), repr(args)]
+    if 'gzip' in accept_encoding:
+        parts.append('gzip')
+    if per_day:
+        parts.append(date.today().isoformat())
+    return hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+def request_key(per_day=False):
+    return cache_key(
+        request.endpoint, request.view_args, request.args.items(multi=True),
+        request.headers.get('Accept-Encoding', ''), per_day
+    )
+
+def etag_matches(if_none_match, etag):
+    # Only the ETag: Last-Modified has whole seconds, and would miss a write
+    # made in the same second as the response the client holds
+    return parse_etags(if_none_match).contains(etag)
+
+def not_modified(etag):
+    return etag_matches(request.headers.get('If-None-Match'), etag)
+
+def cached_response(per_day=False):
+    """Serve a GET view from the response cache, with ETag revalidation.
+
+    The ETag combines the data version with the normalized request, so a
+    client holding the current one gets a 304 without any query running.
+    Streamed responses get the validators but their bodies are not stored.
+    ``per_day`` is for views whose output also depends on today's date.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not current_app.config['RESPONSE_CACHE_ENABLED']:
+                return view(*args, **kwargs)
+
+            backend = get_backend()
+            version, modified = backend.state()
+            key = request_key(per_day)
+            etag = f'{version}-{key[:16]}'
+
+            if not_modified(etag):
+                response = make_response('', 304)
+            else:
+                stored = backend.get(f'{version}:{key}')
+                if stored is not None:
+                    body, status, headers = stored
+                    response = make_response(body, status, headers)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    storable = not response.is_streamed and not response.direct_passthrough
+                    if storable and not replica_may_lag(modified):
+                        headers = [(name, value) for name, value in response.headers if name != 'Set-Cookie']
+                        backend.set(f'{version}:{key}', (response.get_data(), 200, headers))
+
+            response.set_etag(etag)
+            response.headers['Last-Modified'] = formatdate(modified, usegmt=True)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,384 @@
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+import numpy as np
+from flask import current_app
+from sqlalchemy import select, func, or_, type_coerce, Float
+from app import db
+from app.cache import data_changed
+from app.models import StockTransaction
+
+# Columns held in memory and their dtypes. Stock names are codes into the
+# replica's symbol list, dates are days since 1970-01-01 (NO_DAY for none)
+REPLICA_COLUMNS = {
+    'id': np.int64,
+    'stock_code': np.int32,
+    'buy_quantity': np.int64,
+    'total_cost': np.float64,
+    'buy_date': np.int32,
+    'sell_quantity': np.int64,
+    'total_selling_cost': np.float64,
+    'sell_date': np.int32,
+    'remaining_quantity': np.int64,
+    'profit_loss_percentage': np.float64
+}
+NO_DAY = np.iinfo(np.int32).min
+# Rows stamped up to this long before the watermark are read again, for
+# writes that committed after later ones or on a host with a slower clock
+WATERMARK_OVERLAP = timedelta(seconds=10)
+# Rows fetched per partition while loading
+LOAD_BATCH_SIZE = 50000
+
+def replica_statement():
+    t = StockTransaction
+    return select(
+        t.id,
+        t.stock_name,
+        t.buy_quantity,
+        type_coerce(t.total_cost, Float),
+        t.buy_date,
+        t.sell_quantity,
+        type_coerce(t.total_selling_cost, Float),
+        t.sell_date,
+        t.remaining_quantity,
+        type_coerce(t.profit_loss_percentage, Float),
+        t.updated_at
+    ).order_by(t.id)
+
+def to_days(values):
+    days = np.array(values, dtype='datetime64[D]')
+    result = days.astype(np.int64)
+    result[np.isnat(days)] = NO_DAY
+    return result.astype(np.int32)
+
+def from_days(days):
+    return days.astype('datetime64[D]').tolist()
+
+class ColumnarReplica:
+    """stock_transactions held as one NumPy array per column, in id order.
+
+    Writes committed in this process mark it stale, with the ids they
+    deleted; the next read then fetches only rows stamped since the
+    ``updated_at`` watermark or with a higher id. Other processes' writes
+    are picked up by the same query every ``check_seconds``, together with
+    a row count that catches their deletes. Arrays keep spare capacity, so
+    new rows are appended without copying the whole table.
+    """
+
+    def __init__(self, check_seconds):
+        self.check_seconds = check_seconds
+        self._lock = threading.RLock()
+        self._columns = None
+        self._size = 0
+        self._symbols = []
+        self._codes = {}
+        self._watermark = None
+        self._stale = False
+        self._deleted = set()
+        self._checked = 0.0
+        # Bumped whenever the arrays change; keys the memoized day totals
+        self._generation = 0
+        self._day_totals = None
+        self._counters = {'loads': 0, 'refreshes': 0, 'rows_refreshed': 0, 'id_sweeps': 0}
+        self._load_seconds = None
+        self._loaded_at = None
+        self._refreshed_at = None
+
+    def changed(self, deleted):
+        with self._lock:
+            self._deleted |= deleted
+            self._stale = True
+
+    def sync(self):
+        """Load the table on first use, then apply whatever changed since."""
+        with self._lock:
+            if self._columns is None:
+                self._load()
+            elif self._stale or time.monotonic() - self._checked > self.check_seconds:
+                self._refresh(count_rows=not self._stale)
+
+    def column(self, name):
+        return self._columns[name][:self._size]
+
+    def _code(self, name):
+        code = self._codes.get(name)
+        if code is None:
+            code = self._codes[name] = len(self._symbols)
+            self._symbols.append(name)
+        return code
+
+    def _to_columns(self, rows):
+        """Fetched rows as REPLICA_COLUMNS arrays, and their latest updated_at."""
+        (ids, names, buy_quantity, total_cost, buy_date, sell_quantity, total_selling_cost,
+         sell_date, remaining_quantity, percentage, updated_at) = zip(*rows) if rows else ((),) * 11
+        stamps = [stamp for stamp in updated_at if stamp is not None]
+        return {
+            'id': np.array(ids, dtype=np.int64),
+            'stock_code': np.array([self._code(name) for name in names], dtype=np.int32),
+            'buy_quantity': np.array(buy_quantity, dtype=np.int64),
+            'total_cost': np.array(total_cost, dtype=np.float64),
+            'buy_date': to_days(buy_date),
+            'sell_quantity': np.array([value or 0 for value in sell_quantity], dtype=np.int64),
+            'total_selling_cost': np.array([value or 0.0 for value in total_selling_cost], dtype=np.float64),
+            'sell_date': to_days(sell_date),
+            'remaining_quantity': np.array(remaining_quantity, dtype=np.int64),
+            'profit_loss_percentage': np.array([value or 0.0 for value in percentage], dtype=np.float64)
+        }, max(stamps, default=None)
+
+    def _advance(self, watermark):
+        if watermark is not None and (self._watermark is None or watermark > self._watermark):
+            self._watermark = watermark
+
+    def _load(self):
+        started = time.perf_counter()
+        self._symbols, self._codes, self._watermark = [], {}, None
+        parts = []
+        with db.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(replica_statement())
+            for rows in result.partitions(LOAD_BATCH_SIZE):
+                columns, watermark = self._to_columns(rows)
+                parts.append(columns)
+                self._advance(watermark)
+
+        self._columns = {
+            name: np.concatenate([part[name] for part in parts]) if parts else np.zeros(0, dtype=dtype)
+            for name, dtype in REPLICA_COLUMNS.items()
+        }
+        self._size = len(self._columns['id'])
+        self._generation += 1
+        self._stale = False
+        self._deleted = set()
+        self._checked = time.monotonic()
+        self._counters['loads'] += 1
+        self._load_seconds = time.perf_counter() - started
+        self._loaded_at = self._refreshed_at = datetime.utcnow()
+
+    def _refresh(self, count_rows):
+        t = StockTransaction
+        max_id = int(self._columns['id'][self._size - 1]) if self._size else 0
+        if self._watermark is None:
+            recent = t.updated_at.isnot(None)
+        else:
+            recent = t.updated_at >= self._watermark - WATERMARK_OVERLAP
+
+        self._stale = False
+        deleted, self._deleted = self._deleted, set()
+        with db.engine.connect() as conn:
+            rows = conn.execute(replica_statement().where(or_(t.id > max_id, recent))).all()
+            if deleted:
+                self._remove(np.isin(self.column('id'), np.fromiter(deleted, dtype=np.int64, count=len(deleted))))
+            columns, watermark = self._to_columns(rows)
+            self._upsert(columns)
+            self._advance(watermark)
+
+            # Deletes made by other processes only show in the row count
+            if count_rows and conn.execute(select(func.count(t.id))).scalar() != self._size:
+                existing = np.fromiter(conn.execute(select(t.id)).scalars(), dtype=np.int64)
+                self._remove(~np.isin(self.column('id'), existing))
+                self._counters['id_sweeps'] += 1
+
+        self._checked = time.monotonic()
+        self._counters['refreshes'] += 1
+        self._counters['rows_refreshed'] += len(rows)
+        self._refreshed_at = datetime.utcnow()
+
+    def _upsert(self, columns):
+        ids = self.column('id')
+        new_ids = columns['id']
+        if not len(new_ids):
+            return
+        at = np.searchsorted(ids, new_ids)
+        found = at < self._size
+        found[found] = ids[at[found]] == new_ids[found]
+
+        for name, values in columns.items():
+            self._columns[name][at[found]] = values[found]
+        self._generation += 1
+        if found.all():
+            return
+
+        added = ~found
+        if at[added].min() == self._size:
+            self._reserve(int(added.sum()))
+            end = self._size + int(added.sum())
+            for name, values in columns.items():
+                self._columns[name][self._size:end] = values[added]
+            self._size = end
+        else:
+            # Ids below the highest one held, from a transaction that
+            # committed late: insert them in place
+            self._columns = {
+                name: np.insert(self.column(name), at[added], values[added]) for name, values in columns.items()
+            }
+            self._size = len(self._columns['id'])
+
+    def _reserve(self, extra):
+        capacity = len(self._columns['id'])
+        if self._size + extra <= capacity:
+            return
+        capacity = max(self._size + extra, capacity * 2, 1024)
+        for name, array in self._columns.items():
+            grown = np.empty(capacity, dtype=array.dtype)
+            grown[:self._size] = array[:self._size]
+            self._columns[name] = grown
+
+    def _remove(self, drop):
+        if drop.any():
+            self._columns = {name: self.column(name)[~drop] for name in self._columns}
+            self._size = len(self._columns['id'])
+            self._generation += 1
+
+    def _realized(self):
+        """Realized P&L per row, by the same rule as the model's expression."""
+        sell_quantity = self.column('sell_quantity')
+        selling = self.column('total_selling_cost')
+        sold = (sell_quantity > 0) & (selling > 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cost_sold = self.column('total_cost') * sell_quantity / self.column('buy_quantity')
+        return np.where(sold, selling - cost_sold, 0.0), cost_sold
+
+    def stats_row(self):
+        """Same columns as analytics.stats_statement, from the arrays."""
+        with self._lock:
+            remaining = self.column('remaining_quantity')
+            percentage = self.column('profit_loss_percentage')
+            with_percentage = percentage != 0
+            realized, _ = self._realized()
+            return (
+                self._size,
+                round(float(self.column('total_cost').sum()), 4),
+                round(float(self.column('total_selling_cost').sum()), 4),
+                round(float(realized.sum()), 4),
+                int((remaining > 0).sum()),
+                int(remaining.sum()),
+                float(percentage[with_percentage].sum()),
+                int(with_percentage.sum()),
+                int((percentage > 0).sum())
+            )
+
+    def holdings(self):
+        """Same rows as analytics.compute_holdings: held quantity and open lots per stock."""
+        with self._lock:
+            remaining = self.column('remaining_quantity')
+            held = remaining > 0
+            codes = self.column('stock_code')[held]
+            quantity = np.bincount(codes, weights=remaining[held], minlength=len(self._symbols)).astype(np.int64)
+            lots = np.bincount(codes, minlength=len(self._symbols))
+            stocks = sorted(np.flatnonzero(quantity).tolist(), key=lambda code: (-quantity[code], self._symbols[code]))
+            return [
+                {'stock_name': self._symbols[code], 'remaining_quantity': int(quantity[code]), 'open_lots': int(lots[code])}
+                for code in stocks
+            ]
+
+    def day_totals(self):
+        """Same days as DayTotalsCache.totals: [capital deployed, realized P&L, cost of shares sold].
+
+        Kept until the arrays next change.
+        """
+        with self._lock:
+            if self._day_totals is not None and self._day_totals[0] == self._generation:
+                return self._day_totals[1]
+
+            buy_date = self.column('buy_date')
+            sell_date = self.column('sell_date')
+            sold = self.column('sell_quantity') > 0
+            realized, cost_sold = self._realized()
+            sold_on = np.where(sell_date != NO_DAY, sell_date, buy_date)[sold]
+
+            days, slots = np.unique(np.concatenate([buy_date, sold_on]), return_inverse=True)
+            bought_slots, sold_slots = slots[:self._size], slots[self._size:]
+            deployed = np.bincount(bought_slots, weights=self.column('total_cost'), minlength=len(days))
+            realized = np.bincount(sold_slots, weights=realized[sold], minlength=len(days))
+            cost_sold = np.bincount(sold_slots, weights=cost_sold[sold], minlength=len(days))
+
+            totals = {
+                day: values
+                for day, values in zip(from_days(days), zip(deployed.tolist(), realized.tolist(), cost_sold.tolist()))
+                if any(values)
+            }
+            self._day_totals = (self._generation, totals)
+            return totals
+
+    def report(self):
+        """Rows held, bytes per column and for the symbol list, and refresh counters."""
+        with self._lock:
+            columns = {
+                name: {
+                    'dtype': str(array.dtype),
+                    'used_bytes': self._size * array.itemsize,
+                    'allocated_bytes': int(array.nbytes)
+                }
+                for name, array in self._columns.items()
+            }
+            symbol_bytes = (
+                sys.getsizeof(self._symbols) + sys.getsizeof(self._codes)
+                + sum(sys.getsizeof(symbol) for symbol in self._symbols)
+            )
+            total = sum(column['allocated_bytes'] for column in columns.values()) + symbol_bytes
+            return {
+                'rows': self._size,
+                'capacity': len(self._columns['id']),
+                'symbols': len(self._symbols),
+                'columns': columns,
+                'symbol_bytes': symbol_bytes,
+                'total_bytes': total,
+                'bytes_per_row': round(total / self._size, 1) if self._size else None,
+                'watermark': {
+                    'updated_at': self._watermark.isoformat() if self._watermark else None,
+                    'id': int(self._columns['id'][self._size - 1]) if self._size else None
+                },
+                'load_seconds': round(self._load_seconds, 4),
+                'loaded_at': self._loaded_at.isoformat(),
+                'refreshed_at': self._refreshed_at.isoformat(),
+                **self._counters
+            }
+
+    def check(self, limit=100):
+        """Compare every row with a fresh read of the table.
+
+        Returns the ids missing from the replica, held but no longer in the
+        table, and held with different values (at most ``limit`` of each).
+        """
+        with self._lock:
+            fresh = ColumnarReplica(self.check_seconds)
+            fresh._load()
+            ids, expected_ids = self.column('id'), fresh.column('id')
+            common, mine, theirs = np.intersect1d(ids, expected_ids, assume_unique=True, return_indices=True)
+
+            different = np.zeros(len(common), dtype=bool)
+            for name in REPLICA_COLUMNS:
+                if name == 'stock_code':
+                    held = np.array(self._symbols, dtype=object)[self.column(name)[mine]]
+                    expected = np.array(fresh._symbols, dtype=object)[fresh.column(name)[theirs]]
+                    different |= held != expected
+                elif np.issubdtype(REPLICA_COLUMNS[name], np.floating):
+                    different |= ~np.isclose(self.column(name)[mine], fresh.column(name)[theirs])
+                else:
+                    different |= self.column(name)[mine] != fresh.column(name)[theirs]
+
+            missing = np.setdiff1d(expected_ids, ids, assume_unique=True)
+            extra = np.setdiff1d(ids, expected_ids, assume_unique=True)
+            return {
+                'consistent': not (len(missing) or len(extra) or different.any()),
+                'rows': self._size,
+                'database_rows': fresh._size,
+                'missing': missing[:limit].tolist(),
+                'extra': extra[:limit].tolist(),
+                'different': common[different][:limit].tolist()
+            }
+
+def _data_changed(app, deleted=frozenset(), **extra):
+    app.extensions['columnar_replica'].changed(deleted)
+
+def get_replica():
+    """The app's replica, loaded on first use and brought up to date."""
+    replica = current_app.extensions.get('columnar_replica')
+    if replica is None:
+        app = current_app._get_current_object()
+        replica = app.extensions.setdefault(
+            'columnar_replica', ColumnarReplica(app.config['COLUMNAR_REPLICA_CHECK_SECONDS'])
+        )
+        data_changed.connect(_data_changed, app)
+    replica.sync()
+    return replica
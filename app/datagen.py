@@ -0,0 +1,106 @@
+import random
+import string
+from datetime import date
+import numpy as np
+import pandas as pd
+from app import db
+from app.cache import mark_data_changed
+from app.importer import to_records, insert_records
+
+# Share of lots fully sold and partly sold; the rest are still open
+CLOSED_SHARE = 0.35
+PARTIAL_SHARE = 0.20
+# Mean days a sold lot was held
+MEAN_HOLDING_DAYS = 180
+
+def make_symbols(count, seed=7):
+    """``count`` distinct ticker-like symbols of 3 to 8 letters, sorted."""
+    rng = random.Random(seed)
+    symbols = set()
+    while len(symbols) < count:
+        symbols.add(''.join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(3, 8))))
+    return sorted(symbols)
+
+def generate_frame(rng, symbols, popularity, base_prices, rows, end_date, days):
+    """One batch of transactions as the frame the CSV importer validates to.
+
+    A few symbols get most of the trades (Zipf-like), buy dates are spread
+    over ``days`` up to ``end_date``, and lots are open, partly sold or
+    closed with exponentially distributed holding periods.
+    """
+    picks = rng.choice(len(symbols), size=rows, p=popularity)
+
+    buy_quantity = np.clip(np.ceil(rng.lognormal(np.log(40), 1.0, rows)), 1, 5000).astype(np.int64)
+    buy_price = np.maximum(np.round(base_prices[picks] * rng.lognormal(0, 0.2, rows), 2), 0.01)
+    end = np.datetime64(end_date, 'D')
+    buy_date = end - rng.integers(0, days, rows).astype('timedelta64[D]')
+
+    outcome = rng.random(rows)
+    closed = outcome < CLOSED_SHARE
+    partial = (outcome >= CLOSED_SHARE) & (outcome < CLOSED_SHARE + PARTIAL_SHARE)
+    sold = closed | partial
+
+    partial_quantity = np.clip(np.floor(buy_quantity * rng.uniform(0.1, 0.9, rows)), 1, buy_quantity)
+    sell_quantity = np.where(closed, buy_quantity, np.where(partial, partial_quantity, 0)).astype(np.int64)
+    sell_price = np.where(sold, np.maximum(np.round(buy_price * rng.lognormal(0.04, 0.25, rows), 2), 0.01), 0.0)
+
+    holding = rng.exponential(MEAN_HOLDING_DAYS, rows).astype(np.int64).astype('timedelta64[D]')
+    sell_date = np.where(sold, np.minimum(buy_date + holding, end), np.datetime64('NaT', 'D'))
+
+    return pd.DataFrame({
+        'stock_name': np.asarray(symbols, dtype=object)[picks],
+        'buy_quantity': buy_quantity,
+        'buy_price_per_stock': buy_price,
+        'buy_date': buy_date.astype(object),
+        'sell_quantity': sell_quantity,
+        'sell_price_per_stock': sell_price,
+        'sell_date': sell_date.astype(object)
+    })
+
+def generate_transactions(rows, symbol_count, seed=42, years=5, batch_size=50000, progress=None):
+    """Bulk-insert ``rows`` generated transactions and return the symbols used.
+
+    Each batch is committed on its own, so memory stays flat however many
+    rows are asked for. ``progress`` is called with the running row count.
+    """
+    rng = np.random.default_rng(seed)
+    symbols = make_symbols(symbol_count, seed)
+
+    popularity = 1.0 / np.arange(1, len(symbols) + 1) ** 1.1
+    popularity = rng.permutation(popularity / popularity.sum())
+    base_prices = np.clip(rng.lognormal(np.log(150), 1.0, len(symbols)), 1, 50000)
+
+    end_date = date.today()
+    days = max(int(years * 365), 1)
+    written = 0
+    while written < rows:
+        count = min(batch_size, rows - written)
+        frame = generate_frame(rng, symbols, popularity, base_prices, count, end_date, days)
+        insert_records(to_records(frame), 5000)
+        mark_data_changed(db.session)
+        db.session.commit()
+        written += count
+        if progress is not None:
+            progress(written)
+    return symbols
+
+def generate_price_history(symbols, years=5, seed=42, end_date=None):
+    """Weekday closes for ``symbols`` as a random walk, in the price store's columns.
+
+    Returns (symbols, days since 1970-01-01, closes), ready for
+    ``PriceStore.ingest``.
+    """
+    rng = np.random.default_rng(seed)
+    end = np.datetime64(end_date or date.today(), 'D')
+    days = np.arange(end - max(int(years * 365), 1) + 1, end + 1)
+    days = days[np.is_busday(days)].astype(np.int32)
+
+    starts = np.clip(rng.lognormal(np.log(150), 1.0, len(symbols)), 1, 50000)
+    steps = rng.normal(0.0003, 0.02, (len(symbols), len(days)))
+    closes = np.round(starts[:, None] * np.exp(np.cumsum(steps, axis=1)), 4)
+
+    return (
+        np.repeat(np.asarray(symbols, dtype=str), len(days)),
+        np.tile(days, len(symbols)),
+        closes.ravel()
+    )
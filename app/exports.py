@@ -0,0 +1,249 @@
+import csv
+import io
+import zlib
+from datetime import datetime
+from sqlalchemy import select, and_, Date, DateTime, Integer, Numeric
+from app import db
+from app.archive import with_archived
+from app.models import StockTransaction, normalize_symbol
+
+EXPORT_HEADERS = [
+    'ID', 'Stock Name', 'Buy Quantity', 'Buy Price per Stock', 'Total Cost',
+    'Buy Date', 'Sell Quantity', 'Sell Price per Stock', 'Total Selling Cost',
+    'Sell Date', 'Holding Days', 'Remaining Quantity', 'Profit/Loss %',
+    'Created At', 'Updated At'
+]
+
+# Table columns in the Parquet and Arrow exports, in CSV order; holding_days
+# is added after sell_date
+COLUMNAR_COLUMNS = [
+    'id', 'stock_name', 'buy_quantity', 'buy_price_per_stock', 'total_cost', 'buy_date',
+    'sell_quantity', 'sell_price_per_stock', 'total_selling_cost', 'sell_date',
+    'remaining_quantity', 'profit_loss_percentage', 'created_at', 'updated_at'
+]
+EXPORT_STATUSES = ('open', 'closed')
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+PARQUET_MIMETYPE = 'application/vnd.apache.parquet'
+
+def export_row(t, today):
+    # Holding days stop counting at the sell date
+    if t.buy_date:
+        end_date = t.sell_date if t.sell_date else today
+        holding_days = (end_date - t.buy_date).days
+    else:
+        holding_days = 0
+
+    return [
+        t.id,
+        t.stock_name,
+        t.buy_quantity,
+        float(t.buy_price_per_stock),
+        float(t.total_cost),
+        t.buy_date.isoformat() if t.buy_date else '',
+        t.sell_quantity,
+        float(t.sell_price_per_stock) if t.sell_price_per_stock else 0.0,
+        float(t.total_selling_cost) if t.total_selling_cost else 0.0,
+        t.sell_date.isoformat() if t.sell_date else '',
+        holding_days,
+        t.remaining_quantity,
+        float(t.profit_loss_percentage) if t.profit_loss_percentage else 0.0,
+        t.created_at.isoformat() if t.created_at else '',
+        t.updated_at.isoformat() if t.updated_at else ''
+    ]
+
+def export_statement(include_archived=False):
+    statement = select(StockTransaction.__table__).order_by(StockTransaction.id)
+    return with_archived(statement) if include_archived else statement
+
+def iter_export_batches(batch_size=1000, include_archived=False):
+    """Yield lists of export rows, reading the table in server-side batches.
+
+    Rows come back as plain Core rows, so no ORM objects are built and only
+    one batch is held in memory at a time.
+    """
+    today = datetime.now().date()
+    result = db.session.execute(
+        export_statement(include_archived).execution_options(stream_results=True, yield_per=batch_size)
+    )
+    for partition in result.partitions():
+        yield [export_row(t, today) for t in partition]
+
+def export_condition(args):
+    """Filters for the column exports: symbol, buy_date_from/buy_date_to and status."""
+    t = StockTransaction
+    conditions = []
+    if args.get('symbol'):
+        conditions.append(t.search_name == normalize_symbol(args['symbol']))
+    try:
+        if args.get('buy_date_from'):
+            conditions.append(t.buy_date >= datetime.strptime(args['buy_date_from'], '%Y-%m-%d').date())
+        if args.get('buy_date_to'):
+            conditions.append(t.buy_date <= datetime.strptime(args['buy_date_to'], '%Y-%m-%d').date())
+    except ValueError:
+        raise ValueError('Invalid buy date format. Use YYYY-MM-DD')
+
+    status = args.get('status')
+    if status and status not in EXPORT_STATUSES:
+        raise ValueError(f'status must be one of: {", ".join(EXPORT_STATUSES)}')
+    if status == 'open':
+        conditions.append(t.remaining_quantity > 0)
+    elif status == 'closed':
+        conditions.append(t.remaining_quantity <= 0)
+    return and_(*conditions) if conditions else None
+
+def arrow_type(column_type):
+    import pyarrow as pa
+    if isinstance(column_type, Integer):
+        return pa.int64()
+    if isinstance(column_type, Numeric):
+        return pa.decimal128(column_type.precision, column_type.scale)
+    if isinstance(column_type, DateTime):
+        return pa.timestamp('us')
+    if isinstance(column_type, Date):
+        return pa.date32()
+    return pa.string()
+
+def export_schema():
+    """Arrow schema of the column exports, typed from the table's columns."""
+    import pyarrow as pa
+    columns = StockTransaction.__table__.c
+    fields = []
+    for name in COLUMNAR_COLUMNS:
+        fields.append(pa.field(name, arrow_type(columns[name].type), nullable=columns[name].nullable))
+        if name == 'sell_date':
+            fields.append(pa.field('holding_days', pa.int32(), nullable=False))
+    return pa.schema(fields)
+
+def columnar_statement(condition=None, include_archived=False):
+    table = StockTransaction.__table__
+    statement = select(*(table.c[name] for name in COLUMNAR_COLUMNS)).order_by(table.c.id)
+    if condition is not None:
+        statement = statement.where(condition)
+    return with_archived(statement) if include_archived else statement
+
+def record_batch(partition, schema, today):
+    """One Arrow record batch from rows of columnar_statement().
+
+    Decimals and dates keep their column types; holding days are computed
+    on the batch, counting to the sell date or ``today``.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    columns = {
+        name: pa.array(values, schema.field(name).type)
+        for name, values in zip(COLUMNAR_COLUMNS, zip(*partition))
+    }
+    sold_or_today = pc.coalesce(columns['sell_date'], pa.scalar(today, pa.date32()))
+    columns['holding_days'] = pc.days_between(columns['buy_date'], sold_or_today).cast(pa.int32())
+    return pa.RecordBatch.from_arrays([columns[field.name] for field in schema], schema=schema)
+
+def iter_record_batches(condition=None, batch_size=10000, include_archived=False):
+    """Yield Arrow record batches of the matching rows, read in server-side batches."""
+    schema = export_schema()
+    today = datetime.now().date()
+    statement = columnar_statement(condition, include_archived)
+    result = db.session.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    for partition in result.partitions():
+        yield record_batch(partition, schema, today)
+
+class ChunkSink:
+    """Write-only file that hands back whatever was written since the last take()."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def arrow_writer(sink, schema):
+    import pyarrow as pa
+    return pa.ipc.new_stream(sink, schema)
+
+def parquet_writer(sink, schema):
+    import pyarrow.parquet as pq
+    return pq.ParquetWriter(sink, schema)
+
+def iter_arrow(condition=None, batch_size=10000, include_archived=False):
+    """The export as an Arrow IPC stream, one chunk per record batch."""
+    sink = ChunkSink()
+    with arrow_writer(sink, export_schema()) as writer:
+        for batch in iter_record_batches(condition, batch_size, include_archived):
+            writer.write_batch(batch)
+            yield sink.take()
+    yield sink.take()
+
+def iter_parquet(condition=None, batch_size=10000, include_archived=False):
+    """The export as a Parquet file, one row group per record batch."""
+    sink = ChunkSink()
+    with parquet_writer(sink, export_schema()) as writer:
+        for batch in iter_record_batches(condition, batch_size, include_archived):
+            writer.write_batch(batch)
+            yield sink.take()
+    # The footer, with every row group's offsets and statistics
+    yield sink.take()
+
+def csv_text(rows):
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator='\n').writerows(rows)
+    return buffer.getvalue()
+
+def iter_csv(batch_size=1000, include_archived=False):
+    yield csv_text([EXPORT_HEADERS])
+    for batch in iter_export_batches(batch_size, include_archived):
+        yield csv_text(batch)
+
+def gzip_compressor():
+    # wbits=31 produces a gzip container rather than a raw zlib stream
+    return zlib.compressobj(6, zlib.DEFLATED, 31)
+
+def gzip_chunks(chunks):
+    compressor = gzip_compressor()
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def write_excel(target, batch_size=1000, include_archived=False):
+    """Write the export to ``target`` (a path or binary file) as .xlsx.
+
+    The workbook is opened in write-only mode, so rows are flushed to the
+    underlying zip as they are appended instead of kept as cell objects.
+    """
+    # openpyxl is only loaded when a workbook is actually written
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Stock Transactions')
+
+    header = []
+    for title in EXPORT_HEADERS:
+        cell = WriteOnlyCell(sheet, value=title)
+        cell.font = Font(bold=True)
+        header.append(cell)
+    sheet.append(header)
+
+    for batch in iter_export_batches(batch_size, include_archived):
+        for row in batch:
+            sheet.append(row)
+
+    workbook.save(target)
@@ -0,0 +1,483 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import Counter
+from datetime import date, datetime
+from numbers import Real
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+from sqlalchemy import select, func, union_all, bindparam
+from app import db
+from app.models import StockTransaction, ImportJob, archived_transactions, derived_columns_generated, derived_expressions
+from app.cache import mark_data_changed
+from app.jobs import submit_task
+from app.positions import add_contribution, add_to_positions, record_deltas
+
+REQUIRED_COLUMNS = ['stock_name', 'buy_quantity', 'buy_price_per_stock', 'buy_date']
+DATE_FORMATS = ['%Y-%m-%d', '%m/%d/%Y']
+# What a re-upload may change on a lot it already imported
+SALE_FIELDS = ('sell_quantity', 'sell_price_per_stock', 'sell_date')
+
+def parse_date(text):
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+def parse_dates(values):
+    # Dates repeat heavily in broker files, so parse each distinct value once
+    lookup = {raw: parse_date(str(raw)) for raw in values.dropna().unique()}
+    return values.map(lookup)
+
+def is_text(value):
+    return isinstance(value, str)
+
+def is_number(value):
+    return isinstance(value, (Real, np.number)) and not isinstance(value, (bool, np.bool_))
+
+def irregular_cells(df, column, check):
+    """Flag cells of ``column`` holding a value ``check`` rejects."""
+    if column not in df.columns:
+        return pd.Series(False, index=df.index)
+
+    values = df[column]
+    # Typed columns can be cleared without looking at each cell
+    if check is is_number and is_numeric_dtype(values) and not is_bool_dtype(values):
+        return pd.Series(False, index=df.index)
+    if check is is_text and isinstance(values.dtype, pd.StringDtype):
+        return pd.Series(False, index=df.index)
+    return values.map(lambda value: not pd.isna(value) and not check(value)).astype(bool)
+
+def check_row(index, row):
+    """Validate one row with the per-row rules.
+
+    Used for rows holding cells of unexpected types, so their error
+    messages match the vectorized path and the original importer exactly.
+    """
+    try:
+        if pd.isna(row['stock_name']) or not row['stock_name'].strip():
+            return None, f'Row {index + 2}: Missing stock name'
+
+        if pd.isna(row['buy_quantity']) or row['buy_quantity'] <= 0:
+            return None, f'Row {index + 2}: Invalid buy quantity'
+
+        if pd.isna(row['buy_price_per_stock']) or row['buy_price_per_stock'] <= 0:
+            return None, f'Row {index + 2}: Invalid buy price'
+
+        if pd.isna(row['buy_date']):
+            return None, f'Row {index + 2}: Missing buy date'
+
+        buy_date = parse_date(str(row['buy_date']))
+        if buy_date is None:
+            return None, f'Row {index + 2}: Invalid buy date format (use YYYY-MM-DD or MM/DD/YYYY)'
+
+        sell_date = None
+        if 'sell_date' in row and not pd.isna(row['sell_date']) and str(row['sell_date']).strip():
+            sell_date = parse_date(str(row['sell_date']))
+            if sell_date is None:
+                return None, f'Row {index + 2}: Invalid sell date format (use YYYY-MM-DD or MM/DD/YYYY)'
+
+        sell_quantity = int(row.get('sell_quantity', 0)) if not pd.isna(row.get('sell_quantity', 0)) else 0
+        sell_price_per_stock = float(row.get('sell_price_per_stock', 0)) if not pd.isna(row.get('sell_price_per_stock', 0)) else 0.0
+
+        if sell_quantity > row['buy_quantity']:
+            return None, f'Row {index + 2}: Sell quantity cannot exceed buy quantity'
+
+        return {
+            'stock_name': str(row['stock_name']).strip(),
+            'buy_quantity': int(row['buy_quantity']),
+            'buy_price_per_stock': float(row['buy_price_per_stock']),
+            'buy_date': buy_date,
+            'sell_quantity': sell_quantity,
+            'sell_price_per_stock': sell_price_per_stock,
+            'sell_date': sell_date
+        }, None
+    except Exception as e:
+        return None, f'Row {index + 2}: {str(e)}'
+
+def validate_frame(df):
+    """Validate an import frame column-wise.
+
+    Returns the valid rows as a frame of typed input columns (indexed like
+    ``df``) and the error messages in row order, one per rejected row.
+    """
+    irregular = irregular_cells(df, 'stock_name', is_text)
+    for column in ['buy_quantity', 'buy_price_per_stock', 'sell_quantity', 'sell_price_per_stock']:
+        irregular |= irregular_cells(df, column, is_number)
+
+    regular = df[~irregular]
+    errors = pd.Series(None, index=df.index, dtype=object)
+
+    names = regular['stock_name']
+    buy_quantity = pd.to_numeric(regular['buy_quantity'], errors='coerce')
+    buy_price = pd.to_numeric(regular['buy_price_per_stock'], errors='coerce')
+    buy_date_missing = regular['buy_date'].isna()
+    buy_dates = parse_dates(regular['buy_date'])
+
+    if 'sell_date' in regular.columns:
+        raw_sell_dates = regular['sell_date']
+        has_sell_date = raw_sell_dates.notna() & (raw_sell_dates.astype(str).str.strip() != '')
+        sell_dates = parse_dates(raw_sell_dates.where(has_sell_date))
+        bad_sell_date = has_sell_date & sell_dates.isna()
+    else:
+        sell_dates = pd.Series(None, index=regular.index, dtype=object)
+        bad_sell_date = pd.Series(False, index=regular.index)
+
+    if 'sell_quantity' in regular.columns:
+        sell_quantity = pd.to_numeric(regular['sell_quantity'], errors='coerce').fillna(0)
+    else:
+        sell_quantity = pd.Series(0, index=regular.index)
+    sell_quantity = np.trunc(sell_quantity)
+
+    if 'sell_price_per_stock' in regular.columns:
+        sell_price = pd.to_numeric(regular['sell_price_per_stock'], errors='coerce').fillna(0.0).astype(float)
+    else:
+        sell_price = pd.Series(0.0, index=regular.index)
+
+    # First failing rule wins, in the same order as the single-row checks
+    conditions = [
+        names.isna() | (names.astype(str).str.strip() == ''),
+        buy_quantity.isna() | (buy_quantity <= 0),
+        buy_price.isna() | (buy_price <= 0),
+        buy_date_missing,
+        buy_dates.isna(),
+        bad_sell_date,
+        sell_quantity > buy_quantity
+    ]
+    messages = [
+        'Missing stock name',
+        'Invalid buy quantity',
+        'Invalid buy price',
+        'Missing buy date',
+        'Invalid buy date format (use YYYY-MM-DD or MM/DD/YYYY)',
+        'Invalid sell date format (use YYYY-MM-DD or MM/DD/YYYY)',
+        'Sell quantity cannot exceed buy quantity'
+    ]
+    failed = pd.Series(False, index=regular.index)
+    for condition, message in zip(conditions, messages):
+        hits = condition & ~failed
+        row_numbers = (regular.index[hits] + 2).astype(str)
+        errors[regular.index[hits]] = 'Row ' + row_numbers + ': ' + message
+        failed |= hits
+
+    valid = ~failed
+    frames = [pd.DataFrame({
+        'stock_name': names[valid].astype(str).str.strip(),
+        'buy_quantity': buy_quantity[valid].astype('int64'),
+        'buy_price_per_stock': buy_price[valid].astype(float),
+        'buy_date': buy_dates[valid],
+        'sell_quantity': sell_quantity[valid].astype('int64'),
+        'sell_price_per_stock': sell_price[valid],
+        'sell_date': sell_dates[valid]
+    })]
+
+    # Rows with unexpected cell types go through the per-row rules
+    fallback = []
+    for index, row in df[irregular].iterrows():
+        record, error = check_row(index, row)
+        if error:
+            errors[index] = error
+        else:
+            fallback.append((index, record))
+    if fallback:
+        frames.append(pd.DataFrame(
+            [record for _, record in fallback],
+            index=[index for index, _ in fallback]
+        ))
+
+    rows = pd.concat(frames).sort_index() if len(frames) > 1 else frames[0]
+    return rows, errors.dropna().tolist()
+
+def with_totals(rows):
+    """Add the columns ``StockTransaction.calculate_totals`` derives, column-wise."""
+    buy_quantity = rows['buy_quantity'].astype(float)
+    sell_quantity = rows['sell_quantity'].astype(float)
+    sell_price = rows['sell_price_per_stock'].astype(float)
+
+    total_cost = buy_quantity * rows['buy_price_per_stock']
+    sold = (sell_quantity != 0) & (sell_price != 0)
+    total_selling_cost = (sell_quantity * sell_price).where(sold, 0.0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        proportional_buy_cost = total_cost * (sell_quantity / buy_quantity)
+        percentage = (total_selling_cost - proportional_buy_cost) / proportional_buy_cost * 100
+    has_percentage = (total_selling_cost != 0) & (total_cost > 0)
+
+    return rows.assign(
+        search_name=rows['stock_name'].str.upper(),
+        total_cost=total_cost,
+        total_selling_cost=total_selling_cost,
+        remaining_quantity=rows['buy_quantity'] - rows['sell_quantity'],
+        profit_loss_percentage=percentage.where(has_percentage, 0.0)
+    )
+
+def to_records(rows):
+    if derived_columns_generated():
+        # The database computes the other derived columns on insert
+        rows = rows.assign(search_name=rows['stock_name'].str.upper())
+    else:
+        rows = with_totals(rows)
+    columns = list(rows.columns)
+    # tolist() hands back native Python values; missing dates become None
+    values = [
+        [None if pd.isna(value) else value for value in rows[column].tolist()]
+        if column in ('buy_date', 'sell_date') else rows[column].tolist()
+        for column in columns
+    ]
+    return [dict(zip(columns, row)) for row in zip(*values)]
+
+def insert_records(records, batch_size=1000):
+    # Core executemany skips the ORM unit of work entirely, model events
+    # included, so the positions ledger gets one delta per stock here
+    table = StockTransaction.__table__
+    for start in range(0, len(records), batch_size):
+        db.session.execute(table.insert(), records[start:start + batch_size])
+    add_to_positions(db.session.connection(), record_deltas(records))
+    return len(records)
+
+def natural_keys(rows):
+    """Each row's natural key as text: symbol, buy date, quantity and price.
+
+    Formatted the same from a validated frame and from stored rows.
+    """
+    def formatted(values, text):
+        # Dates and prices repeat, so format each distinct value once
+        return values.map({value: text(value) for value in values.unique()})
+
+    if rows.empty:
+        # Nothing valid: the columns need not even have their usual types
+        return pd.Series([], index=rows.index, dtype=object)
+    return (
+        rows['stock_name'].astype(str).str.strip().str.upper() + '|'
+        + formatted(rows['buy_date'], date.isoformat) + '|'
+        + rows['buy_quantity'].astype('int64').astype(str) + '|'
+        + formatted(rows['buy_price_per_stock'], '{:.4f}'.format)
+    )
+
+def with_import_keys(rows, seen=None):
+    """Add ``import_key``: a hash of the natural key and its occurrence.
+
+    Identical lots (a broker file may list two) are told apart by how many
+    came before them in the upload; ``seen`` carries those counts from one
+    chunk to the next.
+    """
+    seen = Counter() if seen is None else seen
+    keys = []
+    for text in natural_keys(rows).tolist():
+        keys.append(hashlib.blake2b(f'{text}|{seen[text]}'.encode('utf-8'), digest_size=16).hexdigest())
+        seen[text] += 1
+    return rows.assign(import_key=keys)
+
+def stored_lots(keys, batch_size=1000):
+    """Import key -> stored lot for ``keys``, from the live and the archive tables."""
+    lots = {}
+    for table in (StockTransaction.__table__, archived_transactions):
+        columns = [table.c.import_key, table.c.id, table.c.stock_name, table.c.buy_quantity, table.c.buy_price_per_stock]
+        statement = select(*columns, *(table.c[name] for name in SALE_FIELDS))
+        for start in range(0, len(keys), batch_size):
+            for lot in db.session.execute(statement.where(table.c.import_key.in_(keys[start:start + batch_size]))):
+                lots.setdefault(lot.import_key, (table, lot))
+    return lots
+
+def same_sale(lot, record):
+    return (
+        (lot.sell_quantity or 0) == record['sell_quantity']
+        and round(float(lot.sell_price_per_stock or 0), 4) == round(record['sell_price_per_stock'], 4)
+        and lot.sell_date == record['sell_date']
+    )
+
+def update_sales(changes, batch_size=1000):
+    """Write new sell fields onto stored lots: ``changes`` are (lot, record)."""
+    table = StockTransaction.__table__
+
+    def value(name):
+        if name in SALE_FIELDS:
+            return bindparam(f'new_{name}', type_=table.c[name].type)
+        return table.c[name]
+
+    values = {table.c[name]: value(name) for name in SALE_FIELDS}
+    if not derived_columns_generated():
+        values.update({table.c[name]: expression for name, expression in derived_expressions(value).items()})
+    statement = table.update().where(table.c.id == bindparam('target_id')).values(values)
+
+    deltas = {}
+    parameters = []
+    for lot, record in changes:
+        parameters.append(dict({f'new_{name}': record[name] for name in SALE_FIELDS}, target_id=lot.id))
+        inputs = [lot.stock_name, lot.buy_quantity, lot.buy_price_per_stock]
+        add_contribution(deltas, inputs + [lot.sell_quantity, lot.sell_price_per_stock], -1)
+        add_contribution(deltas, inputs + [record['sell_quantity'], record['sell_price_per_stock']])
+    for start in range(0, len(parameters), batch_size):
+        db.session.execute(statement, parameters[start:start + batch_size])
+    add_to_positions(db.session.connection(), deltas)
+    return len(changes)
+
+def upsert_records(records, batch_size=1000):
+    """Insert new lots and update the sales of changed ones; returns (inserted, updated, unchanged).
+
+    ``records`` carry their import keys, looked up in batches; rows already
+    stored with the same sell fields are not written at all, so a re-upload
+    costs writes only for what changed.
+    """
+    lots = stored_lots([record['import_key'] for record in records], batch_size)
+    new, changed, unchanged = [], [], 0
+    for record in records:
+        table, lot = lots.get(record['import_key'], (None, None))
+        if lot is None:
+            new.append(record)
+        elif table is archived_transactions or same_sale(lot, record):
+            # Archived lots are closed for good and stay as they are
+            unchanged += 1
+        else:
+            changed.append((lot, record))
+    return insert_records(new, batch_size), update_sales(changed, batch_size), unchanged
+
+def import_rows(rows, batch_size, seen=None):
+    """Key and upsert validated ``rows``; returns (inserted, updated, unchanged)."""
+    if rows.empty:
+        return 0, 0, 0
+    return upsert_records(to_records(with_import_keys(rows, seen)), batch_size)
+
+def backfill_import_keys(batch_size=5000):
+    """Set the import key of every row, live and archived, numbering identical lots by id."""
+    tables = (StockTransaction.__table__, archived_transactions)
+    columns = ['id', 'stock_name', 'buy_date', 'buy_quantity', 'buy_price_per_stock']
+    # Keeps updated_at, so the backfill is not taken for a change to the rows
+    updates = [
+        table.update().where(table.c.id == bindparam('target_id')).values(
+            import_key=bindparam('new_import_key'), updated_at=table.c.updated_at
+        )
+        for table in tables
+    ]
+
+    def window(table, start):
+        return select(*(table.c[name] for name in columns)).where(table.c.id > start, table.c.id <= start + batch_size)
+
+    last_id = max(db.session.execute(select(func.max(table.c.id))).scalar() or 0 for table in tables)
+    seen = Counter()
+    updated = 0
+    for start in range(0, last_id, batch_size):
+        rows = pd.DataFrame(
+            db.session.execute(union_all(*(window(table, start) for table in tables)).order_by('id')).all(),
+            columns=columns
+        )
+        if rows.empty:
+            continue
+        keys = with_import_keys(rows, seen)['import_key'].tolist()
+        parameters = [
+            {'target_id': transaction_id, 'new_import_key': key} for transaction_id, key in zip(rows['id'].tolist(), keys)
+        ]
+        # Each id is in one of the two tables; the other UPDATE matches nothing
+        for update in updates:
+            db.session.execute(update, parameters)
+        updated += len(rows)
+    return updated
+
+def spool_upload(file, spool_dir):
+    """Copy an upload to disk and return its path and data row count."""
+    os.makedirs(spool_dir, exist_ok=True)
+    fd, path = tempfile.mkstemp(prefix='import-', suffix='.csv', dir=spool_dir)
+
+    lines = 0
+    last = b'\n'
+    with os.fdopen(fd, 'wb') as spool:
+        while True:
+            block = file.stream.read(1024 * 1024)
+            if not block:
+                break
+            spool.write(block)
+            lines += block.count(b'\n')
+            last = block[-1:]
+
+    # A final line without a newline still holds a row; the header does not
+    if last != b'\n':
+        lines += 1
+    return path, max(lines - 1, 0)
+
+_active_imports = set()
+_active_lock = threading.Lock()
+
+def import_job_active(job_id):
+    with _active_lock:
+        return job_id in _active_imports
+
+def start_import_job(app, job_id):
+    """Queue ``job_id`` on the import workers unless it is already running here."""
+    with _active_lock:
+        if job_id in _active_imports:
+            return False
+        _active_imports.add(job_id)
+
+    def run():
+        try:
+            run_import_job(
+                job_id,
+                app.config['IMPORT_CHUNK_SIZE'],
+                app.config['IMPORT_BATCH_SIZE'],
+                app.config['IMPORT_MAX_ERRORS']
+            )
+        finally:
+            db.session.remove()
+            with _active_lock:
+                _active_imports.discard(job_id)
+
+    submit_task(app, 'import', run)
+    return True
+
+def run_import_job(job_id, chunk_size, batch_size, max_errors):
+    """Import a spooled CSV chunk by chunk, committing after each chunk.
+
+    Each commit also records the chunk count on the job, so a restarted job
+    skips the chunks already committed and carries on from there.
+    """
+    job = db.session.get(ImportJob, job_id)
+    if job is None:
+        return
+
+    try:
+        header = pd.read_csv(job.spool_path, nrows=0)
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in header.columns]
+        if missing_columns:
+            raise ValueError(f'Missing required columns: {", ".join(missing_columns)}')
+
+        job.status = 'running'
+        job.error_message = None
+        db.session.commit()
+
+        errors = job.error_list()
+        seen = Counter()
+        reader = pd.read_csv(job.spool_path, chunksize=chunk_size)
+        for number, chunk in enumerate(reader):
+            if number < job.chunks_committed:
+                # Still counted, so identical lots later on get the same keys
+                seen.update(natural_keys(validate_frame(chunk)[0]).tolist())
+                continue
+
+            rows, chunk_errors = validate_frame(chunk)
+            imported, updated, unchanged = import_rows(rows, batch_size, seen)
+
+            errors.extend(chunk_errors[:max(max_errors - len(errors), 0)])
+            job.errors = json.dumps(errors)
+            job.chunks_committed = number + 1
+            job.rows_processed += len(chunk)
+            job.rows_imported += imported
+            job.rows_updated += updated
+            job.rows_unchanged += unchanged
+            job.rows_failed += len(chunk_errors)
+            mark_data_changed(db.session)
+            db.session.commit()
+
+        job.status = 'finished'
+        db.session.commit()
+        os.remove(job.spool_path)
+    except Exception as e:
+        db.session.rollback()
+        job = db.session.get(ImportJob, job_id)
+        job.status = 'failed'
+        job.error_message = str(e)
+        db.session.commit()
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+_executors = {}
+_executor_lock = threading.Lock()
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+def get_executor(app, pool):
+    # One pool per kind of job, sized by <POOL>_JOB_WORKERS
+    with _executor_lock:
+        if pool not in _executors:
+            _executors[pool] = ThreadPoolExecutor(
+                max_workers=app.config[f'{pool.upper()}_JOB_WORKERS'],
+                thread_name_prefix=f'{pool}-job'
+            )
+        return _executors[pool]
+
+def submit_task(app, pool, func, *args):
+    """Run ``func(*args)`` on the ``pool`` workers inside an app context."""
+    def run():
+        with app.app_context():
+            return func(*args)
+    return get_executor(app, pool).submit(run)
+
+def submit_export(app, kind, writer, suffix):
+    """Run ``writer(path)`` on the worker pool and return the new job id.
+
+    The writer runs inside an application context and writes the finished
+    file to a temp path that the download endpoint serves later.
+    """
+    expire_jobs(app.config['EXPORT_JOB_TTL'])
+
+    job_id = uuid.uuid4().hex
+    fd, path = tempfile.mkstemp(prefix='export-', suffix=suffix)
+    os.close(fd)
+
+    with _jobs_lock:
+        _jobs[job_id] = {
+            'id': job_id,
+            'kind': kind,
+            'status': 'queued',
+            'path': path,
+            'error': None,
+            'created': time.time(),
+            'finished': None
+        }
+
+    get_executor(app, 'export').submit(_run_export, app, job_id, writer, path)
+    return job_id
+
+def _run_export(app, job_id, writer, path):
+    _update(job_id, status='running')
+    try:
+        with app.app_context():
+            writer(path)
+        _update(job_id, status='finished', finished=time.time())
+    except Exception as e:
+        _update(job_id, status='failed', error=str(e), finished=time.time())
+        _remove_file(path)
+
+def _update(job_id, **fields):
+    with _jobs_lock:
+        if job_id in _jobs:
+            _jobs[job_id].update(fields)
+
+def get_job(job_id):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+def expire_jobs(ttl):
+    # Drop finished jobs, and their files, once they are older than the TTL
+    cutoff = time.time() - ttl
+    with _jobs_lock:
+        expired = [job for job in _jobs.values() if job['finished'] and job['finished'] < cutoff]
+        for job in expired:
+            del _jobs[job['id']]
+    for job in expired:
+        _remove_file(job['path'])
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
@@ -0,0 +1,246 @@
+import asyncio
+import json
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from flask import current_app
+from app.analytics import compute_stats, compute_holdings
+from app.cache import data_changed
+
+def compute_dashboard():
+    # numpy is only loaded once someone is watching
+    from app.prices import compute_valuation
+    return {
+        'stats': compute_stats(),
+        'holdings': {holding['stock_name']: holding for holding in compute_holdings()},
+        'valuation': compute_valuation()['totals']
+    }
+
+def dashboard_delta(old, new):
+    """Changed totals, and changed holdings per stock (None once no longer held)."""
+    delta = {}
+    for key in ('stats', 'valuation'):
+        changed = {name: value for name, value in new[key].items() if old[key].get(name) != value}
+        if changed:
+            delta[key] = changed
+
+    holdings = {name: holding for name, holding in new['holdings'].items() if old['holdings'].get(name) != holding}
+    holdings.update((name, None) for name in old['holdings'].keys() - new['holdings'].keys())
+    if holdings:
+        delta['holdings'] = holdings
+    return delta
+
+def sse_event(name, seq, payload):
+    return f'id: {seq}\nevent: {name}\ndata: {json.dumps(payload, separators=(",", ":"))}\n\n'
+
+class DashboardFeed:
+    """Dashboard state, recomputed once per change and pushed to every viewer.
+
+    A commit only marks the state dirty; one worker thread recomputes it
+    (at most every ``min_interval`` seconds, so bursts of writes coalesce),
+    diffs it against the last one and publishes the delta to all viewers.
+    Nothing is computed while nobody watches. Each process has its own
+    feed, so viewers also get a resync every ``resync_seconds`` to pick up
+    writes made by other processes.
+    """
+
+    def __init__(self, app, min_interval, resync_seconds, buffer_size):
+        self.app = app
+        self.min_interval = min_interval
+        self.resync_seconds = resync_seconds
+        self._state = None
+        self._seq = 0
+        self._events = deque(maxlen=buffer_size)
+        self._viewers = 0
+        self._dirty = threading.Event()
+        self._condition = threading.Condition()
+        self._compute_lock = threading.Lock()
+        self._async_waiters = set()
+        self._worker = None
+
+    def snapshot(self):
+        """(seq, full state) for a new viewer, computed now if there is none."""
+        with self._compute_lock:
+            with self._condition:
+                if self._state is not None:
+                    return self._seq, self._state
+            state = self._compute()
+            with self._condition:
+                if self._state is None:
+                    self._state = state
+                return self._seq, self._state
+
+    def events_since(self, seq):
+        """Deltas after ``seq``, or None when some of them are no longer kept."""
+        with self._condition:
+            # Without a current state nothing has been tracked since seq
+            if self._state is None or seq > self._seq:
+                return None
+            if seq < self._seq and (not self._events or self._events[0][0] > seq + 1):
+                return None
+            return [(event_seq, delta) for event_seq, delta in self._events if event_seq > seq]
+
+    def wait(self, seq, timeout):
+        with self._condition:
+            self._condition.wait_for(lambda: self._seq > seq, timeout)
+
+    async def wait_async(self, seq, timeout):
+        # Woken from the worker thread without a thread per viewer
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._condition:
+            if self._seq > seq:
+                return
+            self._async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._condition:
+                self._async_waiters.discard(waiter)
+
+    @contextmanager
+    def watching(self):
+        with self._condition:
+            self._viewers += 1
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name='dashboard-feed', daemon=True)
+                self._worker.start()
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._viewers -= 1
+
+    def changed(self):
+        # With no state yet the next viewer computes a fresh one anyway
+        if self._state is not None:
+            self._dirty.set()
+
+    def _compute(self):
+        with self.app.app_context():
+            return compute_dashboard()
+
+    def _run(self):
+        while True:
+            self._dirty.wait(self.resync_seconds)
+            self._dirty.clear()
+            with self._condition:
+                if not self._viewers and self._state is not None:
+                    # Nobody watches: drop the state, and the deltas anyone
+                    # coming back would need, so they start from a snapshot
+                    self._state = None
+                    self._seq += 1
+                    self._events.clear()
+                if self._state is None:
+                    continue
+            try:
+                self._publish()
+            except Exception:
+                self.app.logger.exception('Dashboard feed update failed')
+            time.sleep(self.min_interval)
+
+    def _publish(self):
+        with self._compute_lock:
+            state = self._compute()
+            with self._condition:
+                old, self._state = self._state, state
+                delta = dashboard_delta(old, state) if old is not None else {}
+                if not delta:
+                    return
+                self._seq += 1
+                self._events.append((self._seq, delta))
+                self._condition.notify_all()
+                waiters = list(self._async_waiters)
+        for loop, event in waiters:
+            loop.call_soon_threadsafe(event.set)
+
+def snapshot_payload(state):
+    return {
+        'stats': state['stats'],
+        'holdings': list(state['holdings'].values()),
+        'valuation': state['valuation']
+    }
+
+def parse_seq(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+def catch_up(feed, seq):
+    """(seq, snapshot, deltas) that bring a viewer at ``seq`` up to date.
+
+    ``snapshot`` is the full state when ``seq`` is None or the deltas since
+    it are no longer kept; otherwise it is None and ``deltas`` may be empty.
+    """
+    deltas = feed.events_since(seq) if seq is not None else None
+    if deltas is None:
+        seq, state = feed.snapshot()
+        return seq, snapshot_payload(state), []
+    return (deltas[-1][0] if deltas else seq), None, deltas
+
+def sse_chunk(seq, snapshot, deltas):
+    if snapshot is not None:
+        return sse_event('snapshot', seq, snapshot)
+    if deltas:
+        return ''.join(sse_event('delta', delta_seq, delta) for delta_seq, delta in deltas)
+    # A comment line: keeps proxies from closing the connection, and lets
+    # the server notice a client that went away
+    return ': keep-alive\n\n'
+
+def poll_payload(seq, snapshot, deltas):
+    if snapshot is not None:
+        return {'seq': seq, 'snapshot': snapshot}
+    return {'seq': seq, 'deltas': [dict(delta, seq=delta_seq) for delta_seq, delta in deltas]}
+
+def iter_sse(feed, seq, heartbeat):
+    with feed.watching():
+        # Milliseconds EventSource waits before reconnecting
+        yield 'retry: 5000\n\n'
+        while True:
+            seq, snapshot, deltas = catch_up(feed, seq)
+            yield sse_chunk(seq, snapshot, deltas)
+            feed.wait(seq, heartbeat)
+
+async def aiter_sse(feed, seq, heartbeat):
+    with feed.watching():
+        yield 'retry: 5000\n\n'
+        while True:
+            seq, snapshot, deltas = await asyncio.to_thread(catch_up, feed, seq)
+            yield sse_chunk(seq, snapshot, deltas)
+            await feed.wait_async(seq, heartbeat)
+
+def long_poll(feed, seq, timeout):
+    """Whatever is new after ``seq``, waiting up to ``timeout`` seconds for it."""
+    with feed.watching():
+        seq, snapshot, deltas = catch_up(feed, seq)
+        if snapshot is None and not deltas:
+            feed.wait(seq, timeout)
+            seq, snapshot, deltas = catch_up(feed, seq)
+        return poll_payload(seq, snapshot, deltas)
+
+async def async_long_poll(feed, seq, timeout):
+    with feed.watching():
+        seq, snapshot, deltas = await asyncio.to_thread(catch_up, feed, seq)
+        if snapshot is None and not deltas:
+            await feed.wait_async(seq, timeout)
+            seq, snapshot, deltas = await asyncio.to_thread(catch_up, feed, seq)
+        return poll_payload(seq, snapshot, deltas)
+
+def _data_changed(app, **extra):
+    app.extensions['dashboard_feed'].changed()
+
+def init_live(app):
+    app.extensions['dashboard_feed'] = DashboardFeed(
+        app,
+        app.config['LIVE_MIN_INTERVAL'],
+        app.config['LIVE_RESYNC_SECONDS'],
+        app.config['LIVE_EVENT_BUFFER']
+    )
+    data_changed.connect(_data_changed, app)
+
+def get_feed():
+    return current_app.extensions['dashboard_feed']
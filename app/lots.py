@@ -0,0 +1,30 @@
+LOT_METHODS = ('fifo', 'lifo')
+
+def match_sell(lots, quantity, method='fifo'):
+    """Split a sell of ``quantity`` shares across open buy lots.
+
+    ``lots`` are ``(lot, buy_date, open_quantity)``, oldest first where they
+    share a buy date. FIFO sells the oldest lots first and LIFO the newest.
+    Returns ``[(lot, quantity)]``; only the last lot can be partly sold.
+    """
+    if method not in LOT_METHODS:
+        raise ValueError(f'method must be one of: {", ".join(LOT_METHODS)}')
+    if quantity <= 0:
+        raise ValueError('quantity must be positive')
+
+    ordered = sorted(enumerate(lots), key=lambda item: (item[1][1], item[0]), reverse=method == 'lifo')
+    available = sum(max(open_quantity, 0) for _, (_, _, open_quantity) in ordered)
+    if available < quantity:
+        raise ValueError(f'Cannot sell {quantity} shares; only {available} are held')
+
+    allocations = []
+    left = quantity
+    for _, (lot, _, open_quantity) in ordered:
+        if left == 0:
+            break
+        if open_quantity <= 0:
+            continue
+        taken = min(open_quantity, left)
+        allocations.append((lot, taken))
+        left -= taken
+    return allocations
@@ -0,0 +1,224 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from flask import current_app, g, request, has_request_context, request_started, request_finished
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+HISTOGRAMS = {
+    'http_request_duration_seconds': 'Request latency, from request start to the response being returned',
+    'db_time_per_request_seconds': 'Time spent in database statements per request'
+}
+COUNTERS = {
+    'http_requests_total': 'Requests served',
+    'db_queries_total': 'Database statements executed',
+    'db_time_seconds_total': 'Time spent in database statements',
+    'db_rows_total': 'Rows fetched or affected, as reported by the driver',
+    'serialization_seconds_total': 'Time spent turning rows into JSON',
+    'db_slow_queries_total': 'Statements slower than METRICS_SLOW_QUERY_SECONDS',
+    'db_n_plus_one_total': 'Requests repeating one statement METRICS_N_PLUS_ONE_THRESHOLD times or more'
+}
+
+# Stats of the ASGI request being served, which has no Flask request context
+_asgi_stats = ContextVar('asgi_request_stats', default=None)
+
+class RequestStats:
+    __slots__ = ('started', 'slow_seconds', 'queries', 'db_time', 'rows', 'serialization', 'statements', 'slow')
+
+    def __init__(self, slow_seconds):
+        self.started = time.perf_counter()
+        self.slow_seconds = slow_seconds
+        self.queries = 0
+        self.db_time = 0.0
+        self.rows = 0
+        self.serialization = 0.0
+        self.statements = {}
+        self.slow = {}
+
+class MetricsRegistry:
+    """Counters and histograms for this process, in Prometheus text format.
+
+    Requests only touch the lock once, when they finish; statements are
+    counted on the request's own RequestStats.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(sorted(buckets))
+        self._counters = {name: {} for name in COUNTERS}
+        self._histograms = {name: {} for name in HISTOGRAMS}
+        self._lock = threading.Lock()
+
+    def record(self, route, method, status, duration, stats, n_plus_one):
+        request_labels = (('route', route), ('method', method), ('status', status))
+        route = (('route', route),)
+        with self._lock:
+            self._add('http_requests_total', request_labels, 1)
+            self._observe('http_request_duration_seconds', route, duration)
+            self._observe('db_time_per_request_seconds', route, stats.db_time)
+            self._add('db_queries_total', route, stats.queries)
+            self._add('db_time_seconds_total', route, stats.db_time)
+            self._add('db_rows_total', route, stats.rows)
+            self._add('serialization_seconds_total', route, stats.serialization)
+            self._add('db_slow_queries_total', route, sum(count for count, _ in stats.slow.values()))
+            self._add('db_n_plus_one_total', route, 1 if n_plus_one else 0)
+
+    def _add(self, name, labels, value):
+        series = self._counters[name]
+        series[labels] = series.get(labels, 0) + value
+
+    def _observe(self, name, labels, value):
+        series = self._histograms[name].get(labels)
+        if series is None:
+            series = self._histograms[name][labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, help_text in HISTOGRAMS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, (counts, total) in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets + (float('inf'),), counts):
+                        cumulative += count
+                        le = '+Inf' if bound == float('inf') else repr(float(bound))
+                        lines.append(f'{name}_bucket{format_labels(labels + (("le", le),))} {cumulative}')
+                    lines.append(f'{name}_sum{format_labels(labels)} {total}')
+                    lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+            for name, help_text in COUNTERS.items():
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} counter')
+                for labels, value in sorted(self._counters[name].items()):
+                    lines.append(f'{name}{format_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in labels)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + '}'
+
+def short_statement(statement, limit=1000):
+    statement = ' '.join(statement.split())
+    return statement if len(statement) <= limit else statement[:limit] + '...'
+
+def current_stats():
+    if has_request_context():
+        return g.get('request_stats')
+    return _asgi_stats.get()
+
+@contextmanager
+def serialization_timer():
+    stats = current_stats()
+    if stats is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialization += time.perf_counter() - started
+
+class TimedJSONProvider(DefaultJSONProvider):
+    """Flask's JSON provider, with jsonify time counted as serialization."""
+
+    def dumps(self, obj, **kwargs):
+        with serialization_timer():
+            return super().dumps(obj, **kwargs)
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_stats() is not None:
+        context.metrics_started = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats()
+    started = getattr(context, 'metrics_started', None)
+    if stats is None or started is None:
+        return
+
+    duration = time.perf_counter() - started
+    stats.queries += 1
+    stats.db_time += duration
+    if cursor.rowcount is not None and cursor.rowcount > 0:
+        stats.rows += cursor.rowcount
+    # Parameters are bound separately, so one statement text covers a loop;
+    # executemany batches are a single bulk operation and do not count
+    if not executemany:
+        stats.statements[statement] = stats.statements.get(statement, 0) + 1
+    if duration >= stats.slow_seconds:
+        count, slowest = stats.slow.get(statement, (0, 0.0))
+        stats.slow[statement] = (count + 1, max(slowest, duration))
+
+def _request_started(sender, **extra):
+    g.request_stats = RequestStats(sender.config['METRICS_SLOW_QUERY_SECONDS'])
+
+def _request_finished(sender, response, **extra):
+    # Left on g: a streamed body may still run queries after this
+    stats = g.get('request_stats')
+    if stats is None:
+        return
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    labels = (route, request.method, str(response.status_code))
+    if response.is_streamed:
+        # Record once the client has read the whole body
+        response.call_on_close(lambda: record_request(sender, labels, stats))
+    else:
+        response.headers.update(debug_headers(sender, stats))
+        record_request(sender, labels, stats)
+
+def debug_headers(app, stats):
+    if not app.config['METRICS_DEBUG_HEADER']:
+        return {}
+    elapsed = time.perf_counter() - stats.started
+    return {
+        'Server-Timing': (
+            f'db;dur={stats.db_time * 1000:.1f};desc="{stats.queries} queries", '
+            f'serialize;dur={stats.serialization * 1000:.1f}, total;dur={elapsed * 1000:.1f}'
+        ),
+        'X-Query-Count': str(stats.queries)
+    }
+
+def record_request(app, labels, stats):
+    """Record a finished request; ``labels`` are its route, method and status."""
+    duration = time.perf_counter() - stats.started
+    threshold = app.config['METRICS_N_PLUS_ONE_THRESHOLD']
+    repeated = [(count, statement) for statement, count in stats.statements.items() if count >= threshold]
+
+    for count, statement in repeated:
+        app.logger.warning('Possible N+1 on %s: %d executions of %s', labels[0], count, short_statement(statement))
+    for statement, (count, slowest) in stats.slow.items():
+        app.logger.warning('Slow query on %s (%d over the limit, slowest %.3fs): %s',
+                           labels[0], count, slowest, short_statement(statement))
+
+    app.extensions['metrics'].record(*labels, duration, stats, bool(repeated))
+
+def start_asgi_request(app):
+    """Start counting statements for an ASGI request; None with metrics off.
+
+    The stats live on a context variable rather than ``g``: it belongs to the
+    request's task, and asyncio.to_thread copies it into worker threads.
+    """
+    if 'metrics' not in app.extensions:
+        return None
+    stats = RequestStats(app.config['METRICS_SLOW_QUERY_SECONDS'])
+    _asgi_stats.set(stats)
+    return stats
+
+def init_metrics(app):
+    if not app.config['METRICS_ENABLED']:
+        return
+    app.extensions['metrics'] = MetricsRegistry(app.config['METRICS_BUCKETS'])
+    app.json = TimedJSONProvider(app)
+    request_started.connect(_request_started, app)
+    request_finished.connect(_request_finished, app)
+
+def render_metrics():
+    return current_app.extensions['metrics'].render()
@@ -1,38 +1,133 @@
 from app import db
+import json
+import sqlite3
 from datetime import datetime
-from sqlalchemy import event
+from sqlalchemy import event, case, column, func, inspect
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.ext.hybrid import hybrid_property
+from sqlalchemy.schema import CreateColumn
+
+def normalize_symbol(name):
+    return name.strip().upper() if name else name
+
+def derived_expressions(value):
+    """SQL for the columns ``calculate_totals`` derives, by column name.
+
+    ``value(name)`` gives the expression for each input column, so the same
+    definitions serve the generated columns, ``flask recalc`` and bulk
+    updates that substitute new values for some of the inputs.
+    """
+    buy_quantity = value('buy_quantity')
+    sell_quantity = func.coalesce(value('sell_quantity'), 0)
+    sell_price = func.coalesce(value('sell_price_per_stock'), 0)
+    
+    total_cost = buy_quantity * value('buy_price_per_stock')
+    sold = (sell_quantity != 0) & (sell_price != 0)
+    # 1.0 keeps SQLite from dividing integers
+    proportional_buy_cost = total_cost * 1.0 * sell_quantity / buy_quantity
+    
+    return {
+        'total_cost': total_cost,
+        'total_selling_cost': case((sold, sell_quantity * sell_price), else_=0),
+        'remaining_quantity': buy_quantity - sell_quantity,
+        'profit_loss_percentage': case(
+            (sold & (total_cost > 0), (sell_quantity * sell_price - proportional_buy_cost) / proportional_buy_cost * 100),
+            else_=0
+        )
+    }
+
+GENERATED = derived_expressions(column)
+
+def supports_generated_columns(dialect):
+    version = dialect.server_version_info
+    if dialect.name == 'sqlite':
+        return sqlite3.sqlite_version_info >= (3, 31)
+    if version is None:
+        return True
+    if dialect.name in ('mysql', 'mariadb'):
+        return version >= ((10, 2) if dialect.is_mariadb else (5, 7))
+    if dialect.name == 'postgresql':
+        return version >= (12,)
+    return False
+
+@compiles(CreateColumn)
+def create_column(element, compiler, **kw):
+    text = compiler.visit_create_column(element, **kw)
+    computed = element.element.computed
+    if computed is not None and not supports_generated_columns(compiler.dialect):
+        # A plain column instead, filled in by calculate_totals
+        text = text.replace(' ' + compiler.process(computed), '')
+    return text
+
+# Engine URL -> whether its table has the derived columns generated
+_generated_tables = {}
+
+def derived_columns_generated():
+    """Whether the database computes the derived columns itself.
+    
+    Tables created before they were generated columns, or on a backend
+    without them, have plain columns that the application fills in.
+    """
+    engine = db.engine
+    generated = _generated_tables.get(engine.url)
+    if generated is None:
+        columns = inspect(engine).get_columns(StockTransaction.__tablename__)
+        generated = any(c['name'] == 'total_cost' and c.get('computed') for c in columns)
+        _generated_tables[engine.url] = generated
+    return generated
 
 class StockTransaction(db.Model):
     __tablename__ = 'stock_transactions'
+    # Ids are never handed out again, even once the lot holding the highest
+    # one is archived: archived lots keep their id. Only applies to tables
+    # created with it; MySQL 8.0+ keeps its counter across restarts anyway
+    __table_args__ = {'sqlite_autoincrement': True}
     
     id = db.Column(db.Integer, primary_key=True)
     stock_name = db.Column(db.String(100), nullable=False, index=True)
+    search_name = db.Column(db.String(100), nullable=True, index=True)
+    # Hash of the lot's natural key (symbol, buy date, quantity, price) that
+    # CSV re-imports match rows on; see importer.with_import_keys
+    import_key = db.Column(db.String(32), nullable=True, index=True)
     
     # Buy data
     buy_quantity = db.Column(db.Integer, nullable=False)
     buy_price_per_stock = db.Column(db.Numeric(10, 4), nullable=False)
-    total_cost = db.Column(db.Numeric(15, 4), nullable=False)
+    total_cost = db.Column(db.Numeric(15, 4), db.Computed(GENERATED['total_cost'], persisted=True), nullable=False)
     buy_date = db.Column(db.Date, nullable=False, index=True)
     
     # Sell data (nullable as stocks might not be sold yet)
     sell_quantity = db.Column(db.Integer, nullable=True, default=0)
     sell_price_per_stock = db.Column(db.Numeric(10, 4), nullable=True, default=0.0)
-    total_selling_cost = db.Column(db.Numeric(15, 4), nullable=True, default=0.0)
+    total_selling_cost = db.Column(db.Numeric(15, 4), db.Computed(GENERATED['total_selling_cost'], persisted=True), nullable=True)
     sell_date = db.Column(db.Date, nullable=True)
     
-    # Calculated fields
-    remaining_quantity = db.Column(db.Integer, nullable=False)
-    profit_loss_percentage = db.Column(db.Numeric(10, 4), nullable=True, default=0.0)
+    # Calculated fields, generated by the database where it supports them
+    remaining_quantity = db.Column(db.Integer, db.Computed(GENERATED['remaining_quantity'], persisted=True), nullable=False)
+    profit_loss_percentage = db.Column(db.Numeric(10, 4), db.Computed(GENERATED['profit_loss_percentage'], persisted=True), nullable=True)
     
     # Metadata
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Indexed for the columnar replica, which reads back rows changed since
+    # the last updated_at it saw
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     def __init__(self, **kwargs):
         super(StockTransaction, self).__init__(**kwargs)
         self.calculate_totals()
     
     def calculate_totals(self):
+        # Normalized name used by the indexed symbol search
+        self.search_name = normalize_symbol(self.stock_name)
+        
+        if not (self.sell_quantity and self.sell_price_per_stock):
+            self.sell_quantity = self.sell_quantity or 0
+            self.sell_price_per_stock = self.sell_price_per_stock or 0.0
+        
+        # Generated columns: the database computes the rest on write
+        if derived_columns_generated():
+            return
+        
         # Calculate total cost
         if self.buy_quantity and self.buy_price_per_stock:
             self.total_cost = float(self.buy_quantity) * float(self.buy_price_per_stock)
@@ -41,8 +136,6 @@ class StockTransaction(db.Model):
         if self.sell_quantity and self.sell_price_per_stock:
             self.total_selling_cost = float(self.sell_quantity) * float(self.sell_price_per_stock)
         else:
-            self.sell_quantity = self.sell_quantity or 0
-            self.sell_price_per_stock = self.sell_price_per_stock or 0.0
             self.total_selling_cost = 0.0
         
         # Calculate remaining quantity
@@ -56,6 +149,37 @@ class StockTransaction(db.Model):
         else:
             self.profit_loss_percentage = 0.0
     
+    @hybrid_property
+    def realized_profit_loss(self):
+        # Selling value minus the proportional buy cost of the sold shares
+        if self.sell_quantity and self.sell_quantity > 0 and self.total_selling_cost and self.total_selling_cost > 0:
+            sold_cost_ratio = float(self.sell_quantity) / float(self.buy_quantity)
+            proportional_buy_cost = float(self.total_cost) * sold_cost_ratio
+            return float(self.total_selling_cost) - proportional_buy_cost
+        return 0.0
+    
+    @realized_profit_loss.expression
+    def realized_profit_loss(cls):
+        return case(
+            (
+                (cls.sell_quantity > 0) & (cls.total_selling_cost > 0),
+                cls.total_selling_cost - cls.total_cost * 1.0 * cls.sell_quantity / cls.buy_quantity
+            ),
+            else_=0
+        )
+    
+    def record_sale(self, quantity, price, sell_date):
+        """Add one partial sell to this lot.
+        
+        The sell columns hold the running totals: quantity sold, average
+        selling price and the latest sell date. Each sale is in LotSale.
+        """
+        sold = self.sell_quantity or 0
+        value = float(self.sell_price_per_stock or 0.0) * sold + float(price) * quantity
+        self.sell_quantity = sold + quantity
+        self.sell_price_per_stock = value / self.sell_quantity
+        self.sell_date = max(self.sell_date, sell_date) if self.sell_date else sell_date
+    
     def to_dict(self):
         return {
             'id': self.id,
@@ -80,4 +204,161 @@ class StockTransaction(db.Model):
 # Event listener to recalculate totals when the model is updated
 @event.listens_for(StockTransaction, 'before_update')
 def recalculate_totals(mapper, connection, target):
-    target.calculate_totals()
\ No newline at end of file
+    target.calculate_totals()
+
+@event.listens_for(StockTransaction.__table__, 'after_create')
+def forget_generated(target, connection, **kw):
+    _generated_tables.clear()
+
+# Closed lots moved out of stock_transactions by `flask archive`: the same
+# columns, with the derived ones stored as plain values
+archived_transactions = db.Table(
+    'stock_transactions_archive',
+    *(
+        db.Column(c.name, c.type, primary_key=c.primary_key, autoincrement=False, nullable=c.nullable, index=c.index)
+        for c in StockTransaction.__table__.columns
+    )
+)
+
+class ArchivedDay(db.Model):
+    __tablename__ = 'archived_day_totals'
+    
+    # What the archived lots add to the dashboard totals and the timeseries,
+    # kept by `flask archive` as it moves them. Lot counts and buy-side
+    # totals are on the buy date; realized P&L and the cost of the shares
+    # sold are on the day they were sold
+    day = db.Column(db.Date, primary_key=True)
+    transactions = db.Column(db.Integer, nullable=False, default=0)
+    total_cost = db.Column(db.Numeric(18, 4), nullable=False, default=0)
+    total_selling_cost = db.Column(db.Numeric(18, 4), nullable=False, default=0)
+    percentage_total = db.Column(db.Numeric(20, 8), nullable=False, default=0)
+    percentage_count = db.Column(db.Integer, nullable=False, default=0)
+    profitable_transactions = db.Column(db.Integer, nullable=False, default=0)
+    realized_profit_loss = db.Column(db.Numeric(20, 8), nullable=False, default=0)
+    cost_sold = db.Column(db.Numeric(20, 8), nullable=False, default=0)
+    
+    def __repr__(self):
+        return f'<ArchivedDay {self.day}: {self.transactions} lots>'
+
+class Position(db.Model):
+    __tablename__ = 'positions'
+    
+    # Running totals per stock, kept in step with stock_transactions by
+    # the ledger in app.positions
+    id = db.Column(db.Integer, primary_key=True)
+    stock_name = db.Column(db.String(100), nullable=False, unique=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    cost_basis = db.Column(db.Numeric(18, 4), nullable=False, default=0)
+    realized_profit_loss = db.Column(db.Numeric(18, 4), nullable=False, default=0)
+    open_lots = db.Column(db.Integer, nullable=False, default=0)
+    
+    def to_dict(self):
+        return {
+            'stock_name': self.stock_name,
+            'quantity': self.quantity,
+            'cost_basis': float(self.cost_basis),
+            'average_cost': float(self.cost_basis) / self.quantity if self.quantity else 0.0,
+            'realized_profit_loss': float(self.realized_profit_loss),
+            'open_lots': self.open_lots
+        }
+    
+    def __repr__(self):
+        return f'<Position {self.stock_name}: {self.quantity} shares>'
+
+class LotSale(db.Model):
+    __tablename__ = 'lot_sales'
+    
+    # One partial sell matched against a buy lot; method 'lot' is for shares
+    # sold on the lot itself before its first matched sale
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(
+        db.Integer, db.ForeignKey('stock_transactions.id', ondelete='CASCADE'), nullable=False, index=True
+    )
+    quantity = db.Column(db.Integer, nullable=False)
+    price_per_stock = db.Column(db.Numeric(10, 4), nullable=False)
+    sell_date = db.Column(db.Date, nullable=False)
+    method = db.Column(db.String(4), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<LotSale {self.quantity} of lot {self.transaction_id}>'
+
+def import_message(inserted, updated, unchanged):
+    message = f'Successfully imported {inserted} transactions'
+    if updated or unchanged:
+        # A re-upload: rows already imported were matched, not added again
+        message += f' ({updated} updated, {unchanged} unchanged)'
+    return message
+
+class ImportJob(db.Model):
+    __tablename__ = 'import_jobs'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    spool_path = db.Column(db.String(500), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)
+    
+    # Progress, advanced in the same transaction as each committed chunk
+    total_rows = db.Column(db.Integer, nullable=True)
+    chunks_committed = db.Column(db.Integer, nullable=False, default=0)
+    rows_processed = db.Column(db.Integer, nullable=False, default=0)
+    rows_imported = db.Column(db.Integer, nullable=False, default=0)
+    rows_updated = db.Column(db.Integer, nullable=False, default=0)
+    rows_unchanged = db.Column(db.Integer, nullable=False, default=0)
+    rows_failed = db.Column(db.Integer, nullable=False, default=0)
+    errors = db.Column(db.Text, nullable=True)
+    error_message = db.Column(db.Text, nullable=True)
+    
+    # Metadata
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def error_list(self):
+        return json.loads(self.errors) if self.errors else []
+    
+    def to_dict(self):
+        data = {
+            'id': self.id,
+            'filename': self.filename,
+            'status': self.status,
+            'total_rows': self.total_rows,
+            'chunks_committed': self.chunks_committed,
+            'rows_processed': self.rows_processed,
+            'rows_imported': self.rows_imported,
+            'rows_updated': self.rows_updated,
+            'rows_unchanged': self.rows_unchanged,
+            'rows_failed': self.rows_failed,
+            'errors': self.error_list(),
+            'error': self.error_message,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+        
+        # Same summary fields as the one-shot /api/bulk-import response
+        if self.status == 'finished':
+            data['message'] = import_message(self.rows_imported, self.rows_updated, self.rows_unchanged)
+            data['successful_imports'] = self.rows_imported
+            data['inserted'] = self.rows_imported
+            data['updated'] = self.rows_updated
+            data['unchanged'] = self.rows_unchanged
+            if self.rows_failed:
+                data['warning'] = f'{self.rows_failed} rows had errors and were skipped'
+        
+        return data
+    
+    def __repr__(self):
+        return f'<ImportJob {self.id}: {self.status}>'
+
+class DataVersion(db.Model):
+    __tablename__ = 'data_version'
+    
+    # One row, bumped after every committed write, so that worker processes
+    # share one data version; used by cache.DatabaseVersionBackend. The token
+    # tells a recreated row's counter apart from the old one's
+    id = db.Column(db.Integer, primary_key=True)
+    token = db.Column(db.String(8), nullable=False)
+    counter = db.Column(db.Integer, nullable=False, default=0)
+    modified = db.Column(db.Numeric(17, 6), nullable=False)
+    
+    def __repr__(self):
+        return f'<DataVersion {self.token}-{self.counter}>'
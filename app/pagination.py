@@ -0,0 +1,137 @@
+import base64
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from sqlalchemy import and_, or_, asc, desc, func, select
+from app.models import StockTransaction
+from app.cache import data_version
+
+# Columns the grid may sort on; anything else falls back to the default order
+SORTABLE_COLUMNS = {
+    'id': StockTransaction.id,
+    'stock_name': StockTransaction.stock_name,
+    'buy_quantity': StockTransaction.buy_quantity,
+    'buy_price_per_stock': StockTransaction.buy_price_per_stock,
+    'total_cost': StockTransaction.total_cost,
+    'buy_date': StockTransaction.buy_date,
+    'sell_quantity': StockTransaction.sell_quantity,
+    'sell_price_per_stock': StockTransaction.sell_price_per_stock,
+    'total_selling_cost': StockTransaction.total_selling_cost,
+    'sell_date': StockTransaction.sell_date,
+    'remaining_quantity': StockTransaction.remaining_quantity,
+    'profit_loss_percentage': StockTransaction.profit_loss_percentage,
+    'created_at': StockTransaction.created_at,
+}
+
+# NULLs break seek comparisons, so nullable sort keys compare on a sentinel
+NULL_SENTINELS = {
+    'sell_date': date(1000, 1, 1),
+}
+
+_count_cache = {}
+
+def sort_key(column_name):
+    column = SORTABLE_COLUMNS[column_name]
+    if column_name in NULL_SENTINELS:
+        return func.coalesce(column, NULL_SENTINELS[column_name])
+    return column
+
+def encode_cursor(column_name, value, row_id):
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    elif isinstance(value, Decimal):
+        value = str(value)
+    payload = json.dumps([column_name, value, row_id])
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+def decode_cursor(cursor, column_name):
+    if not cursor:
+        return None
+    name, value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+    if name != column_name:
+        raise ValueError('Cursor does not match the requested sort column')
+    python_type = SORTABLE_COLUMNS[column_name].type.python_type
+    if value is None:
+        value = NULL_SENTINELS.get(column_name)
+    elif python_type is date:
+        value = date.fromisoformat(value)
+    elif python_type is datetime:
+        value = datetime.fromisoformat(value)
+    elif python_type is Decimal:
+        value = Decimal(value)
+    return value, int(row_id)
+
+def keyset_page(query, column_name, direction, length, cursor=None, start=0, total=None):
+    """Return one page of ``query`` ordered by ``column_name`` and ``id``.
+
+    With a cursor (the sort value and id of the last row already shown) the
+    page is found by seeking past it, so every page costs the same as the
+    first one. Without a cursor, pages in the back half of the result are
+    read in reverse order so the offset stays small.
+    """
+    query, reverse = keyset_query(query, column_name, direction, length, cursor, start, total)
+    rows = query.all()
+    if reverse:
+        rows.reverse()
+    return rows, page_cursor(rows, column_name)
+
+def keyset_query(query, column_name, direction, length, cursor=None, start=0, total=None):
+    """Order and limit ``query`` (a Query or a Core select) for ``keyset_page``.
+
+    Also returns whether the rows come back reversed and must be flipped.
+    """
+    key = sort_key(column_name)
+    ordering = desc if direction == 'desc' else asc
+
+    if cursor is not None:
+        value, last_id = cursor
+        # Compare against the stored value of the cursor row where it still
+        # exists, so rounding in the encoded value cannot skip or repeat rows
+        anchor = func.coalesce(
+            select(key).where(StockTransaction.id == last_id).scalar_subquery(),
+            value
+        )
+        if direction == 'desc':
+            seek = or_(key < anchor, and_(key == anchor, StockTransaction.id < last_id))
+        else:
+            seek = or_(key > anchor, and_(key == anchor, StockTransaction.id > last_id))
+        return query.filter(seek).order_by(ordering(key), ordering(StockTransaction.id)).limit(length), False
+
+    if total is not None and start > total // 2:
+        reverse = asc if direction == 'desc' else desc
+        tail_length = max(min(length, total - start), 0)
+        offset = max(total - start - tail_length, 0)
+        return query.order_by(reverse(key), reverse(StockTransaction.id)).offset(offset).limit(tail_length), True
+
+    return query.order_by(ordering(key), ordering(StockTransaction.id)).offset(start).limit(length), False
+
+def page_cursor(rows, column_name):
+    if not rows:
+        return None
+    last = rows[-1]
+    return encode_cursor(column_name, getattr(last, column_name), last.id)
+
+def cached_count(query, key, ttl):
+    """Count ``query`` once per ``ttl`` seconds per ``key``.
+
+    Entries are keyed on the data version as well, so any committed write
+    makes the next request count again.
+    """
+    key = (data_version(), key)
+    total = lookup_count(key, ttl)
+    if total is None:
+        total = query.order_by(None).count()
+        store_count(key, total)
+    return total
+
+def lookup_count(key, ttl):
+    entry = _count_cache.get(key)
+    if entry is not None and time.monotonic() - entry[1] < ttl:
+        return entry[0]
+    return None
+
+def store_count(key, total):
+    if len(_count_cache) > 1000:
+        _count_cache.clear()
+    _count_cache[key] = (total, time.monotonic())
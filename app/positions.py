@@ -0,0 +1,230 @@
+from decimal import Decimal
+from sqlalchemy import event, select, func, case, inspect
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from app import db
+from app.archive import with_archived
+from app.lots import match_sell
+from app.models import StockTransaction, Position, LotSale
+
+# Columns of a transaction that decide what it adds to its position
+LEDGER_INPUTS = ('stock_name', 'buy_quantity', 'buy_price_per_stock', 'sell_quantity', 'sell_price_per_stock')
+LEDGER_COLUMNS = ('quantity', 'cost_basis', 'realized_profit_loss', 'open_lots')
+
+def as_decimal(value):
+    return Decimal(str(value)) if value is not None else Decimal(0)
+
+def contribution(buy_quantity, buy_price, sell_quantity, sell_price):
+    """What one transaction adds to its position, as LEDGER_COLUMNS.
+
+    Same rules as the dashboard: realized P&L needs a selling price, and
+    only lots with shares left count as held.
+    """
+    buy_price = as_decimal(buy_price)
+    sell_price = as_decimal(sell_price)
+    sold = sell_quantity or 0
+    open_quantity = max(buy_quantity - sold, 0)
+    realized = (sell_price - buy_price) * sold if sold > 0 and sell_price > 0 else Decimal(0)
+    return (open_quantity, buy_price * open_quantity, realized, 1 if open_quantity else 0)
+
+def add_contribution(deltas, values, sign=1):
+    entry = deltas.setdefault(values[0], [0, Decimal(0), Decimal(0), 0])
+    for i, value in enumerate(contribution(*values[1:])):
+        entry[i] += sign * value
+
+def record_deltas(records):
+    """Ledger deltas for rows inserted with Core, from their insert dicts."""
+    deltas = {}
+    for record in records:
+        add_contribution(deltas, [record.get(name) for name in LEDGER_INPUTS])
+    return deltas
+
+def upsert_statement(dialect_name, table):
+    """INSERT that adds onto an existing row for the same stock, if the dialect has one."""
+    if dialect_name in ('mysql', 'mariadb'):
+        statement = mysql.insert(table)
+        return statement.on_duplicate_key_update(
+            {name: table.c[name] + statement.inserted[name] for name in LEDGER_COLUMNS}
+        )
+    if dialect_name in ('sqlite', 'postgresql'):
+        statement = (sqlite if dialect_name == 'sqlite' else postgresql).insert(table)
+        return statement.on_conflict_do_update(
+            index_elements=[table.c.stock_name],
+            set_={name: table.c[name] + statement.excluded[name] for name in LEDGER_COLUMNS}
+        )
+    return None
+
+def add_to_positions(connection, deltas):
+    """Add ``deltas`` (stock name -> LEDGER_COLUMNS) onto the ledger.
+
+    One statement per call however many rows the deltas came from.
+    """
+    rows = [dict(zip(LEDGER_COLUMNS, values), stock_name=name) for name, values in deltas.items() if any(values)]
+    if not rows:
+        return
+
+    table = Position.__table__
+    statement = upsert_statement(connection.dialect.name, table)
+    if statement is not None:
+        connection.execute(statement, rows)
+        return
+
+    for row in rows:
+        changes = {name: table.c[name] + row[name] for name in LEDGER_COLUMNS}
+        result = connection.execute(table.update().where(table.c.stock_name == row['stock_name']).values(changes))
+        if result.rowcount == 0:
+            connection.execute(table.insert(), row)
+
+def ledger_statement(names=None):
+    """Positions recomputed from every transaction, archived ones included, one row per stock."""
+    t = StockTransaction
+    sold = func.coalesce(t.sell_quantity, 0)
+    sell_price = func.coalesce(t.sell_price_per_stock, 0)
+    is_open = t.buy_quantity > sold
+    open_quantity = case((is_open, t.buy_quantity - sold), else_=0)
+
+    statement = select(
+        t.stock_name,
+        func.sum(open_quantity),
+        func.sum(t.buy_price_per_stock * open_quantity),
+        func.sum(case(((sold > 0) & (sell_price > 0), (sell_price - t.buy_price_per_stock) * sold), else_=0)),
+        func.sum(case((is_open, 1), else_=0))
+    ).group_by(t.stock_name)
+    if names is not None:
+        statement = statement.where(t.stock_name.in_(names))
+    return with_archived(statement)
+
+def recomputed_positions(connection, names=None):
+    return {
+        name: (int(quantity or 0), as_decimal(cost), as_decimal(realized), int(lots or 0))
+        for name, quantity, cost, realized, lots in connection.execute(ledger_statement(names))
+    }
+
+def refresh_positions(connection, names=None):
+    """Replace the ledger rows for ``names`` (every stock if None) with a recompute."""
+    table = Position.__table__
+    if names is not None:
+        names = sorted(set(names))
+        if not names:
+            return
+    positions = recomputed_positions(connection, names)
+
+    statement = table.delete()
+    if names is not None:
+        statement = statement.where(table.c.stock_name.in_(names))
+    connection.execute(statement)
+    if positions:
+        connection.execute(table.insert(), [
+            dict(zip(LEDGER_COLUMNS, values), stock_name=name) for name, values in positions.items()
+        ])
+
+def ledger_differences(connection, tolerance=Decimal('0.01')):
+    """Stocks whose ledger row differs from a full recompute: (name, ledger, expected)."""
+    table = Position.__table__
+    ledger = {
+        row.stock_name: (row.quantity, as_decimal(row.cost_basis), as_decimal(row.realized_profit_loss), row.open_lots)
+        for row in connection.execute(select(table))
+    }
+    expected = recomputed_positions(connection)
+    empty = (0, Decimal(0), Decimal(0), 0)
+
+    differences = []
+    for name in sorted(set(ledger) | set(expected)):
+        actual, wanted = ledger.get(name, empty), expected.get(name, empty)
+        if any(abs(a - w) > tolerance for a, w in zip(actual, wanted)):
+            differences.append((name, actual, wanted))
+    return differences
+
+def _stored_inputs(connection, target):
+    table = StockTransaction.__table__
+    return tuple(connection.execute(
+        select(*(table.c[name] for name in LEDGER_INPUTS)).where(table.c.id == target.id)
+    ).one())
+
+def _inputs_changed(state):
+    return any(state.attrs[name].history.has_changes() for name in LEDGER_INPUTS)
+
+@event.listens_for(StockTransaction, 'after_insert')
+def _add_inserted(mapper, connection, target):
+    deltas = {}
+    add_contribution(deltas, [getattr(target, name) for name in LEDGER_INPUTS])
+    add_to_positions(connection, deltas)
+
+@event.listens_for(StockTransaction, 'before_update')
+def _remember_stored(mapper, connection, target):
+    # The row as the ledger last saw it, read before this UPDATE runs
+    state = inspect(target)
+    if _inputs_changed(state):
+        state.info['ledger_inputs'] = _stored_inputs(connection, target)
+
+@event.listens_for(StockTransaction, 'after_update')
+def _move_updated(mapper, connection, target):
+    state = inspect(target)
+    stored = state.info.pop('ledger_inputs', None)
+    if stored is None:
+        return
+
+    current = [
+        stored[i] if name in state.unloaded else state.dict[name]
+        for i, name in enumerate(LEDGER_INPUTS)
+    ]
+    deltas = {}
+    add_contribution(deltas, stored, -1)
+    add_contribution(deltas, current)
+    add_to_positions(connection, deltas)
+
+@event.listens_for(StockTransaction, 'before_delete')
+def _remove_deleted(mapper, connection, target):
+    deltas = {}
+    add_contribution(deltas, _stored_inputs(connection, target), -1)
+    add_to_positions(connection, deltas)
+
+def sell_lots(stock_name, quantity, price, sell_date, method):
+    """Sell ``quantity`` shares of ``stock_name`` from its open lots.
+
+    Each lot touched gets a LotSale and its running sell totals updated;
+    the ledger follows through the model events. Returns the breakdown.
+    """
+    lots = StockTransaction.query.filter(
+        StockTransaction.stock_name == stock_name,
+        StockTransaction.remaining_quantity > 0
+    ).order_by(StockTransaction.buy_date, StockTransaction.id).with_for_update().all()
+
+    allocations = match_sell([(lot, lot.buy_date, lot.remaining_quantity) for lot in lots], quantity, method)
+    recorded = dict(db.session.execute(
+        select(LotSale.transaction_id, func.sum(LotSale.quantity)).where(
+            LotSale.transaction_id.in_([lot.id for lot, _ in allocations])
+        ).group_by(LotSale.transaction_id)
+    ).all())
+
+    sold = []
+    for lot, taken in allocations:
+        buy_price = float(lot.buy_price_per_stock)
+        # Shares sold on the lot itself get a LotSale too, before record_sale
+        # moves the sell date they were recorded with
+        earlier = (lot.sell_quantity or 0) - (recorded.get(lot.id) or 0)
+        if earlier > 0:
+            db.session.add(LotSale(
+                transaction_id=lot.id, quantity=earlier, price_per_stock=lot.sell_price_per_stock,
+                sell_date=lot.sell_date or lot.buy_date, method='lot'
+            ))
+        lot.record_sale(taken, price, sell_date)
+        db.session.add(LotSale(
+            transaction_id=lot.id, quantity=taken, price_per_stock=price, sell_date=sell_date, method=method
+        ))
+        sold.append({
+            'transaction_id': lot.id,
+            'buy_date': lot.buy_date.isoformat(),
+            'quantity': taken,
+            'buy_price_per_stock': buy_price,
+            'realized_profit_loss': (price - buy_price) * taken
+        })
+
+    return {
+        'stock_name': stock_name,
+        'method': method,
+        'quantity': quantity,
+        'price_per_stock': price,
+        'sell_date': sell_date.isoformat(),
+        'realized_profit_loss': sum(lot['realized_profit_loss'] for lot in sold),
+        'lots': sold
+    }
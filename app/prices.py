@@ -0,0 +1,294 @@
+import glob
+import json
+import os
+import threading
+from datetime import date, timedelta
+import numpy as np
+import pandas as pd
+from flask import current_app
+from app import db
+from app.analytics import open_positions_statement, positions_as_of_statement
+from app.cache import bump_data_version
+
+# Accepted headers for each column of a daily close file, case-insensitive
+PRICE_COLUMNS = {
+    'symbol': ('symbol', 'stock_name', 'ticker'),
+    'date': ('date',),
+    'close': ('close', 'close_price', 'price')
+}
+EPOCH = date(1970, 1, 1)
+# Added to days before they go in the low 32 bits of a merge key
+DAY_BIAS = 1 << 31
+
+def symbol_key(name):
+    # Same normalization as StockTransaction.search_name
+    return name.strip().upper()
+
+def to_day(value):
+    return (value - EPOCH).days
+
+def from_day(day):
+    return EPOCH + timedelta(days=int(day))
+
+def to_keys(codes, days):
+    return (np.asarray(codes, dtype=np.int64) << 32) | (np.asarray(days, dtype=np.int64) + DAY_BIAS)
+
+def read_price_file(source):
+    """Symbols, days since the epoch and closes from one CSV file.
+
+    Rows with an unreadable date or a missing or non-positive close are
+    dropped; returns the three arrays and how many rows were dropped.
+    """
+    frame = pd.read_csv(source, dtype=str, keep_default_na=False)
+    headers = {header.strip().lower(): header for header in frame.columns}
+    columns = {}
+    for name, accepted in PRICE_COLUMNS.items():
+        found = next((headers[header] for header in accepted if header in headers), None)
+        if found is None:
+            raise ValueError(f'Price files need a {name} column (one of: {", ".join(accepted)})')
+        columns[name] = found
+
+    symbols = frame[columns['symbol']].str.strip().str.upper()
+    days = pd.to_datetime(frame[columns['date']].str.strip(), format='%Y-%m-%d', errors='coerce')
+    closes = pd.to_numeric(frame[columns['close']], errors='coerce')
+    valid = (symbols != '') & days.notna() & (closes > 0)
+
+    days = days[valid].to_numpy().astype('datetime64[D]').astype(np.int32)
+    return symbols[valid].to_numpy(dtype=str), days, closes[valid].to_numpy(dtype=np.float64), int((~valid).sum())
+
+class PriceStore:
+    """Daily closes per symbol in memory-mapped column files.
+
+    ``days`` (int32, days since 1970-01-01) and ``close`` (float64) hold
+    every symbol's history back to back, each symbol's slice sorted by day;
+    ``offsets`` marks where each slice starts. The symbol list and the
+    current generation are in index.json. An ingest writes a new generation
+    and swaps index.json, so readers never see half-written files.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._loaded = None
+        self._lock = threading.RLock()
+
+    def _path(self, name, generation):
+        return os.path.join(self.directory, f'{name}-{generation}.npy')
+
+    def _index_path(self):
+        return os.path.join(self.directory, 'index.json')
+
+    def _load(self):
+        """(symbol -> position, symbols, offsets, days, closes), reloaded when index.json changes."""
+        try:
+            stamp = os.stat(self._index_path()).st_mtime_ns
+        except FileNotFoundError:
+            return {}, [], np.zeros(1, dtype=np.int64), np.zeros(0, dtype=np.int32), np.zeros(0)
+
+        with self._lock:
+            if self._loaded is None or self._loaded[0] != stamp:
+                with open(self._index_path()) as f:
+                    index = json.load(f)
+                generation = index['generation']
+                self._loaded = (stamp, (
+                    {symbol: i for i, symbol in enumerate(index['symbols'])},
+                    index['symbols'],
+                    np.load(self._path('offsets', generation)),
+                    np.load(self._path('days', generation), mmap_mode='r'),
+                    np.load(self._path('close', generation), mmap_mode='r')
+                ))
+            return self._loaded[1]
+
+    def lookup(self, symbols, as_of=None):
+        """Close and its day for each symbol, the last one on or before ``as_of``.
+
+        One vectorized binary search over every symbol's slice at once;
+        symbols without a price get NaN and day -1.
+        """
+        positions, _, offsets, days, closes = self._load()
+        codes = np.array([positions.get(symbol, -1) for symbol in symbols], dtype=np.int64)
+        known = codes >= 0
+        start = offsets[codes[known]]
+        end = offsets[codes[known] + 1]
+
+        if as_of is None:
+            found = end - 1
+        else:
+            # First position in each slice with a day after as_of
+            target = to_day(as_of)
+            lo, hi = start.copy(), end.copy()
+            active = lo < hi
+            while active.any():
+                mid = (lo + hi) // 2
+                after = days[np.minimum(mid, len(days) - 1)] > target
+                lo = np.where(active & ~after, mid + 1, lo)
+                hi = np.where(active & after, mid, hi)
+                active = lo < hi
+            found = lo - 1
+
+        priced = found >= start
+        rows = np.flatnonzero(known)[priced]
+        price = np.full(len(codes), np.nan)
+        price_day = np.full(len(codes), -1, dtype=np.int64)
+        price[rows] = closes[found[priced]]
+        price_day[rows] = days[found[priced]]
+        return price, price_day
+
+    def summary(self):
+        _, symbols, offsets, days, _ = self._load()
+        first = days[offsets[:-1]]
+        last = days[offsets[1:] - 1]
+        return {
+            'symbols': len(symbols),
+            'points': int(offsets[-1]),
+            'first_date': from_day(first.min()).isoformat() if len(first) else None,
+            'last_date': from_day(last.max()).isoformat() if len(last) else None
+        }
+
+    def ingest(self, symbols, days, closes):
+        """Merge new closes into the store; a new close replaces a stored one for the same day.
+
+        Stored closes are already in order, so only the new ones are sorted
+        and then inserted in place. The merged columns are written as a new
+        generation, so one ingest should run at a time.
+        """
+        with self._lock:
+            _, stored, offsets, stored_days, stored_closes = self._load()
+            stored = np.array(stored, dtype=str)
+            names = np.union1d(stored, symbols)
+
+            # (symbol, day) as one sortable int64
+            stored_codes = np.repeat(np.searchsorted(names, stored), np.diff(offsets))
+            stored_keys = to_keys(stored_codes, stored_days)
+            keys = to_keys(np.searchsorted(names, symbols), days)
+
+            # Last new close of each (symbol, day), in key order
+            order = np.argsort(keys, kind='stable')
+            keys, closes = keys[order], np.asarray(closes, dtype=np.float64)[order]
+            last = np.ones(len(keys), dtype=bool)
+            last[:-1] = keys[1:] != keys[:-1]
+            keys, closes = keys[last], closes[last]
+
+            stored_closes = np.asarray(stored_closes)
+            if len(keys):
+                kept = keys[np.minimum(np.searchsorted(keys, stored_keys), len(keys) - 1)] != stored_keys
+                stored_keys, stored_closes = stored_keys[kept], stored_closes[kept]
+
+            at = np.searchsorted(stored_keys, keys)
+            merged_keys = np.insert(stored_keys, at, keys)
+            merged_closes = np.insert(stored_closes, at, closes)
+            merged_codes = merged_keys >> 32
+            merged_days = ((merged_keys & 0xFFFFFFFF) - DAY_BIAS).astype(np.int32)
+
+            new_offsets = np.searchsorted(merged_codes, np.arange(len(names) + 1)).astype(np.int64)
+            self._write(names.tolist(), new_offsets, merged_days, merged_closes)
+            return len(names), len(merged_keys)
+
+    def _write(self, symbols, offsets, days, closes):
+        os.makedirs(self.directory, exist_ok=True)
+        try:
+            with open(self._index_path()) as f:
+                generation = json.load(f)['generation'] + 1
+        except FileNotFoundError:
+            generation = 1
+
+        np.save(self._path('offsets', generation), offsets)
+        np.save(self._path('days', generation), days)
+        np.save(self._path('close', generation), closes)
+        temporary = self._index_path() + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({'generation': generation, 'symbols': symbols}, f)
+        os.replace(temporary, self._index_path())
+
+        # Open maps keep old files readable on POSIX; elsewhere they are
+        # left for the next ingest to clean up
+        for path in glob.glob(os.path.join(self.directory, '*-*.npy')):
+            if not path.endswith(f'-{generation}.npy'):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+def get_store():
+    store = current_app.extensions.get('price_store')
+    if store is None:
+        directory = current_app.config['PRICE_STORE_DIR'] or os.path.join(current_app.instance_path, 'prices')
+        store = current_app.extensions.setdefault('price_store', PriceStore(directory))
+    return store
+
+def import_price_files(sources):
+    """Ingest daily close CSV files (paths or file objects) into the store."""
+    parts = [read_price_file(source) for source in sources]
+    if not parts:
+        raise ValueError('No price files given')
+    symbols, days, closes = (np.concatenate([part[i] for part in parts]) for i in range(3))
+
+    symbol_count, points = get_store().ingest(symbols, days, closes)
+    # Cached valuations are stale now, though no transaction changed
+    bump_data_version(set())
+    return {
+        'rows_imported': len(symbols),
+        'rows_skipped': sum(part[3] for part in parts),
+        'symbols': symbol_count,
+        'points': points
+    }
+
+def value_positions(rows, store, as_of=None):
+    """Mark ``rows`` of (stock_name, quantity, cost_basis) to market.
+
+    Prices come from one lookup for all rows and the arithmetic runs on
+    whole columns. Totals only cover positions with a price; the others
+    are listed under ``unpriced``.
+    """
+    names = [row[0] for row in rows]
+    quantity = np.array([row[1] for row in rows], dtype=np.float64)
+    cost = np.array([float(row[2] or 0) for row in rows], dtype=np.float64)
+    price, price_day = store.lookup([symbol_key(name) for name in names], as_of)
+
+    priced = ~np.isnan(price)
+    market_value = quantity * price
+    unrealized = market_value - cost
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentage = np.where(cost > 0, unrealized / cost * 100, 0.0)
+
+    # Whole columns to Python values at once; None where there is no price
+    price_dates = price_day.astype('datetime64[D]').astype(str)
+    columns = zip(
+        names, quantity.astype(np.int64).tolist(), np.round(cost, 4).tolist(), price.tolist(),
+        price_dates.tolist(), np.round(market_value, 4).tolist(), np.round(unrealized, 4).tolist(),
+        np.round(percentage, 4).tolist(), priced.tolist()
+    )
+    positions = [
+        {
+            'stock_name': name,
+            'quantity': held,
+            'cost_basis': cost_basis,
+            'price': close if has_price else None,
+            'price_date': price_date if has_price else None,
+            'market_value': value if has_price else None,
+            'unrealized_profit_loss': profit_loss if has_price else None,
+            'unrealized_profit_loss_percentage': profit_loss_percentage if has_price else None
+        }
+        for name, held, cost_basis, close, price_date, value, profit_loss, profit_loss_percentage, has_price in columns
+    ]
+
+    priced_cost = float(cost[priced].sum())
+    total_unrealized = float(unrealized[priced].sum())
+    return {
+        'as_of': as_of.isoformat() if as_of else None,
+        'positions': positions,
+        'totals': {
+            'cost_basis': round(priced_cost, 4),
+            'market_value': round(float(market_value[priced].sum()), 4),
+            'unrealized_profit_loss': round(total_unrealized, 4),
+            'unrealized_profit_loss_percentage': round(total_unrealized / priced_cost * 100, 4) if priced_cost else 0.0,
+            'priced_positions': int(priced.sum()),
+            'unpriced_positions': int((~priced).sum()),
+            'unpriced_cost_basis': round(float(cost[~priced].sum()), 4)
+        },
+        'unpriced': [name for name, has_price in zip(names, priced) if not has_price]
+    }
+
+def compute_valuation(as_of=None):
+    """Open positions at the latest prices, or held shares and prices as of a day."""
+    statement = open_positions_statement() if as_of is None else positions_as_of_statement(as_of)
+    return value_positions(db.session.execute(statement).all(), get_store(), as_of)
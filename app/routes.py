@@ -1,14 +1,30 @@
-from flask import Blueprint, render_template, request, jsonify, make_response, send_file
+from flask import Blueprint, render_template, request, jsonify, make_response, send_file, current_app, Response, stream_with_context, url_for
 from app import db
-from app.models import StockTransaction
+from app.models import StockTransaction, ImportJob, Position, import_message
+from app.archive import include_archived
+from app.analytics import TIMESERIES_BUCKETS, compute_stats, compute_holdings, compute_timeseries, columnar_replica
+from app.bulk import Batch, parse_new_transaction, parse_changes, bulk_condition, bulk_update
+from app.cache import cached_response, mark_data_changed
+from app.exports import iter_csv, gzip_chunks, write_excel, export_condition, iter_arrow, iter_parquet, ARROW_MIMETYPE, PARQUET_MIMETYPE
+from app.jobs import submit_export, get_job
+from app.live import get_feed, parse_seq, iter_sse, long_poll
+from app.metrics import render_metrics
+from app.positions import sell_lots
+from app.serializers import parse_fields, transaction_query, serialize_rows, json_response
+from app.routing import replica_read
+from app.search import apply_search, complete_symbols
+from app.pagination import SORTABLE_COLUMNS, keyset_page, decode_cursor, cached_count
 from datetime import datetime
-import pandas as pd
+import csv
 import io
 import os
+import tempfile
 from sqlalchemy import func, desc, asc
 
 main = Blueprint('main', __name__)
 
+EXCEL_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
 @main.route('/')
 def index():
     return render_template('index.html')
@@ -17,21 +33,35 @@ def index():
 def dashboard():
     return render_template('dashboard.html')
 
+@main.route('/metrics')
+def metrics():
+    if 'metrics' not in current_app.extensions:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 # API Routes
 @main.route('/api/transactions', methods=['GET'])
+@replica_read
+@cached_response()
 def get_transactions():
+    # DataTables server-side requests always carry a draw counter
+    if 'draw' in request.args:
+        return get_transactions_datatables()
+    
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
         search = request.args.get('search', '')
         sort_by = request.args.get('sort_by', 'created_at')
         sort_order = request.args.get('sort_order', 'desc')
+        fields = parse_fields(request.args.get('fields'))
+        archived = include_archived(request.args)
         
-        query = StockTransaction.query
+        query = transaction_query(fields, include_archived=archived)
         
         # Search functionality
         if search:
-            query = query.filter(StockTransaction.stock_name.contains(search))
+            query = apply_search(query, search, archived)
         
         # Sorting
         if hasattr(StockTransaction, sort_by):
@@ -51,20 +81,92 @@ def get_transactions():
             total = paginated.total
             pages = paginated.pages
         
-        return jsonify({
-            'transactions': [t.to_dict() for t in transactions],
+        return json_response({
+            'transactions': serialize_rows(transactions, fields),
             'total': total,
             'pages': pages,
             'current_page': page
         })
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def get_transactions_datatables():
+    try:
+        draw = request.args.get('draw', 0, type=int)
+        start = max(request.args.get('start', 0, type=int), 0)
+        length = request.args.get('length', 25, type=int)
+        search = request.args.get('search[value]', '').strip()
+        
+        # Resolve the ordered column through the grid's column list
+        order_index = request.args.get('order[0][column]', type=int)
+        sort_by = request.args.get(f'columns[{order_index}][data]', 'created_at')
+        sort_order = 'asc' if request.args.get('order[0][dir]') == 'asc' else 'desc'
+        if sort_by not in SORTABLE_COLUMNS:
+            sort_by, sort_order = 'created_at', 'desc'
+        
+        if length < 1:
+            length = 25
+        
+        fields = parse_fields(request.args.get('fields'))
+        archived = include_archived(request.args)
+        
+        ttl = current_app.config['COUNT_CACHE_TTL']
+        records_total = cached_count(StockTransaction.query.execution_options(include_archived=archived), ('', archived), ttl)
+        
+        # The keyset cursor needs the sort value and id of the last row
+        query = transaction_query(fields, extra=(sort_by, 'id'), include_archived=archived)
+        
+        if search:
+            query = apply_search(query, search, archived)
+            records_filtered = cached_count(query, (search, archived), ttl)
+        else:
+            records_filtered = records_total
+        
+        try:
+            cursor = decode_cursor(request.args.get('cursor'), sort_by)
+        except (ValueError, TypeError):
+            cursor = None
+        
+        transactions, next_cursor = keyset_page(
+            query, sort_by, sort_order, length,
+            cursor=cursor, start=start, total=records_filtered
+        )
+        
+        return json_response({
+            'draw': draw,
+            'recordsTotal': records_total,
+            'recordsFiltered': records_filtered,
+            'data': serialize_rows(transactions, fields),
+            'next_cursor': next_cursor
+        })
+    except ValueError as e:
+        return jsonify({'draw': request.args.get('draw', 0, type=int), 'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'draw': request.args.get('draw', 0, type=int), 'error': str(e)}), 500
+
 @main.route('/api/transactions/<int:transaction_id>', methods=['GET'])
+@replica_read
+@cached_response()
 def get_transaction(transaction_id):
     try:
-        transaction = StockTransaction.query.get_or_404(transaction_id)
-        return jsonify(transaction.to_dict())
+        fields = parse_fields(request.args.get('fields'))
+        query = transaction_query(fields, include_archived=include_archived(request.args))
+        row = query.filter(StockTransaction.id == transaction_id).first_or_404()
+        return json_response(serialize_rows([row], fields)[0])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/symbols')
+@replica_read
+def symbol_suggestions():
+    try:
+        prefix = request.args.get('q', '')
+        limit = min(request.args.get('limit', 10, type=int), 50)
+        return jsonify({'symbols': complete_symbols(prefix, limit)})
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -73,34 +175,13 @@ def create_transaction():
     try:
         data = request.get_json()
         
-        # Validate required fields
-        required_fields = ['stock_name', 'buy_quantity', 'buy_price_per_stock', 'buy_date']
-        for field in required_fields:
-            if field not in data or data[field] is None:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # Parse date
+        # Same checks as each item of a batch
         try:
-            buy_date = datetime.strptime(data['buy_date'], '%Y-%m-%d').date()
-        except ValueError:
-            return jsonify({'error': 'Invalid buy_date format. Use YYYY-MM-DD'}), 400
+            values = parse_new_transaction(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        sell_date = None
-        if data.get('sell_date'):
-            try:
-                sell_date = datetime.strptime(data['sell_date'], '%Y-%m-%d').date()
-            except ValueError:
-                return jsonify({'error': 'Invalid sell_date format. Use YYYY-MM-DD'}), 400
-        
-        transaction = StockTransaction(
-            stock_name=data['stock_name'],
-            buy_quantity=int(data['buy_quantity']),
-            buy_price_per_stock=float(data['buy_price_per_stock']),
-            buy_date=buy_date,
-            sell_quantity=int(data.get('sell_quantity', 0)),
-            sell_price_per_stock=float(data.get('sell_price_per_stock', 0.0)),
-            sell_date=sell_date
-        )
+        transaction = StockTransaction(**values)
         
         db.session.add(transaction)
         db.session.commit()
@@ -144,6 +225,48 @@ def update_transaction(transaction_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@main.route('/api/transactions', methods=['PATCH'])
+def bulk_update_transactions():
+    try:
+        data = request.get_json() or {}
+        changes = parse_changes(data.get('set'))
+        
+        # One UPDATE for the whole selection; no rows are loaded
+        updated = bulk_update(bulk_condition(data), changes)
+        mark_data_changed(db.session)
+        db.session.commit()
+        
+        return jsonify({'message': f'Updated {updated} transactions', 'updated': updated})
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/transactions/batch', methods=['POST'])
+def batch_transactions():
+    try:
+        data = request.get_json()
+        atomic = data.get('atomic', True) if isinstance(data, dict) else True
+        batch = Batch(data, current_app.config['BATCH_MAX_ITEMS'])
+        
+        # All-or-nothing batches write nothing if any item is invalid
+        if atomic and batch.failed:
+            return jsonify({'atomic': True, 'applied': False, 'failed': batch.failed, **batch.results}), 400
+        
+        results = batch.apply()
+        db.session.commit()
+        
+        status = 207 if batch.failed else 200
+        return jsonify({'atomic': atomic, 'applied': batch.pending, 'failed': batch.failed, **results}), status
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @main.route('/api/transactions/<int:transaction_id>', methods=['DELETE'])
 def delete_transaction(transaction_id):
     try:
@@ -157,137 +280,281 @@ def delete_transaction(transaction_id):
         return jsonify({'error': str(e)}), 500
 
 @main.route('/api/dashboard/stats')
+@replica_read
+@cached_response()
 def dashboard_stats():
     try:
-        # Total transactions
-        total_transactions = StockTransaction.query.count()
+        stats = compute_stats()
+        
+        return jsonify({
+            'total_transactions': stats['total_transactions'],
+            'total_investment': stats['total_investment'],
+            'total_returns': stats['total_returns'],
+            'net_profit_loss': stats['net_profit_loss'],
+            'active_stocks': stats['active_stocks']
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/dashboard/summary')
+@replica_read
+@cached_response()
+def dashboard_summary():
+    try:
+        # numpy is only loaded by the routes that value positions
+        from app.prices import compute_valuation
+        
+        # Everything the dashboard shows, sized by distinct stocks not rows
+        return jsonify({
+            'stats': compute_stats(),
+            'holdings': compute_holdings(),
+            'valuation': compute_valuation()['totals']
+        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/stream/dashboard')
+def stream_dashboard():
+    # A snapshot first, then deltas as writes commit; EventSource resumes
+    # from Last-Event-ID after a reconnect
+    feed = get_feed()
+    seq = parse_seq(request.headers.get('Last-Event-ID') or request.args.get('since'))
+    heartbeat = current_app.config['LIVE_HEARTBEAT_SECONDS']
+    
+    response = Response(iter_sse(feed, seq, heartbeat), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@main.route('/api/stream/dashboard/poll')
+def poll_dashboard():
+    # Long-poll fallback for clients without EventSource
+    try:
+        seq = parse_seq(request.args.get('since'))
+        return jsonify(long_poll(get_feed(), seq, current_app.config['LIVE_POLL_TIMEOUT']))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/analytics/timeseries')
+@cached_response()
+def analytics_timeseries():
+    # Not replica_read: the cached days are patched from what this reads
+    try:
+        bucket = request.args.get('bucket', 'month')
+        if bucket not in TIMESERIES_BUCKETS:
+            return jsonify({'error': f'bucket must be one of: {", ".join(TIMESERIES_BUCKETS)}'}), 400
+        
+        return jsonify({'bucket': bucket, 'series': compute_timeseries(bucket)})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/analytics/columnar')
+def columnar_report():
+    # Memory held by the columnar replica; ?check=true also compares it
+    # row by row with the table
+    try:
+        replica = columnar_replica()
+        if replica is None:
+            return jsonify({'error': 'The columnar replica is switched off (COLUMNAR_REPLICA_ENABLED)'}), 404
+        
+        report = replica.report()
+        if request.args.get('check') == 'true':
+            report['check'] = replica.check()
+        return jsonify(report)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/positions')
+@replica_read
+@cached_response()
+def get_positions():
+    try:
+        query = Position.query
+        if request.args.get('include_closed') != 'true':
+            query = query.filter(Position.quantity > 0)
+        positions = query.order_by(Position.quantity.desc(), Position.stock_name).all()
         
-        # Total investment (sum of all total_cost)
-        total_investment = db.session.query(func.sum(StockTransaction.total_cost)).scalar() or 0.0
+        return jsonify({'positions': [position.to_dict() for position in positions]})
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/positions/<stock_name>/sell', methods=['POST'])
+def sell_position(stock_name):
+    try:
+        data = request.get_json() or {}
+        try:
+            quantity = int(data['quantity'])
+            price = float(data['price_per_stock'])
+            sell_date = datetime.strptime(data['sell_date'], '%Y-%m-%d').date() if data.get('sell_date') else datetime.now().date()
+        except (KeyError, TypeError, ValueError):
+            return jsonify({'error': 'Give quantity, price_per_stock and optionally sell_date as YYYY-MM-DD'}), 400
+        if price <= 0:
+            return jsonify({'error': 'price_per_stock must be positive'}), 400
+        
+        method = data.get('method', current_app.config['POSITION_LOT_METHOD'])
+        sale = sell_lots(stock_name, quantity, price, sell_date, method)
+        db.session.commit()
         
-        # Total returns (sum of all total_selling_cost)
-        total_returns = db.session.query(func.sum(StockTransaction.total_selling_cost)).scalar() or 0.0
+        return jsonify(sale)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/portfolio/valuation')
+@replica_read
+@cached_response()
+def portfolio_valuation():
+    try:
+        from app.prices import compute_valuation
         
-        # Calculate net profit/loss properly
-        # For each transaction, calculate the proportional cost of sold stocks and compare with returns
-        net_profit_loss = 0.0
-        transactions = StockTransaction.query.all()
+        as_of = request.args.get('as_of')
+        if as_of:
+            try:
+                as_of = datetime.strptime(as_of, '%Y-%m-%d').date()
+            except ValueError:
+                return jsonify({'error': 'Invalid as_of format. Use YYYY-MM-DD'}), 400
         
-        for t in transactions:
-            if t.sell_quantity > 0 and t.total_selling_cost > 0:
-                # Calculate the cost of the sold portion
-                sold_cost_ratio = float(t.sell_quantity) / float(t.buy_quantity)
-                proportional_buy_cost = float(t.total_cost) * sold_cost_ratio
-                transaction_profit = float(t.total_selling_cost) - proportional_buy_cost
-                net_profit_loss += transaction_profit
+        return jsonify(compute_valuation(as_of or None))
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/prices/import', methods=['POST'])
+def import_prices():
+    try:
+        from app.prices import import_price_files
         
-        # Active stocks (with remaining quantity > 0)
-        active_stocks = StockTransaction.query.filter(StockTransaction.remaining_quantity > 0).count()
+        files = [f for f in request.files.getlist('file') if f.filename]
+        if not files:
+            return jsonify({'error': 'No file provided'}), 400
         
-        return jsonify({
-            'total_transactions': total_transactions,
-            'total_investment': float(total_investment),
-            'total_returns': float(total_returns),
-            'net_profit_loss': net_profit_loss,
-            'active_stocks': active_stocks
-        })
+        return jsonify(import_price_files([f.stream for f in files]))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @main.route('/api/export/csv')
+@replica_read
+@cached_response(per_day=True)
 def export_csv():
     try:
-        transactions = StockTransaction.query.all()
-        
-        data = []
-        for t in transactions:
-            # Calculate holding days
-            if t.buy_date:
-                end_date = t.sell_date if t.sell_date else datetime.now().date()
-                holding_days = (end_date - t.buy_date).days
-            else:
-                holding_days = 0
-                
-            data.append({
-                'ID': t.id,
-                'Stock Name': t.stock_name,
-                'Buy Quantity': t.buy_quantity,
-                'Buy Price per Stock': float(t.buy_price_per_stock),
-                'Total Cost': float(t.total_cost),
-                'Buy Date': t.buy_date.isoformat() if t.buy_date else '',
-                'Sell Quantity': t.sell_quantity,
-                'Sell Price per Stock': float(t.sell_price_per_stock) if t.sell_price_per_stock else 0.0,
-                'Total Selling Cost': float(t.total_selling_cost) if t.total_selling_cost else 0.0,
-                'Sell Date': t.sell_date.isoformat() if t.sell_date else '',
-                'Holding Days': holding_days,
-                'Remaining Quantity': t.remaining_quantity,
-                'Profit/Loss %': float(t.profit_loss_percentage) if t.profit_loss_percentage else 0.0,
-                'Created At': t.created_at.isoformat() if t.created_at else '',
-                'Updated At': t.updated_at.isoformat() if t.updated_at else ''
-            })
-        
-        df = pd.DataFrame(data)
+        chunks = iter_csv(current_app.config['EXPORT_BATCH_SIZE'], include_archived(request.args))
         
-        output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
+        accepts_gzip = 'gzip' in request.headers.get('Accept-Encoding', '')
+        use_gzip = current_app.config['EXPORT_GZIP'] and accepts_gzip
+        if use_gzip:
+            chunks = gzip_chunks(chunks)
         
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'text/csv'
+        response = Response(stream_with_context(chunks), mimetype='text/csv')
         response.headers['Content-Disposition'] = 'attachment; filename=stock_transactions.csv'
+        response.headers['Vary'] = 'Accept-Encoding'
+        if use_gzip:
+            response.headers['Content-Encoding'] = 'gzip'
         
         return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def columnar_export(write, mimetype, filename):
+    # pyarrow is loaded by the first batch, not when the route is registered
+    try:
+        condition = export_condition(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    chunks = write(condition, current_app.config['EXPORT_COLUMNAR_BATCH_SIZE'], include_archived(request.args))
+    response = Response(stream_with_context(chunks), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@main.route('/api/export/arrow')
+@replica_read
+@cached_response(per_day=True)
+def export_arrow():
+    try:
+        return columnar_export(iter_arrow, ARROW_MIMETYPE, 'stock_transactions.arrows')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/export/parquet')
+@replica_read
+@cached_response(per_day=True)
+def export_parquet():
+    try:
+        return columnar_export(iter_parquet, PARQUET_MIMETYPE, 'stock_transactions.parquet')
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @main.route('/api/export/excel')
+@replica_read
+@cached_response(per_day=True)
 def export_excel():
     try:
-        transactions = StockTransaction.query.all()
-        
-        data = []
-        for t in transactions:
-            # Calculate holding days
-            if t.buy_date:
-                end_date = t.sell_date if t.sell_date else datetime.now().date()
-                holding_days = (end_date - t.buy_date).days
-            else:
-                holding_days = 0
-                
-            data.append({
-                'ID': t.id,
-                'Stock Name': t.stock_name,
-                'Buy Quantity': t.buy_quantity,
-                'Buy Price per Stock': float(t.buy_price_per_stock),
-                'Total Cost': float(t.total_cost),
-                'Buy Date': t.buy_date.isoformat() if t.buy_date else '',
-                'Sell Quantity': t.sell_quantity,
-                'Sell Price per Stock': float(t.sell_price_per_stock) if t.sell_price_per_stock else 0.0,
-                'Total Selling Cost': float(t.total_selling_cost) if t.total_selling_cost else 0.0,
-                'Sell Date': t.sell_date.isoformat() if t.sell_date else '',
-                'Holding Days': holding_days,
-                'Remaining Quantity': t.remaining_quantity,
-                'Profit/Loss %': float(t.profit_loss_percentage) if t.profit_loss_percentage else 0.0,
-                'Created At': t.created_at.isoformat() if t.created_at else '',
-                'Updated At': t.updated_at.isoformat() if t.updated_at else ''
-            })
-        
-        df = pd.DataFrame(data)
-        
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Stock Transactions')
-        
+        output = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        write_excel(output, current_app.config['EXPORT_BATCH_SIZE'], include_archived(request.args))
         output.seek(0)
         
-        response = make_response(output.getvalue())
-        response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-        response.headers['Content-Disposition'] = 'attachment; filename=stock_transactions.xlsx'
+        return send_file(
+            output,
+            mimetype=EXCEL_MIMETYPE,
+            as_attachment=True,
+            download_name='stock_transactions.xlsx'
+        )
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/export/excel/jobs', methods=['POST'])
+def create_excel_export_job():
+    try:
+        batch_size = current_app.config['EXPORT_BATCH_SIZE']
+        archived = include_archived(request.args)
+        job_id = submit_export(
+            current_app._get_current_object(),
+            'excel',
+            lambda path: write_excel(path, batch_size, archived),
+            '.xlsx'
+        )
         
-        return response
+        return jsonify({
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': url_for('main.export_job_status', job_id=job_id),
+            'download_url': url_for('main.download_export_job', job_id=job_id)
+        }), 202
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@main.route('/api/export/jobs/<job_id>')
+def export_job_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    
+    return jsonify({
+        'job_id': job['id'],
+        'kind': job['kind'],
+        'status': job['status'],
+        'error': job['error']
+    })
+
+@main.route('/api/export/jobs/<job_id>/download')
+def download_export_job(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Export job not found'}), 404
+    if job['status'] != 'finished':
+        return jsonify({'error': f'Export job is {job["status"]}'}), 409
+    
+    return send_file(
+        job['path'],
+        mimetype=EXCEL_MIMETYPE,
+        as_attachment=True,
+        download_name='stock_transactions.xlsx'
+    )
+
 @main.route('/api/sample-csv')
 def download_sample_csv():
     try:
@@ -308,7 +575,7 @@ def download_sample_csv():
                 'buy_price_per_stock': 3200.00,
                 'buy_date': '2024-01-10',
                 'sell_quantity': 0,
-                'sell_price_per_stock': 0,
+                'sell_price_per_stock': 0.0,
                 'sell_date': ''
             },
             {
@@ -322,11 +589,11 @@ def download_sample_csv():
             }
         ]
         
-        df = pd.DataFrame(sample_data)
-        
+        # Plain csv module: the template is too small to need pandas
         output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
+        writer = csv.DictWriter(output, fieldnames=list(sample_data[0]), lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(sample_data)
         
         response = make_response(output.getvalue())
         response.headers['Content-Type'] = 'text/csv'
@@ -338,6 +605,10 @@ def download_sample_csv():
 
 @main.route('/api/bulk-import', methods=['POST'])
 def bulk_import_csv():
+    # pandas is only loaded by the import routes, not at startup
+    import pandas as pd
+    from app.importer import REQUIRED_COLUMNS, validate_frame, import_rows
+    
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided'}), 400
@@ -356,90 +627,26 @@ def bulk_import_csv():
             return jsonify({'error': f'Failed to read CSV file: {str(e)}'}), 400
         
         # Validate required columns
-        required_columns = ['stock_name', 'buy_quantity', 'buy_price_per_stock', 'buy_date']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in REQUIRED_COLUMNS if col not in df.columns]
         
         if missing_columns:
             return jsonify({'error': f'Missing required columns: {", ".join(missing_columns)}'}), 400
         
-        # Process each row
-        successful_imports = 0
-        errors = []
+        # Validate every row column-wise, then insert new rows and update
+        # changed ones in batches; rows imported before are matched by key
+        rows, errors = validate_frame(df)
+        inserted, updated, unchanged = import_rows(rows, current_app.config['IMPORT_BATCH_SIZE'])
         
-        for index, row in df.iterrows():
-            try:
-                # Validate required fields
-                if pd.isna(row['stock_name']) or not row['stock_name'].strip():
-                    errors.append(f'Row {index + 2}: Missing stock name')
-                    continue
-                
-                if pd.isna(row['buy_quantity']) or row['buy_quantity'] <= 0:
-                    errors.append(f'Row {index + 2}: Invalid buy quantity')
-                    continue
-                
-                if pd.isna(row['buy_price_per_stock']) or row['buy_price_per_stock'] <= 0:
-                    errors.append(f'Row {index + 2}: Invalid buy price')
-                    continue
-                
-                if pd.isna(row['buy_date']):
-                    errors.append(f'Row {index + 2}: Missing buy date')
-                    continue
-                
-                # Parse dates
-                try:
-                    buy_date = datetime.strptime(str(row['buy_date']), '%Y-%m-%d').date()
-                except ValueError:
-                    try:
-                        buy_date = datetime.strptime(str(row['buy_date']), '%m/%d/%Y').date()
-                    except ValueError:
-                        errors.append(f'Row {index + 2}: Invalid buy date format (use YYYY-MM-DD or MM/DD/YYYY)')
-                        continue
-                
-                sell_date = None
-                if 'sell_date' in row and not pd.isna(row['sell_date']) and str(row['sell_date']).strip():
-                    try:
-                        sell_date = datetime.strptime(str(row['sell_date']), '%Y-%m-%d').date()
-                    except ValueError:
-                        try:
-                            sell_date = datetime.strptime(str(row['sell_date']), '%m/%d/%Y').date()
-                        except ValueError:
-                            errors.append(f'Row {index + 2}: Invalid sell date format (use YYYY-MM-DD or MM/DD/YYYY)')
-                            continue
-                
-                # Get optional fields
-                sell_quantity = int(row.get('sell_quantity', 0)) if not pd.isna(row.get('sell_quantity', 0)) else 0
-                sell_price_per_stock = float(row.get('sell_price_per_stock', 0)) if not pd.isna(row.get('sell_price_per_stock', 0)) else 0.0
-                
-                # Validate sell quantity doesn't exceed buy quantity
-                if sell_quantity > row['buy_quantity']:
-                    errors.append(f'Row {index + 2}: Sell quantity cannot exceed buy quantity')
-                    continue
-                
-                # Create transaction
-                transaction = StockTransaction(
-                    stock_name=str(row['stock_name']).strip(),
-                    buy_quantity=int(row['buy_quantity']),
-                    buy_price_per_stock=float(row['buy_price_per_stock']),
-                    buy_date=buy_date,
-                    sell_quantity=sell_quantity,
-                    sell_price_per_stock=sell_price_per_stock,
-                    sell_date=sell_date
-                )
-                
-                db.session.add(transaction)
-                successful_imports += 1
-                
-            except Exception as e:
-                errors.append(f'Row {index + 2}: {str(e)}')
-                continue
-        
-        # Commit all transactions
-        if successful_imports > 0:
+        if inserted or updated:
+            mark_data_changed(db.session)
             db.session.commit()
         
         response_data = {
-            'message': f'Successfully imported {successful_imports} transactions',
-            'successful_imports': successful_imports,
+            'message': import_message(inserted, updated, unchanged),
+            'successful_imports': inserted,
+            'inserted': inserted,
+            'updated': updated,
+            'unchanged': unchanged,
             'total_rows': len(df),
             'errors': errors
         }
@@ -451,4 +658,66 @@ def bulk_import_csv():
         
     except Exception as e:
         db.session.rollback()
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/bulk-import/jobs', methods=['POST'])
+def create_import_job():
+    from app.importer import spool_upload, start_import_job
+    
+    try:
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        
+        if not file.filename.lower().endswith('.csv'):
+            return jsonify({'error': 'File must be a CSV'}), 400
+        
+        # Spool to disk so the file is parsed in chunks, not held in memory
+        spool_path, total_rows = spool_upload(file, current_app.config['IMPORT_SPOOL_DIR'])
+        
+        job = ImportJob(filename=file.filename, spool_path=spool_path, total_rows=total_rows)
+        db.session.add(job)
+        db.session.commit()
+        
+        start_import_job(current_app._get_current_object(), job.id)
+        
+        response_data = job.to_dict()
+        response_data['status_url'] = url_for('main.import_job_status', job_id=job.id)
+        return jsonify(response_data), 202
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/bulk-import/jobs/<int:job_id>')
+def import_job_status(job_id):
+    try:
+        job = ImportJob.query.get_or_404(job_id)
+        return jsonify(job.to_dict())
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@main.route('/api/bulk-import/jobs/<int:job_id>/resume', methods=['POST'])
+def resume_import_job(job_id):
+    from app.importer import start_import_job, import_job_active
+    
+    try:
+        job = ImportJob.query.get_or_404(job_id)
+        if job.status == 'finished':
+            return jsonify({'error': 'Import job has already finished'}), 409
+        
+        if import_job_active(job.id):
+            return jsonify({'error': 'Import job is already running'}), 409
+        
+        # Carries on after the last committed chunk
+        job.status = 'queued'
+        db.session.commit()
+        start_import_job(current_app._get_current_object(), job.id)
+        
+        response_data = job.to_dict()
+        response_data['status_url'] = url_for('main.import_job_status', job_id=job.id)
+        return jsonify(response_data), 202
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
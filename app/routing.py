@@ -0,0 +1,72 @@
+import time
+from functools import wraps
+from flask import current_app, g, request, has_app_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+
+REPLICA_BIND = 'replica'
+STICKY_COOKIE = 'db_primary_until'
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica when the request allows it.
+
+    Anything that writes, or runs while the session holds changes, flushed
+    or not, stays on the primary until the transaction ends.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._reads_from_replica(clause):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _reads_from_replica(self, clause):
+        if not has_app_context() or g.get('db_route') != REPLICA_BIND:
+            return False
+        if self._flushing or getattr(clause, 'is_dml', False):
+            # Later reads in this transaction must see what it wrote
+            self.info['wrote_to_primary'] = True
+            return False
+        if self.info.get('wrote_to_primary'):
+            return False
+        return not (self.new or self.dirty or self.deleted)
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _forget_writes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('wrote_to_primary', None)
+
+def replica_configured():
+    return REPLICA_BIND in current_app.config.get('SQLALCHEMY_BINDS', {})
+
+def recently_wrote(cookies=None):
+    # Set on responses to successful writes, for read-your-writes
+    cookies = request.cookies if cookies is None else cookies
+    try:
+        return float(cookies.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+def replica_read(view):
+    """Route the view's queries to the read replica, if one is configured."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if replica_configured() and not recently_wrote():
+            g.db_route = REPLICA_BIND
+        return view(*args, **kwargs)
+    return wrapper
+
+def replica_may_lag(last_write):
+    # A replica read this soon after a write may not include it yet
+    window = current_app.config['REPLICA_STICKY_SECONDS']
+    return g.get('db_route') == REPLICA_BIND and time.time() - last_write < window
+
+def remember_write(response):
+    """Pin the client to the primary for a while after a successful write."""
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400 and replica_configured():
+        until = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+        response.set_cookie(
+            STICKY_COOKIE, f'{until:.3f}',
+            max_age=current_app.config['REPLICA_STICKY_SECONDS'],
+            httponly=True, samesite='Lax'
+        )
+    return response
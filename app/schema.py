@@ -0,0 +1,45 @@
+from sqlalchemy import inspect, literal
+from sqlalchemy.schema import CreateColumn
+from app import db
+
+def add_column_statement(table, column, dialect):
+    """ALTER TABLE adding ``column`` to ``table``, filling existing rows with its default."""
+    definition = str(CreateColumn(column).compile(dialect=dialect))
+    default = column.default
+    if not column.nullable and column.server_default is None and default is not None and default.is_scalar:
+        # Existing rows need a value for a NOT NULL column
+        value = literal(default.arg).compile(dialect=dialect, compile_kwargs={'literal_binds': True})
+        definition += f' DEFAULT {value}'
+    return f'ALTER TABLE {dialect.identifier_preparer.format_table(table)} ADD COLUMN {definition}'
+
+def upgrade_schema(engine=None):
+    """Bring an existing database up to the models; returns what was changed.
+
+    create_all() only adds missing tables, so columns and indexes added to
+    existing tables since they were created are added here. Safe to run
+    again: anything already there is left alone. Derived columns stay
+    plain columns on tables created before they were generated.
+    """
+    engine = engine or db.engine
+    changes = []
+    with engine.begin() as connection:
+        inspector = inspect(connection)
+        existing_tables = set(inspector.get_table_names())
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing_tables:
+                table.create(connection)
+                changes.append(f'created table {table.name}')
+                continue
+
+            columns = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in columns:
+                    connection.exec_driver_sql(add_column_statement(table, column, connection.dialect))
+                    changes.append(f'added column {table.name}.{column.name}')
+
+            indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in indexes:
+                    index.create(connection)
+                    changes.append(f'added index {index.name}')
+    return changes
@@ -0,0 +1,112 @@
+import threading
+from flask import current_app
+from sqlalchemy import func
+from app import db
+from app.cache import data_version
+from app.models import StockTransaction, normalize_symbol
+
+class SymbolTrie:
+    def __init__(self):
+        self.root = {}
+
+    def insert(self, key, value):
+        node = self.root
+        for char in key:
+            node = node.setdefault(char, {})
+        node.setdefault('$', []).append(value)
+
+    def complete(self, prefix, limit):
+        node = self.root
+        for char in prefix:
+            node = node.get(char)
+            if node is None:
+                return []
+
+        # Depth-first in key order, so matches come back alphabetically
+        results = []
+        stack = [node]
+        while stack and len(results) < limit:
+            node = stack.pop()
+            results.extend(node.get('$', [])[:limit - len(results)])
+            stack.extend(node[char] for char in sorted((c for c in node if c != '$'), reverse=True))
+        return results
+
+class SymbolIndex:
+    """In-memory index over the distinct normalized stock names.
+
+    Holds a trie for prefix completion and a trigram index for substring
+    lookups. A search term is resolved to the matching names here, and the
+    database is then queried with an indexed ``search_name IN (...)``.
+    """
+
+    def __init__(self, rows):
+        self.names = {}
+        self.trie = SymbolTrie()
+        self.trigrams = {}
+        for search_name, stock_name in rows:
+            self.names[search_name] = stock_name.strip()
+            self.trie.insert(search_name, search_name)
+            for i in range(len(search_name) - 2):
+                self.trigrams.setdefault(search_name[i:i + 3], set()).add(search_name)
+
+    def matching(self, term):
+        if len(term) < 3:
+            return [name for name in self.names if term in name]
+
+        # Candidates must contain every trigram of the term
+        candidates = None
+        for i in range(len(term) - 2):
+            names = self.trigrams.get(term[i:i + 3], set())
+            candidates = names if candidates is None else candidates & names
+            if not candidates:
+                return []
+        return [name for name in candidates if term in name]
+
+    def complete(self, prefix, limit=10):
+        return [self.names[name] for name in self.trie.complete(prefix, limit)]
+
+_index = None
+_index_version = None
+_index_lock = threading.Lock()
+
+def get_symbol_index():
+    # Rebuilt on the first lookup after a committed write
+    global _index, _index_version
+    version = data_version()
+    with _index_lock:
+        if _index is None or _index_version != version:
+            rows = db.session.query(
+                StockTransaction.search_name,
+                func.min(StockTransaction.stock_name)
+            ).filter(
+                StockTransaction.search_name.isnot(None)
+            ).group_by(StockTransaction.search_name).all()
+            _index = SymbolIndex(rows)
+            _index_version = version
+        return _index
+
+def search_condition(search, include_archived=False):
+    """Filter clause for stock names containing ``search``, or None for no filter."""
+    term = normalize_symbol(search)
+    if not term:
+        return None
+    if include_archived:
+        # The symbol index only knows the live names
+        return StockTransaction.search_name.contains(term, autoescape=True)
+
+    names = get_symbol_index().matching(term)
+    if len(names) > current_app.config['SEARCH_MAX_SYMBOLS']:
+        # Matches too many names for an IN list; scan the normalized column instead
+        return StockTransaction.search_name.contains(term, autoescape=True)
+    return StockTransaction.search_name.in_(names)
+
+def apply_search(query, search, include_archived=False):
+    """Filter ``query`` to stock names containing ``search``, case-insensitively."""
+    condition = search_condition(search, include_archived)
+    return query if condition is None else query.filter(condition)
+
+def complete_symbols(prefix, limit=10):
+    term = normalize_symbol(prefix)
+    if not term:
+        return []
+    return get_symbol_index().complete(term, limit)
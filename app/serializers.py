@@ -0,0 +1,109 @@
+import json
+from datetime import date, datetime
+from flask import current_app
+from app import db
+from app.models import StockTransaction
+from app.metrics import serialization_timer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _number(value):
+    return float(value) if value is not None else None
+
+def _number_or_zero(value):
+    return float(value) if value else 0.0
+
+# Field name -> converter, in StockTransaction.to_dict order. Dates and
+# datetimes are left to the encoder, which writes them in ISO format.
+TRANSACTION_FIELDS = {
+    'id': None,
+    'stock_name': None,
+    'buy_quantity': None,
+    'buy_price_per_stock': _number,
+    'total_cost': _number,
+    'buy_date': None,
+    'sell_quantity': None,
+    'sell_price_per_stock': _number_or_zero,
+    'total_selling_cost': _number_or_zero,
+    'sell_date': None,
+    'remaining_quantity': None,
+    'profit_loss_percentage': _number_or_zero,
+    'created_at': None,
+    'updated_at': None
+}
+
+def parse_fields(raw):
+    """Turn a ``fields=a,b`` argument into a list of known field names."""
+    if not raw:
+        return list(TRANSACTION_FIELDS)
+
+    fields = [name.strip() for name in raw.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in TRANSACTION_FIELDS]
+    if unknown:
+        raise ValueError(f'Unknown fields: {", ".join(unknown)}')
+    return fields
+
+def transaction_columns(fields, extra=()):
+    names = list(fields) + [name for name in extra if name not in fields]
+    return [getattr(StockTransaction, name) for name in names]
+
+def transaction_query(fields, extra=(), include_archived=False):
+    """Query selecting only ``fields`` (plus ``extra``) as plain rows.
+
+    Rows skip ORM hydration and the identity map entirely. With
+    ``include_archived`` archived lots are read too.
+    """
+    query = db.session.query(*transaction_columns(fields, extra))
+    return query.execution_options(include_archived=True) if include_archived else query
+
+def serialize_rows(rows, fields):
+    converters = [(name, TRANSACTION_FIELDS[name]) for name in fields]
+    with serialization_timer():
+        return [
+            {name: convert(value) if convert else value
+             for (name, convert), value in zip(converters, row)}
+            for row in rows
+        ]
+
+def _iso_default(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+def dumps(payload, app=None):
+    """Encode ``payload`` exactly as Flask's jsonify would, only faster.
+
+    orjson writes the same compact, key-sorted output as the stdlib
+    encoder for our values; anything non-ASCII goes through the stdlib
+    encoder so the escaping matches too. ``app`` defaults to the current
+    app, for callers running outside an app context.
+    """
+    app = current_app if app is None else app
+    with serialization_timer():
+        return _encode(payload, app)
+
+def _encode(payload, app):
+    provider = app.json
+    pretty = provider.compact is False or (provider.compact is None and app.debug)
+
+    if orjson is not None:
+        options = orjson.OPT_SORT_KEYS if provider.sort_keys else 0
+        if pretty:
+            options |= orjson.OPT_INDENT_2
+        data = orjson.dumps(payload, option=options)
+        if data.isascii():
+            return data + b'\n'
+
+    if pretty:
+        text = json.dumps(payload, default=_iso_default, sort_keys=provider.sort_keys,
+                          ensure_ascii=provider.ensure_ascii, indent=2)
+    else:
+        text = json.dumps(payload, default=_iso_default, sort_keys=provider.sort_keys,
+                          ensure_ascii=provider.ensure_ascii, separators=(',', ':'))
+    return (text + '\n').encode('utf-8')
+
+def json_response(payload, status=200):
+    return current_app.response_class(dumps(payload), status=status, mimetype=current_app.json.mimetype)
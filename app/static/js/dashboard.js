@@ -1,25 +1,94 @@
 $(document).ready(function() {
     let portfolioChart = null;
     
-    // Load dashboard data
-    loadDashboardStats();
+    // Last state the server sent; deltas are merged into it
+    let dashboard = null;
+    let lastSeq = null;
+    
+    // Load dashboard data, then keep it current from the server's stream
+    if (window.EventSource) {
+        streamDashboard();
+    } else {
+        pollDashboard();
+    }
+
+    function streamDashboard() {
+        // Reconnects on its own, resuming after the last event id it saw
+        const source = new EventSource('/api/stream/dashboard');
+        source.addEventListener('snapshot', function(event) {
+            applySnapshot(JSON.parse(event.data));
+        });
+        source.addEventListener('delta', function(event) {
+            applyDelta(JSON.parse(event.data));
+        });
+        source.onerror = function() {
+            console.error('Dashboard stream interrupted, reconnecting');
+        };
+    }
 
-    function loadDashboardStats() {
+    function pollDashboard() {
         $.ajax({
-            url: '/api/dashboard/stats',
+            url: '/api/stream/dashboard/poll',
             method: 'GET',
+            data: lastSeq === null ? {} : { since: lastSeq },
             success: function(data) {
-                updateStatsCards(data);
-                updateAdditionalStats(data);
-                loadPortfolioData();
+                if (data.snapshot) {
+                    applySnapshot(data.snapshot);
+                } else {
+                    data.deltas.forEach(applyDelta);
+                }
+                lastSeq = data.seq;
+                pollDashboard();
             },
             error: function(xhr) {
                 console.error('Error loading dashboard stats:', xhr);
-                showAlert('Error loading dashboard data', 'danger');
+                if (dashboard === null) {
+                    showAlert('Error loading dashboard data', 'danger');
+                }
+                setTimeout(pollDashboard, 5000);
             }
         });
     }
 
+    function applySnapshot(data) {
+        dashboard = {
+            stats: data.stats,
+            valuation: data.valuation,
+            holdings: {}
+        };
+        data.holdings.forEach(h => { dashboard.holdings[h.stock_name] = h; });
+        renderDashboard();
+    }
+
+    function applyDelta(delta) {
+        if (dashboard === null) {
+            return;
+        }
+        Object.assign(dashboard.stats, delta.stats);
+        Object.assign(dashboard.valuation, delta.valuation);
+        
+        // A holding sent as null is no longer held
+        $.each(delta.holdings || {}, function(name, holding) {
+            if (holding === null) {
+                delete dashboard.holdings[name];
+            } else {
+                dashboard.holdings[name] = holding;
+            }
+        });
+        renderDashboard();
+    }
+
+    function renderDashboard() {
+        // Same order as /api/dashboard/summary: largest holdings first
+        const holdings = Object.values(dashboard.holdings).sort((a, b) =>
+            b.remaining_quantity - a.remaining_quantity || (a.stock_name < b.stock_name ? -1 : 1)
+        );
+        updateStatsCards(dashboard.stats);
+        updateAdditionalStats(dashboard.stats);
+        updateValuation(dashboard.valuation);
+        createPortfolioChart(holdings);
+    }
+
     function updateStatsCards(data) {
         $('#totalTransactions').text(data.total_transactions.toLocaleString());
         $('#totalInvestment').text(formatCurrency(data.total_investment));
@@ -48,53 +117,28 @@ $(document).ready(function() {
 
     function updateAdditionalStats(data) {
         $('#activeStocks').text(data.active_stocks.toLocaleString());
-        
-        // Calculate additional stats from the data
-        $.ajax({
-            url: '/api/transactions?per_page=-1',
-            method: 'GET',
-            success: function(transactionData) {
-                const transactions = transactionData.transactions;
-                
-                // Calculate average profit/loss
-                let totalProfitLoss = 0;
-                let profitableStocks = 0;
-                let totalShares = 0;
-                let transactionsWithProfitLoss = 0;
-                
-                transactions.forEach(t => {
-                    totalShares += t.remaining_quantity;
-                    if (t.profit_loss_percentage !== 0) {
-                        totalProfitLoss += t.profit_loss_percentage;
-                        transactionsWithProfitLoss++;
-                        if (t.profit_loss_percentage > 0) {
-                            profitableStocks++;
-                        }
-                    }
-                });
-                
-                const avgProfitLoss = transactionsWithProfitLoss > 0 ? 
-                    totalProfitLoss / transactionsWithProfitLoss : 0;
-                
-                $('#avgProfitLoss').text(formatPercentage(avgProfitLoss));
-                $('#totalShares').text(totalShares.toLocaleString());
-                $('#profitableStocks').text(profitableStocks.toLocaleString());
-            }
-        });
+        $('#avgProfitLoss').text(formatPercentage(data.avg_profit_loss_percentage));
+        $('#totalShares').text(data.total_shares.toLocaleString());
+        $('#profitableStocks').text(data.profitable_transactions.toLocaleString());
     }
 
-
-    function loadPortfolioData() {
-        $.ajax({
-            url: '/api/transactions?per_page=-1',
-            method: 'GET',
-            success: function(data) {
-                createPortfolioChart(data.transactions);
-            }
-        });
+    function updateValuation(data) {
+        // Only positions with a stored price are valued
+        if (data.priced_positions === 0) {
+            $('#marketValue').text('-');
+            $('#unrealizedProfitLoss').text('-').removeClass('text-success text-danger');
+            return;
+        }
+        
+        const unrealized = data.unrealized_profit_loss;
+        $('#marketValue').text(formatCurrency(data.market_value));
+        $('#unrealizedProfitLoss')
+            .text(`${formatCurrency(unrealized)} (${formatPercentage(data.unrealized_profit_loss_percentage)})`)
+            .toggleClass('text-success', unrealized > 0)
+            .toggleClass('text-danger', unrealized < 0);
     }
 
-    function createPortfolioChart(transactions) {
+    function createPortfolioChart(holdings) {
         const ctx = document.getElementById('portfolioChart').getContext('2d');
         
         // Destroy existing chart if it exists
@@ -102,19 +146,8 @@ $(document).ready(function() {
             portfolioChart.destroy();
         }
 
-        // Group transactions by stock name and sum remaining quantities
-        const portfolioData = {};
-        transactions.forEach(t => {
-            if (t.remaining_quantity > 0) {
-                if (portfolioData[t.stock_name]) {
-                    portfolioData[t.stock_name] += t.remaining_quantity;
-                } else {
-                    portfolioData[t.stock_name] = t.remaining_quantity;
-                }
-            }
-        });
-
-        const stocks = Object.keys(portfolioData);
+        // Holdings arrive already grouped by stock name
+        const stocks = holdings.map(h => h.stock_name);
         if (stocks.length === 0) {
             ctx.clearRect(0, 0, ctx.canvas.width, ctx.canvas.height);
             ctx.font = '16px Arial';
@@ -124,7 +157,7 @@ $(document).ready(function() {
             return;
         }
 
-        const quantities = Object.values(portfolioData);
+        const quantities = holdings.map(h => h.remaining_quantity);
         
         // Generate colors
         const colors = generateColors(stocks.length);
@@ -194,9 +227,4 @@ $(document).ready(function() {
         }
         return result;
     }
-
-    // Refresh dashboard every 5 minutes
-    setInterval(function() {
-        loadDashboardStats();
-    }, 300000);
 });
\ No newline at end of file
@@ -3,6 +3,17 @@ $(document).ready(function() {
     let isEditMode = false;
     let currentTransactionId = null;
     let deleteTransactionId = null;
+    
+    // Keyset cursors for pages already visited, keyed by row offset
+    let pageCursors = {};
+    let cursorKey = null;
+    let requestStart = 0;
+
+    const GRID_FIELDS = [
+        'id', 'stock_name', 'buy_quantity', 'buy_price_per_stock', 'total_cost', 'buy_date',
+        'sell_quantity', 'sell_price_per_stock', 'total_selling_cost', 'sell_date',
+        'remaining_quantity', 'profit_loss_percentage'
+    ].join(',');
 
     // Initialize DataTable
     initializeDataTable();
@@ -25,6 +36,32 @@ $(document).ready(function() {
     $('#buyQuantity, #buyPrice').on('input', calculateTotals);
     $('#sellQuantity, #sellPrice').on('input', calculateTotals);
 
+    // Suggest existing stock names while typing
+    let symbolRequest = null;
+    $('#stockName').on('input', function() {
+        const prefix = $(this).val().trim();
+        if (symbolRequest) {
+            symbolRequest.abort();
+        }
+        if (!prefix) {
+            $('#stockSymbols').empty();
+            return;
+        }
+
+        symbolRequest = $.ajax({
+            url: '/api/symbols',
+            method: 'GET',
+            data: { q: prefix, limit: 10 },
+            success: function(response) {
+                const list = $('#stockSymbols');
+                list.empty();
+                response.symbols.forEach(function(symbol) {
+                    list.append($('<option>').attr('value', symbol));
+                });
+            }
+        });
+    });
+
     // Save transaction
     $('#saveTransaction').click(saveTransaction);
 
@@ -49,7 +86,7 @@ $(document).ready(function() {
             $('#uploadCsvBtn').prop('disabled', true);
         }
         // Reset results
-        $('#importResults').addClass('d-none');
+        $('#importResults, #importProgress').addClass('d-none');
         $('#importSuccess, #importWarning, #importError').hide();
     });
 
@@ -69,66 +106,158 @@ $(document).ready(function() {
         $('#uploadCsvBtn').prop('disabled', true).html('<i class="fas fa-spinner fa-spin me-1"></i>Uploading...');
 
         $.ajax({
-            url: '/api/bulk-import',
+            url: '/api/bulk-import/jobs',
             method: 'POST',
             data: formData,
             processData: false,
             contentType: false,
-            success: function(response) {
-                $('#importResults').removeClass('d-none');
-                
-                if (response.errors && response.errors.length > 0) {
-                    // Show warning with errors
-                    $('#importWarning').show();
-                    $('#warningMessage').text(response.message);
-                    
-                    const errorList = $('#errorList');
-                    errorList.empty();
-                    response.errors.forEach(function(error) {
-                        errorList.append(`<li>${error}</li>`);
-                    });
-                    
-                    if (response.warning) {
-                        $('#warningMessage').text(response.warning + '. ' + response.message);
-                    }
-                } else {
-                    // Show success
-                    $('#importSuccess').show();
-                    $('#successMessage').text(response.message);
-                }
+            success: function(job) {
+                $('#importProgress').removeClass('d-none');
+                updateImportProgress(job);
+                pollImportJob(job.status_url);
+            },
+            error: function(xhr) {
+                showImportError(xhr);
+                resetUploadButton();
+            }
+        });
+    });
 
-                // Reload the data table
-                transactionsTable.ajax.reload();
-                
-                // Reset form
-                $('#csvFile').val('');
-                
-                // Auto close modal after 3 seconds for successful imports
-                if (!response.errors || response.errors.length === 0) {
+    function pollImportJob(statusUrl) {
+        $.ajax({
+            url: statusUrl,
+            method: 'GET',
+            success: function(job) {
+                updateImportProgress(job);
+
+                if (job.status === 'finished') {
+                    showImportResults(job);
+                    resetUploadButton();
+                } else if (job.status === 'failed') {
+                    $('#importResults').removeClass('d-none');
+                    $('#importError').show();
+                    $('#errorMessage').text(job.error || 'Import failed');
+                    resetUploadButton();
+                } else {
                     setTimeout(function() {
-                        $('#bulkImportModal').modal('hide');
-                    }, 3000);
+                        pollImportJob(statusUrl);
+                    }, 1000);
                 }
             },
             error: function(xhr) {
-                $('#importResults').removeClass('d-none');
-                $('#importError').show();
-                
-                const error = xhr.responseJSON ? xhr.responseJSON.error : 'Upload failed';
-                $('#errorMessage').text(error);
+                showImportError(xhr);
+                resetUploadButton();
+            }
+        });
+    }
+
+    function updateImportProgress(job) {
+        const total = job.total_rows || 0;
+        const percent = total > 0 ? Math.min(100, Math.round(job.rows_processed / total * 100)) : 0;
+
+        $('#importProgressBar').css('width', percent + '%').text(percent + '%');
+        $('#importProgressText').text(
+            `${job.rows_processed.toLocaleString()} of ${total.toLocaleString()} rows processed - ` +
+            `${job.rows_imported.toLocaleString()} imported, ${job.rows_updated.toLocaleString()} updated, ` +
+            `${job.rows_unchanged.toLocaleString()} unchanged, ${job.rows_failed.toLocaleString()} failed`
+        );
+    }
+
+    function showImportResults(response) {
+        $('#importResults').removeClass('d-none');
+        
+        if (response.errors && response.errors.length > 0) {
+            // Show warning with errors
+            $('#importWarning').show();
+            $('#warningMessage').text(response.message);
+            
+            const errorList = $('#errorList');
+            errorList.empty();
+            response.errors.forEach(function(error) {
+                errorList.append(`<li>${error}</li>`);
+            });
+            
+            if (response.warning) {
+                $('#warningMessage').text(response.warning + '. ' + response.message);
+            }
+        } else {
+            // Show success
+            $('#importSuccess').show();
+            $('#successMessage').text(response.message);
+        }
+
+        // Reload the data table
+        reloadTable();
+        
+        // Reset form
+        $('#csvFile').val('');
+        
+        // Auto close modal after 3 seconds for successful imports
+        if (!response.errors || response.errors.length === 0) {
+            setTimeout(function() {
+                $('#bulkImportModal').modal('hide');
+            }, 3000);
+        }
+    }
+
+    function showImportError(xhr) {
+        $('#importResults').removeClass('d-none');
+        $('#importError').show();
+        
+        const error = xhr.responseJSON ? xhr.responseJSON.error : 'Upload failed';
+        $('#errorMessage').text(error);
+    }
+
+    function resetUploadButton() {
+        $('#uploadCsvBtn').prop('disabled', false).html('<i class="fas fa-upload me-1"></i>Upload CSV');
+    }
+
+    // Excel export runs as a background job; download once it has finished
+    $('#exportExcelBtn').click(function(e) {
+        e.preventDefault();
+        showAlert('<i class="fas fa-spinner fa-spin me-1"></i>Preparing Excel export...', 'info');
+
+        $.ajax({
+            url: '/api/export/excel/jobs',
+            method: 'POST',
+            success: function(job) {
+                pollExportJob(job);
             },
-            complete: function() {
-                // Re-enable button
-                $('#uploadCsvBtn').prop('disabled', false).html('<i class="fas fa-upload me-1"></i>Upload CSV');
+            error: function(xhr) {
+                const error = xhr.responseJSON ? xhr.responseJSON.error : 'Export failed';
+                showAlert(error, 'danger');
             }
         });
     });
 
+    function pollExportJob(job) {
+        $.ajax({
+            url: job.status_url,
+            method: 'GET',
+            success: function(status) {
+                if (status.status === 'finished') {
+                    showAlert('Excel export ready.');
+                    window.location.href = job.download_url;
+                } else if (status.status === 'failed') {
+                    showAlert(status.error || 'Export failed', 'danger');
+                } else {
+                    setTimeout(function() {
+                        pollExportJob(job);
+                    }, 1000);
+                }
+            },
+            error: function(xhr) {
+                const error = xhr.responseJSON ? xhr.responseJSON.error : 'Export failed';
+                showAlert(error, 'danger');
+            }
+        });
+    }
+
     // Reset bulk import modal when closed
     $('#bulkImportModal').on('hidden.bs.modal', function() {
         $('#csvFile').val('');
         $('#uploadCsvBtn').prop('disabled', true);
-        $('#importResults').addClass('d-none');
+        $('#importResults, #importProgress').addClass('d-none');
         $('#importSuccess, #importWarning, #importError').hide();
     });
 
@@ -136,13 +265,29 @@ $(document).ready(function() {
     function initializeDataTable() {
         transactionsTable = $('#transactionsTable').DataTable({
             processing: true,
-            serverSide: false,
+            serverSide: true,
             ajax: {
                 url: '/api/transactions',
                 data: function(d) {
-                    d.per_page = -1; // Get all records for client-side processing
+                    // Cursors are only valid for the ordering and search they came from
+                    const key = JSON.stringify([d.order, d.search.value, d.length]);
+                    if (key !== cursorKey) {
+                        pageCursors = {};
+                        cursorKey = key;
+                    }
+                    if (pageCursors[d.start]) {
+                        d.cursor = pageCursors[d.start];
+                    }
+                    requestStart = d.start;
+                    // Only the columns the grid renders
+                    d.fields = GRID_FIELDS;
                 },
-                dataSrc: 'transactions'
+                dataSrc: function(json) {
+                    if (json.next_cursor) {
+                        pageCursors[requestStart + json.data.length] = json.next_cursor;
+                    }
+                    return json.data;
+                }
             },
             columns: [
                 { 
@@ -191,6 +336,7 @@ $(document).ready(function() {
                 },
                 { 
                     data: null,
+                    orderable: false,
                     render: function(data, type, row) {
                         if (!row.buy_date) return '<span class="badge bg-secondary">0 days</span>';
                         
@@ -269,6 +415,11 @@ $(document).ready(function() {
         });
     }
 
+    function reloadTable() {
+        pageCursors = {};
+        transactionsTable.ajax.reload();
+    }
+
     function calculateTotals() {
         const buyQty = parseInt($('#buyQuantity').val()) || 0;
         const buyPrice = parseFloat($('#buyPrice').val()) || 0;
@@ -341,7 +492,7 @@ $(document).ready(function() {
             success: function(response) {
                 showAlert(`Transaction ${isEditMode ? 'updated' : 'added'} successfully!`);
                 $('#transactionModal').modal('hide');
-                transactionsTable.ajax.reload();
+                reloadTable();
             },
             error: function(xhr) {
                 const error = xhr.responseJSON ? xhr.responseJSON.error : 'An error occurred';
@@ -387,7 +538,7 @@ $(document).ready(function() {
             success: function(response) {
                 showAlert('Transaction deleted successfully!');
                 $('#deleteModal').modal('hide');
-                transactionsTable.ajax.reload();
+                reloadTable();
                 deleteTransactionId = null;
             },
             error: function(xhr) {
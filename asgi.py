@@ -0,0 +1,9 @@
+"""ASGI entry point: async read endpoints, with the Flask app for the rest.
+
+    uvicorn asgi:app --port 5000
+"""
+from app import create_app
+from app.async_api import create_asgi_app
+
+flask_app = create_app('development')
+app = create_asgi_app(flask_app)
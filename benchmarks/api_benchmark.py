@@ -0,0 +1,340 @@
+"""Benchmark every API route, import and export, and write the results as JSON.
+
+Generates ``--rows`` transactions into the 'benchmark' database (a local
+SQLite file unless BENCHMARK_DATABASE_URI points at MySQL), then drives
+each route through the Flask test client and records median/p95 latency,
+throughput and peak Python memory:
+
+    python benchmarks/api_benchmark.py --rows 200000 --output results/base.json
+    python benchmarks/api_benchmark.py --rows 200000 --compare results/base.json
+
+With ``--compare`` the run is checked against an earlier results file and
+the script exits non-zero when a case got slower or hungrier than
+``--threshold`` allows. ``--current`` compares two existing files instead.
+"""
+import argparse
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import select, func
+from app import create_app, db
+from app.archive import archive_closed_lots
+from app.datagen import generate_frame, generate_transactions, generate_price_history
+from app.models import StockTransaction, ImportJob, archived_transactions
+from app.prices import get_store
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+# ``run(client, state)`` makes one measured call and returns the final response
+Case = namedtuple('Case', 'name rule run rows', defaults=(None,))
+
+GRID = '/api/transactions?draw=1&length=25&order[0][column]=0&columns[0][data]=buy_date'
+# Creates per /api/transactions/batch call
+BATCH_SIZE = 100
+
+def get(path, **kwargs):
+    return lambda client, state: client.get(path, **kwargs)
+
+def check(response):
+    if response.status_code >= 400:
+        raise RuntimeError(f'{response.status_code}: {response.get_data(as_text=True)[:200]}')
+    return response
+
+def wait_for(client, path):
+    while True:
+        response = check(client.get(path))
+        status = response.get_json()['status']
+        if status == 'finished':
+            return response
+        if status == 'failed':
+            raise RuntimeError(f'{path} failed: {response.get_data(as_text=True)[:200]}')
+        time.sleep(0.02)
+
+def grid_cursor_page(client, state):
+    first = check(client.get(GRID + '&order[0][dir]=desc'))
+    cursor = first.get_json()['next_cursor']
+    return client.get(GRID + f'&order[0][dir]=desc&start=25&cursor={cursor}')
+
+def create_transaction(client, state):
+    response = check(client.post('/api/transactions', json={
+        'stock_name': 'BENCH', 'buy_quantity': 10, 'buy_price_per_stock': 100.5,
+        'buy_date': '2024-01-02', 'sell_quantity': 4, 'sell_price_per_stock': 120.25,
+        'sell_date': '2024-03-04'
+    }))
+    state.setdefault('created', []).append(response.get_json()['id'])
+    return response
+
+def update_transaction(client, state):
+    transaction_id = state['created'][state.setdefault('updates', 0) % len(state['created'])]
+    state['updates'] += 1
+    return client.put(f'/api/transactions/{transaction_id}', json={'sell_quantity': 6})
+
+def batch_create(client, state):
+    fill = {
+        'stock_name': 'BATCH', 'buy_quantity': 10, 'buy_price_per_stock': 99.5,
+        'buy_date': '2024-01-02', 'sell_quantity': 0, 'sell_price_per_stock': 0
+    }
+    return client.post('/api/transactions/batch', json={'create': [fill] * BATCH_SIZE})
+
+def sell_position(client, state):
+    return client.post('/api/positions/BENCH/sell', json={'quantity': 1, 'price_per_stock': 130.5})
+
+def bulk_update(client, state):
+    # Every buy in the last year: a few thousand rows at the default size
+    since = (datetime.now() - timedelta(days=365)).date().isoformat()
+    return client.patch('/api/transactions', json={
+        'buy_date_from': since, 'set': {'buy_price_per_stock': 101.25}
+    })
+
+def delete_transaction(client, state):
+    return client.delete(f'/api/transactions/{state["created"].pop()}')
+
+def fresh_csv(state):
+    # New symbols each call, so re-imports do not find the rows already there
+    state['uploads'] = state.get('uploads', 0) + 1
+    return state['import_csv'].replace(b'BENCH', f'BENCH{state["uploads"]}'.encode())
+
+def upload(data):
+    return {'file': (io.BytesIO(data), 'benchmark.csv')}
+
+def bulk_import(client, state):
+    return client.post('/api/bulk-import', data=upload(fresh_csv(state)))
+
+def bulk_reimport(client, state):
+    # The same file every call: after the first, every row is unchanged
+    return client.post('/api/bulk-import', data=upload(state['import_csv']))
+
+def import_job(client, state):
+    created = check(client.post('/api/bulk-import/jobs', data=upload(fresh_csv(state)))).get_json()
+    state['import_job'] = created['id']
+    return wait_for(client, created['status_url'])
+
+def resume_import_job(client, state):
+    # Rewind a finished job, and spool a file of new rows, so resuming
+    # imports the whole file
+    with state['app'].app_context():
+        job = db.session.get(ImportJob, state['import_job'])
+        with open(job.spool_path, 'wb') as f:
+            f.write(fresh_csv(state))
+        job.status, job.chunks_committed = 'failed', 0
+        job.rows_processed = job.rows_imported = job.rows_updated = job.rows_unchanged = job.rows_failed = 0
+        db.session.commit()
+    resumed = check(client.post(f'/api/bulk-import/jobs/{state["import_job"]}/resume')).get_json()
+    return wait_for(client, resumed['status_url'])
+
+def excel_job(client, state):
+    created = check(client.post('/api/export/excel/jobs')).get_json()
+    state['export_job'] = created
+    wait_for(client, created['status_url'])
+    return client.get(created['download_url'])
+
+def cases(rows, import_rows):
+    return [
+        Case('transactions_page', '/api/transactions', get('/api/transactions?page=1&per_page=25')),
+        Case('transactions_deep_page', '/api/transactions',
+             get(f'/api/transactions?page={max(rows // 50, 1)}&per_page=25&sort_by=buy_date')),
+        Case('transactions_search', '/api/transactions', get('/api/transactions?search=a&per_page=25')),
+        Case('transactions_all', '/api/transactions',
+             get('/api/transactions?per_page=-1&fields=id,stock_name,remaining_quantity'), rows),
+        Case('grid_first_page', '/api/transactions', get(GRID + '&order[0][dir]=desc')),
+        Case('grid_last_page', '/api/transactions', get(GRID + f'&order[0][dir]=desc&start={max(rows - 25, 0)}')),
+        Case('grid_cursor_page', '/api/transactions', grid_cursor_page),
+        Case('grid_search', '/api/transactions', get(GRID + '&order[0][dir]=asc&search[value]=ab')),
+        Case('transaction_detail', '/api/transactions/<int:transaction_id>', get(f'/api/transactions/{max(rows // 2, 1)}')),
+        Case('symbols', '/api/symbols', get('/api/symbols?q=A&limit=10')),
+        Case('create_transaction', '/api/transactions', create_transaction),
+        Case('update_transaction', '/api/transactions/<int:transaction_id>', update_transaction),
+        Case('batch_create', '/api/transactions/batch', batch_create, BATCH_SIZE),
+        Case('sell_position', '/api/positions/<stock_name>/sell', sell_position),
+        Case('bulk_update', '/api/transactions', bulk_update),
+        Case('delete_transaction', '/api/transactions/<int:transaction_id>', delete_transaction),
+        Case('dashboard_stats', '/api/dashboard/stats', get('/api/dashboard/stats')),
+        Case('dashboard_summary', '/api/dashboard/summary', get('/api/dashboard/summary')),
+        Case('positions', '/api/positions', get('/api/positions')),
+        Case('valuation', '/api/portfolio/valuation', get('/api/portfolio/valuation')),
+        Case('valuation_as_of', '/api/portfolio/valuation',
+             get(f'/api/portfolio/valuation?as_of={(datetime.now() - timedelta(days=365)).date().isoformat()}')),
+        Case('timeseries_day', '/api/analytics/timeseries', get('/api/analytics/timeseries?bucket=day')),
+        Case('timeseries_month', '/api/analytics/timeseries', get('/api/analytics/timeseries?bucket=month')),
+        Case('export_csv', '/api/export/csv', get('/api/export/csv'), rows),
+        Case('export_csv_gzip', '/api/export/csv', get('/api/export/csv', headers={'Accept-Encoding': 'gzip'}), rows),
+        Case('export_parquet', '/api/export/parquet', get('/api/export/parquet'), rows),
+        Case('export_arrow', '/api/export/arrow', get('/api/export/arrow'), rows),
+        Case('export_parquet_filtered', '/api/export/parquet',
+             get('/api/export/parquet?status=open&buy_date_from=' + (datetime.now() - timedelta(days=365)).date().isoformat())),
+        Case('export_excel', '/api/export/excel', get('/api/export/excel'), rows),
+        Case('export_excel_job', '/api/export/excel/jobs', excel_job, rows),
+        Case('export_job_status', '/api/export/jobs/<job_id>',
+             lambda client, state: client.get(state['export_job']['status_url'])),
+        Case('export_job_download', '/api/export/jobs/<job_id>/download',
+             lambda client, state: client.get(state['export_job']['download_url'])),
+        Case('sample_csv', '/api/sample-csv', get('/api/sample-csv')),
+        Case('bulk_import', '/api/bulk-import', bulk_import, import_rows),
+        Case('bulk_reimport', '/api/bulk-import', bulk_reimport, import_rows),
+        Case('import_job', '/api/bulk-import/jobs', import_job, import_rows),
+        Case('import_job_status', '/api/bulk-import/jobs/<int:job_id>',
+             lambda client, state: client.get(f'/api/bulk-import/jobs/{state["import_job"]}')),
+        Case('import_job_resume', '/api/bulk-import/jobs/<int:job_id>/resume', resume_import_job, import_rows)
+    ]
+
+def import_file(rows):
+    import numpy as np
+    frame = generate_frame(
+        np.random.default_rng(5), ['BENCHA', 'BENCHB', 'BENCHC'], np.array([0.5, 0.3, 0.2]),
+        np.array([100.0, 250.0, 40.0]), rows, datetime.now().date(), 365
+    )
+    return frame.to_csv(index=False).encode('utf-8')
+
+def measure(case, client, state, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        check(case.run(client, state)).get_data()
+        timings.append(time.perf_counter() - started)
+
+    # One more call under tracemalloc, which is too slow to time with
+    tracemalloc.start()
+    check(case.run(client, state)).get_data()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings.sort()
+    median = statistics.median(timings)
+    result = {
+        'median_ms': round(median * 1000, 3),
+        'p95_ms': round(timings[math.ceil(len(timings) * 0.95) - 1] * 1000, 3),
+        'mean_ms': round(statistics.mean(timings) * 1000, 3),
+        'requests_per_s': round(len(timings) / sum(timings), 2),
+        'peak_memory_kb': round(peak / 1024, 1)
+    }
+    if case.rows:
+        result['rows_per_s'] = round(case.rows / median, 1)
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(baseline, current, threshold):
+    """Print per-case changes and return the names that regressed."""
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            print(f'{name:24} new')
+            continue
+        changes = []
+        for metric in ('median_ms', 'peak_memory_kb'):
+            ratio = result[metric] / before[metric] if before[metric] else 1.0
+            changes.append(f'{metric} {before[metric]} -> {result[metric]} ({ratio - 1:+.0%})')
+            if ratio > 1 + threshold:
+                regressions.append(name)
+        print(f'{name:24} ' + ', '.join(changes))
+    return sorted(set(regressions))
+
+def run(args):
+    app = create_app('benchmark')
+    # Measure the endpoints themselves unless asked to keep the response cache
+    app.config['RESPONSE_CACHE_ENABLED'] = args.cache
+    app.config['COLUMNAR_REPLICA_ENABLED'] = args.columnar
+
+    with app.app_context():
+        if not args.reuse:
+            db.drop_all()
+            db.create_all()
+            symbols = generate_transactions(args.rows, args.symbols)
+            get_store().ingest(*generate_price_history(symbols))
+        if args.archive_older_than is not None:
+            archive_closed_lots(date.today() - timedelta(days=args.archive_older_than), app.config['ARCHIVE_BATCH_SIZE'])
+        rows = StockTransaction.query.count()
+        archived = db.session.execute(select(func.count()).select_from(archived_transactions)).scalar()
+        database = db.engine.dialect.name
+
+    # Requests run outside any app context, so each gets a fresh session
+    state = {'app': app, 'import_csv': import_file(args.import_rows)}
+    client = app.test_client()
+    results = {}
+    for case in cases(rows, args.import_rows):
+        if args.only and case.name not in args.only:
+            continue
+        results[case.name] = measure(case, client, state, args.repeat)
+        print(f'{case.name:24} {results[case.name]}')
+
+    benchmarked = {case.rule for case in cases(rows, args.import_rows)}
+    routes = sorted({rule.rule for rule in app.url_map.iter_rules() if rule.rule.startswith('/api/')})
+
+    return {
+        'meta': {
+            'commit': git_commit(),
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'database': database,
+            'rows': rows,
+            'archived_rows': archived,
+            'symbols': args.symbols,
+            'import_rows': args.import_rows,
+            'repeat': args.repeat,
+            'response_cache': args.cache,
+            'columnar_replica': args.columnar,
+            'python': platform.python_version()
+        },
+        'results': results,
+        'unbenchmarked_routes': [route for route in routes if route not in benchmarked]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--import-rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--reuse', action='store_true', help='Keep the data already in the database.')
+    parser.add_argument('--cache', action='store_true', help='Leave the response cache on.')
+    parser.add_argument('--columnar', action='store_true', help='Answer analytics from the columnar replica.')
+    parser.add_argument('--archive-older-than', type=int, help='First archive lots closed more than this many days ago.')
+    parser.add_argument('--only', nargs='*', help='Run only these cases.')
+    parser.add_argument('--output', help='Results file (default: results/<commit>.json).')
+    parser.add_argument('--compare', help='Earlier results file to check against.')
+    parser.add_argument('--current', help='With --compare, an existing results file instead of a new run.')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed slowdown, as a fraction.')
+    args = parser.parse_args()
+
+    if args.current:
+        with open(args.current) as f:
+            current = json.load(f)
+    else:
+        current = run(args)
+        output = args.output or os.path.join(RESULTS_DIR, f'{current["meta"]["commit"] or "results"}.json')
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f'Wrote {output}')
+        if current['unbenchmarked_routes']:
+            print(f'Not benchmarked: {", ".join(current["unbenchmarked_routes"])}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold)
+        if regressions:
+            print(f'Regressed beyond {args.threshold:.0%}: {", ".join(regressions)}')
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+"""Compare concurrent read throughput: the sync Flask app against the ASGI app.
+
+Each app is started in its own server process (the threaded Werkzeug server
+for Flask, uvicorn for asgi.py) on the 'benchmark' config, then hit by
+``--concurrency`` clients for ``--duration`` seconds per endpoint:
+
+    python benchmarks/async_benchmark.py --rows 100000 --concurrency 64
+
+Point BENCHMARK_DATABASE_URI at MySQL for numbers that mean anything;
+SQLite serializes on its file lock whatever the server does.
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from app import create_app, db
+from app.datagen import generate_transactions
+
+ENDPOINTS = [
+    '/api/transactions?page=1&per_page=25',
+    '/api/transactions?draw=1&start=0&length=25&order[0][column]=0&order[0][dir]=desc&columns[0][data]=buy_date',
+    '/api/transactions?per_page=-1&fields=id,stock_name,remaining_quantity',
+    '/api/dashboard/stats',
+    '/api/export/csv'
+]
+
+def serve(mode, port):
+    flask_app = create_app('benchmark')
+    # Measure the endpoints themselves, not the response cache
+    flask_app.config['RESPONSE_CACHE_ENABLED'] = False
+    if mode == 'sync':
+        flask_app.run(port=port, threaded=True)
+    else:
+        import uvicorn
+        from app.async_api import create_asgi_app
+        uvicorn.run(create_asgi_app(flask_app), port=port, log_level='warning')
+
+async def wait_until_up(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            try:
+                await client.get('/api/dashboard/stats')
+                return
+            except httpx.TransportError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f'server at {base_url} did not start')
+
+async def load(base_url, path, concurrency, duration):
+    timings = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker(client):
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            response = await client.get(path)
+            timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                errors += 1
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        started = time.monotonic()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.monotonic() - started
+
+    timings.sort()
+    return {
+        'requests_per_s': round(len(timings) / elapsed, 1),
+        'median_ms': round(statistics.median(timings), 1),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 1),
+        'errors': errors
+    }
+
+def run_mode(mode, port, args):
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--serve', mode, '--port', str(port)])
+    base_url = f'http://127.0.0.1:{port}'
+    try:
+        asyncio.run(wait_until_up(base_url))
+        for path in ENDPOINTS:
+            result = asyncio.run(load(base_url, path, args.concurrency, args.duration))
+            print(f'{mode:5} {path[:60]:60} {result}')
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000)
+    parser.add_argument('--symbols', type=int, default=500)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--port', type=int, default=5057)
+    parser.add_argument('--serve', choices=['sync', 'async'])
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.serve, args.port)
+        return
+
+    app = create_app('benchmark')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        generate_transactions(args.rows, args.symbols)
+
+    print(f'{args.rows} rows, {args.concurrency} concurrent clients, {args.duration}s per endpoint')
+    run_mode('sync', args.port, args)
+    run_mode('async', args.port + 1, args)
+
+if __name__ == '__main__':
+    main()
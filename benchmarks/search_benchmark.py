@@ -0,0 +1,69 @@
+"""Compare symbol search latency: LIKE '%term%' scans against the indexed search.
+
+Runs against the 'benchmark' config (a local SQLite file unless
+BENCHMARK_DATABASE_URI says otherwise):
+
+    python benchmarks/search_benchmark.py --rows 200000 --symbols 2000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+from app.datagen import generate_transactions
+from app.models import StockTransaction
+from app.search import apply_search
+
+def measure(run, terms, repeat):
+    timings = []
+    for _ in range(repeat):
+        for term in terms:
+            start = time.perf_counter()
+            run(term)
+            timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--symbols', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    app = create_app('benchmark')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        symbols = generate_transactions(args.rows, args.symbols)
+
+        rng = random.Random(3)
+        terms = [symbol[:rng.randint(1, 3)] for symbol in rng.sample(symbols, 20)]
+        terms += [symbol[1:4] for symbol in rng.sample(symbols, 20)]
+
+        # The grid needs the filtered count as well as the first page
+        def like_scan(term):
+            query = StockTransaction.query.filter(StockTransaction.stock_name.contains(term))
+            return query.count(), query.order_by(StockTransaction.id).limit(25).all()
+
+        def indexed(term):
+            query = apply_search(StockTransaction.query, term)
+            return query.count(), query.order_by(StockTransaction.id).limit(25).all()
+
+        # Build the symbol index once so the comparison is steady-state
+        indexed(terms[0])
+
+        print(f'{args.rows} rows, {args.symbols} symbols, {len(terms)} terms x {args.repeat}')
+        print('like_scan', measure(like_scan, terms, args.repeat))
+        print('indexed  ', measure(indexed, terms, args.repeat))
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,125 @@
+import os
+import tempfile
+
 class Config:
     SECRET_KEY = 'dev-secret-key-for-local-development'
     SQLALCHEMY_DATABASE_URI = 'mysql+pymysql://root:@localhost:3306/mystocktrading'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool: check connections before use and recycle them before
+    # MySQL's wait_timeout closes them on the server side
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_pre_ping': True,
+        'pool_recycle': 280,
+        'pool_size': 10,
+        'max_overflow': 20,
+        'pool_timeout': 30
+    }
+    
+    # Optional read replica for GET endpoints; clients stay on the primary
+    # for REPLICA_STICKY_SECONDS after one of their writes
+    SQLALCHEMY_REPLICA_URI = os.environ.get('DATABASE_REPLICA_URL')
+    REPLICA_STICKY_SECONDS = 5
+    
+    # Async read endpoints served by asgi.py; when unset, the URIs above are
+    # used with their asyncio driver (aiomysql, aiosqlite)
+    ASYNC_DATABASE_URI = os.environ.get('ASYNC_DATABASE_URL')
+    ASYNC_REPLICA_URI = os.environ.get('ASYNC_DATABASE_REPLICA_URL')
+    # Threads running the mounted Flask app for every other route
+    ASYNC_WSGI_WORKERS = 10
+    
+    # Response cache for read endpoints, invalidated by every committed write.
+    # The default backend keeps the data version in the process, which only
+    # suits a single worker; with several, use
+    # 'app.cache.DatabaseVersionBackend' (after `flask init-db` creates its
+    # data_version table) so a write in one worker reaches all of them
+    RESPONSE_CACHE_ENABLED = True
+    RESPONSE_CACHE_BACKEND = 'app.cache.InProcessBackend'
+    RESPONSE_CACHE_MAX_ENTRIES = 256
+    RESPONSE_CACHE_TTL = 300
+    
+    # Seconds a cached row count is reused by the server-side transactions grid
+    COUNT_CACHE_TTL = 30
+    
+    # Per-day totals behind /api/analytics/timeseries: seconds before a full
+    # rebuild (at most RESPONSE_CACHE_TTL unless the response cache backend
+    # shares its data version), and most days a write may touch before it
+    # forces one
+    TIMESERIES_CACHE_TTL = 3600
+    TIMESERIES_MAX_PATCH_DAYS = 366
+    
+    # Answer stats, holdings and the timeseries from an in-memory NumPy copy
+    # of stock_transactions, loaded on first use, instead of SQL. Writes made
+    # by other processes show up after at most COLUMNAR_REPLICA_CHECK_SECONDS
+    COLUMNAR_REPLICA_ENABLED = False
+    COLUMNAR_REPLICA_CHECK_SECONDS = 5
+    
+    # Most creates, updates and deletes in one /api/transactions/batch request
+    BATCH_MAX_ITEMS = 1000
+    
+    # Lots a sell through /api/positions/<stock>/sell is matched against
+    # first: 'fifo' (oldest) or 'lifo' (newest), unless the request says
+    POSITION_LOT_METHOD = 'fifo'
+    
+    # Dashboard updates pushed on /api/stream/dashboard: least seconds between
+    # recomputes, seconds between resyncs and between keep-alives, deltas kept
+    # for reconnecting clients, and seconds a long-poll request waits
+    LIVE_MIN_INTERVAL = 0.5
+    LIVE_RESYNC_SECONDS = 300
+    LIVE_HEARTBEAT_SECONDS = 15
+    LIVE_EVENT_BUFFER = 256
+    LIVE_POLL_TIMEOUT = 25
+    
+    # Daily close history used to value open positions; defaults to
+    # instance/prices when unset
+    PRICE_STORE_DIR = os.environ.get('PRICE_STORE_DIR')
+    
+    # Most distinct stock names a search resolves to before it falls back to a scan
+    SEARCH_MAX_SYMBOLS = 500
+    
+    # Rows read per batch by the streaming exports
+    EXPORT_BATCH_SIZE = 1000
+    # Rows per record batch (and Parquet row group) in the Arrow and Parquet exports
+    EXPORT_COLUMNAR_BATCH_SIZE = 10000
+    # Gzip the CSV export for clients that send Accept-Encoding: gzip
+    EXPORT_GZIP = True
+    # Background export jobs: worker threads, and seconds a finished file is kept
+    EXPORT_JOB_WORKERS = 2
+    EXPORT_JOB_TTL = 3600
+    
+    # Rows per executemany batch in the bulk CSV import
+    IMPORT_BATCH_SIZE = 1000
+    
+    # Lots moved per transaction by `flask archive`
+    ARCHIVE_BATCH_SIZE = 1000
+    
+    # Chunked import jobs: rows per committed chunk, worker threads,
+    # where uploads are spooled and how many row errors are kept per job
+    IMPORT_CHUNK_SIZE = 5000
+    IMPORT_JOB_WORKERS = 1
+    IMPORT_SPOOL_DIR = os.path.join(tempfile.gettempdir(), 'mystockdata-imports')
+    IMPORT_MAX_ERRORS = 1000
+    
+    # Per-route request, query and serialization metrics, served on /metrics
+    METRICS_ENABLED = True
+    METRICS_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+    # Logged with their statements: queries at least this slow, and one
+    # statement repeated this many times in a request (an N+1 loop)
+    METRICS_SLOW_QUERY_SECONDS = 0.5
+    METRICS_N_PLUS_ONE_THRESHOLD = 10
+    # Add Server-Timing and X-Query-Count headers to responses
+    METRICS_DEBUG_HEADER = False
+    
+    # Seconds from importing the app package to create_app() returning are
+    # kept in app.extensions['startup_seconds'] and passed, with the app, to
+    # STARTUP_HOOK (a dotted path to a callable) when one is set
+    STARTUP_HOOK = None
+    # Checked by tests/test_startup.py, which `flask check-startup` runs:
+    # median startup in a fresh interpreter, and modules that only the
+    # routes using them may import
+    STARTUP_TIME_BUDGET = 1.0
+    STARTUP_LAZY_MODULES = ['pandas', 'numpy', 'openpyxl', 'pyarrow']
+    
     # MySQL connection settings
     MYSQL_HOST = 'localhost'
     MYSQL_PORT = 3306
@@ -12,13 +129,37 @@ class Config:
     
 class DevelopmentConfig(Config):
     DEBUG = True
+    METRICS_DEBUG_HEADER = True
 
 class ProductionConfig(Config):
     DEBUG = False
     SECRET_KEY = 'change-this-in-production'
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        'pool_pre_ping': True,
+        'pool_recycle': 280,
+        'pool_size': 20,
+        'max_overflow': 40,
+        'pool_timeout': 30
+    }
+
+class BenchmarkConfig(Config):
+    DEBUG = False
+    SQLALCHEMY_DATABASE_URI = os.environ.get(
+        'BENCHMARK_DATABASE_URI',
+        'sqlite:///' + os.path.join(tempfile.gettempdir(), 'mystockdata-benchmark.db')
+    )
+    PRICE_STORE_DIR = os.path.join(tempfile.gettempdir(), 'mystockdata-benchmark-prices')
+
+class TestingConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    # In-memory SQLite shares one connection, so there is no pool to size
+    SQLALCHEMY_ENGINE_OPTIONS = {}
 
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'benchmark': BenchmarkConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
\ No newline at end of file
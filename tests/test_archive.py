@@ -0,0 +1,26 @@
+from datetime import date
+from app import db
+from app.archive import archive_closed_lots
+from app.models import StockTransaction
+
+def closed_lot(stock_name, buy_date):
+    return StockTransaction(
+        stock_name=stock_name, buy_quantity=10, buy_price_per_stock=100.0, buy_date=buy_date,
+        sell_quantity=10, sell_price_per_stock=110.0, sell_date=buy_date
+    )
+
+def test_archived_ids_are_not_reused(client):
+    db.session.add_all([closed_lot('AAPL', date(2023, 1, 2)), closed_lot('MSFT', date(2023, 1, 3))])
+    db.session.commit()
+    highest = db.session.query(db.func.max(StockTransaction.id)).scalar()
+    assert archive_closed_lots(date(2024, 1, 1)) == 2
+
+    lot = closed_lot('TCS', date(2023, 2, 1))
+    db.session.add(lot)
+    db.session.commit()
+    assert lot.id > highest
+    assert archive_closed_lots(date(2024, 1, 1)) == 1
+
+    listed = client.get('/api/transactions?per_page=-1&include_archived=true').get_json()['transactions']
+    ids = [transaction['id'] for transaction in listed]
+    assert len(ids) == len(set(ids)) == 3
@@ -0,0 +1,90 @@
+from datetime import date
+import pyarrow as pa
+import pytest
+from starlette.testclient import TestClient
+from app import create_app, db
+from app.async_api import create_asgi_app
+from app.models import StockTransaction
+from config import config, TestingConfig
+
+@pytest.fixture(params=['app.cache.InProcessBackend', 'app.cache.DatabaseVersionBackend'])
+def app(request, tmp_path, monkeypatch):
+    # A file, so the asyncio engine reads the same database
+    settings = type('AsyncConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "app.db"}',
+        'RESPONSE_CACHE_BACKEND': request.param
+    })
+    monkeypatch.setitem(config, 'async', settings)
+    app = create_app('async')
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            connection.execute(StockTransaction.__table__.insert(), [{
+                'stock_name': name, 'search_name': name, 'buy_quantity': 10,
+                'buy_price_per_stock': 100.0, 'buy_date': date(2024, 1, 2)
+            } for name in ('AAPL', 'MSFT')])
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def asgi_client(app):
+    with TestClient(create_asgi_app(app)) as client:
+        yield client
+
+READS = ['/api/transactions?per_page=-1', '/api/transactions/1', '/api/dashboard/stats', '/api/export/csv']
+# httpx asks for gzip by default, which is part of the cache key
+PLAIN = {'Accept-Encoding': 'identity'}
+
+@pytest.mark.parametrize('url', READS)
+@pytest.mark.parametrize('async_first', [False, True])
+def test_shares_the_flask_cache_and_etags(client, asgi_client, url, async_first):
+    # Whichever app answers first stores the entry the other one serves
+    if async_first:
+        response = asgi_client.get(url, headers=PLAIN)
+        flask_response = client.get(url, headers=PLAIN)
+    else:
+        flask_response = client.get(url, headers=PLAIN)
+        response = asgi_client.get(url, headers=PLAIN)
+    assert response.status_code == 200
+    assert response.headers['ETag'] == flask_response.headers['ETag']
+    assert response.content == flask_response.get_data()
+
+    revalidated = asgi_client.get(url, headers={**PLAIN, 'If-None-Match': response.headers['ETag']})
+    assert revalidated.status_code == 304
+    assert revalidated.content == b''
+
+def test_write_through_flask_changes_the_etag(client, asgi_client):
+    before = asgi_client.get('/api/dashboard/stats')
+    lot = {'stock_name': 'NVDA', 'buy_quantity': 1, 'buy_price_per_stock': 1.0, 'buy_date': '2024-02-01'}
+    assert client.post('/api/transactions', json=lot).status_code == 201
+
+    after = asgi_client.get('/api/dashboard/stats', headers={'If-None-Match': before.headers['ETag']})
+    assert after.status_code == 200
+    assert after.json()['total_transactions'] == 3
+
+def test_records_metrics(client, asgi_client):
+    asgi_client.get('/api/transactions?per_page=-1')
+    asgi_client.get('/api/export/csv')
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'http_requests_total{route="/api/transactions",method="GET",status="200"} 1' in metrics
+    assert 'http_requests_total{route="/api/export/csv",method="GET",status="200"} 1' in metrics
+    queries = [line for line in metrics.splitlines() if line.startswith('db_queries_total{route="/api/transactions"}')]
+    assert queries and int(queries[0].split()[-1]) > 0
+
+@pytest.mark.parametrize('url', ['/api/export/arrow', '/api/export/parquet'])
+def test_columnar_exports_match_flask(client, asgi_client, url):
+    flask_response = client.get(url)
+    response = asgi_client.get(url)
+    assert response.status_code == 200
+    assert response.headers['content-type'] == flask_response.headers['Content-Type']
+    if url.endswith('arrow'):
+        table = pa.ipc.open_stream(response.content).read_all()
+        assert table.equals(pa.ipc.open_stream(flask_response.get_data()).read_all())
+        assert table.column('stock_name').to_pylist() == ['AAPL', 'MSFT']
+    else:
+        assert response.content[:4] == b'PAR1'
+
+def test_columnar_export_rejects_bad_filters(asgi_client):
+    response = asgi_client.get('/api/export/arrow?status=sold')
+    assert response.status_code == 400
+    assert 'status must be one of' in response.json()['error']
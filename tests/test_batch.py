@@ -0,0 +1,67 @@
+import pytest
+from app import db
+from app.cache import data_version
+from app.models import StockTransaction, Position
+
+def lot(name, quantity, price=100.0):
+    return {'stock_name': name, 'buy_quantity': quantity, 'buy_price_per_stock': price, 'buy_date': '2024-01-02'}
+
+@pytest.fixture
+def stored(client):
+    return [client.post('/api/transactions', json=lot(name, 10)).get_json()['id'] for name in ('AAPL', 'MSFT')]
+
+def snapshot():
+    db.session.remove()
+    transactions = sorted((t.id, t.stock_name, t.buy_quantity) for t in StockTransaction.query)
+    positions = sorted((p.stock_name, p.quantity, p.open_lots) for p in Position.query)
+    return transactions, positions, data_version()
+
+def test_atomic_batch_with_an_invalid_item_writes_nothing(client, stored):
+    before = snapshot()
+    response = client.post('/api/transactions/batch', json={
+        'create': [lot('NVDA', 5), {'stock_name': 'BAD'}],
+        'update': [{'id': stored[0], 'buy_quantity': 20}],
+        'delete': [stored[1]]
+    })
+    assert response.status_code == 400
+    body = response.get_json()
+    assert body['applied'] is False
+    assert body['failed'] == 1
+    assert body['created'] == [{'index': 1, 'id': None, 'error': 'Missing required field: buy_quantity'}]
+    assert snapshot() == before
+
+def test_partial_batch_applies_valid_items_and_reports_failures_by_index(client, stored):
+    before = snapshot()
+    response = client.post('/api/transactions/batch', json={
+        'atomic': False,
+        'create': [lot('NVDA', 5), {'stock_name': 'BAD'}],
+        'update': [{'id': 999, 'buy_quantity': 1}, {'id': stored[0], 'buy_quantity': 20}],
+        'delete': [stored[1], 'x']
+    })
+    assert response.status_code == 207
+    body = response.get_json()
+    assert body['applied'] is True
+    assert body['failed'] == 3
+    created, updated, deleted = body['created'], body['updated'], body['deleted']
+    assert [item['index'] for item in created] == [0, 1] and 'error' in created[1]
+    assert updated[0] == {'index': 0, 'id': 999, 'error': 'Transaction 999 not found'}
+    assert updated[1] == {'index': 1, 'id': stored[0]}
+    assert deleted[0] == {'index': 0, 'id': stored[1]}
+    assert deleted[1] == {'index': 1, 'id': None, 'error': 'Ids to delete must be integers'}
+
+    transactions, positions, version = snapshot()
+    assert [(name, quantity) for _, name, quantity in transactions] == [('AAPL', 20), ('NVDA', 5)]
+    # The ledger keeps a zeroed row for a stock whose last lot went
+    assert positions == [('AAPL', 20, 1), ('MSFT', 0, 0), ('NVDA', 5, 1)]
+    assert version != before[2]
+
+@pytest.mark.parametrize('batch', [
+    {'atomic': False, 'create': [{'stock_name': 'BAD'}], 'update': [{'id': 999, 'buy_quantity': 1}], 'delete': [999]},
+    {'atomic': False},
+    {}
+])
+def test_batch_that_applies_nothing_has_no_side_effects(client, stored, batch):
+    before = snapshot()
+    response = client.post('/api/transactions/batch', json=batch)
+    assert response.get_json()['applied'] is False
+    assert snapshot() == before
@@ -0,0 +1,48 @@
+from datetime import date
+from app import db
+from app.cache import DatabaseVersionBackend
+from app.models import StockTransaction
+
+LOT = {'stock_name': 'AAPL', 'buy_quantity': 10, 'buy_price_per_stock': 150.0, 'buy_date': '2024-01-02'}
+
+def test_write_in_the_same_second_is_not_a_304(client):
+    first = client.get('/api/dashboard/stats')
+    assert client.post('/api/transactions', json=LOT).status_code == 201
+
+    # Last-Modified alone no longer validates: the write may share its second
+    response = client.get('/api/dashboard/stats', headers={'If-Modified-Since': first.headers['Last-Modified']})
+    assert response.status_code == 200
+    assert response.get_json()['total_transactions'] == 1
+
+    response = client.get('/api/dashboard/stats', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+
+    current = client.get('/api/dashboard/stats', headers={'If-None-Match': response.headers['ETag']})
+    assert current.status_code == 304
+
+def test_database_version_is_shared_between_workers(app, client):
+    worker = app.extensions['response_cache'] = DatabaseVersionBackend()
+    other = DatabaseVersionBackend()
+    assert worker.version() == other.version() == 'initial'
+
+    first = client.get('/api/dashboard/stats')
+    assert first.get_json()['total_transactions'] == 0
+
+    # Another worker writes and bumps the shared version
+    db.session.execute(StockTransaction.__table__.insert(), [{
+        'stock_name': 'AAPL', 'search_name': 'AAPL', 'buy_quantity': 10,
+        'buy_price_per_stock': 150.0, 'buy_date': date(2024, 1, 2)
+    }])
+    db.session.commit()
+    previous, version = other.bump()
+    assert previous == 'initial' and worker.version() == version
+
+    response = client.get('/api/dashboard/stats', headers={'If-None-Match': first.headers['ETag']})
+    assert response.status_code == 200
+    assert response.get_json()['total_transactions'] == 1
+
+    # This worker's own writes bump the same row
+    assert client.post('/api/transactions', json=LOT).status_code == 201
+    current = other.version()
+    assert current not in (version, 'initial')
+    assert other.bump() == (current, worker.version())
@@ -0,0 +1,49 @@
+import io
+from app import db
+from app.importer import run_import_job
+from app.models import ImportJob, StockTransaction
+
+HEADER = 'stock_name,buy_quantity,buy_price_per_stock,buy_date\n'
+
+def upload(client, text):
+    data = {'file': (io.BytesIO(text.encode()), 'transactions.csv')}
+    return client.post('/api/bulk-import', data=data, content_type='multipart/form-data')
+
+def test_header_only_upload(client):
+    response = upload(client, HEADER)
+    assert response.status_code == 200
+    assert response.get_json()['message'] == 'Successfully imported 0 transactions'
+    assert response.get_json()['errors'] == []
+
+def test_upload_where_every_row_fails(client):
+    response = upload(client, HEADER + 'AAPL,ten,150,2024-01-02\nMSFT,5,310,not a date\n')
+    assert response.status_code == 200
+    assert response.get_json()['successful_imports'] == 0
+    assert len(response.get_json()['errors']) == 2
+    assert StockTransaction.query.count() == 0
+
+def test_job_with_an_all_invalid_chunk(app, tmp_path):
+    text = HEADER + (
+        'AAPL,10,150,2024-01-02\nMSFT,5,310,2024-01-03\n'
+        'TCS,ten,3500,2024-01-04\nINFY,3,1500,never\n'
+        'HDFC,9,1620,2024-01-05\n'
+    )
+    spool = tmp_path / 'upload.csv'
+
+    def run(chunks_committed=0):
+        spool.write_text(text)
+        job = ImportJob(filename='upload.csv', spool_path=str(spool), chunks_committed=chunks_committed)
+        db.session.add(job)
+        db.session.commit()
+        run_import_job(job.id, chunk_size=2, batch_size=100, max_errors=100)
+        return db.session.get(ImportJob, job.id)
+
+    job = run()
+    assert job.status == 'finished', job.error_message
+    assert (job.rows_imported, job.rows_failed) == (3, 2)
+
+    # A resumed job skips past the invalid chunk, and finds the rest imported
+    job = run(chunks_committed=2)
+    assert job.status == 'finished', job.error_message
+    assert (job.rows_imported, job.rows_unchanged) == (0, 1)
+    assert StockTransaction.query.count() == 3
@@ -0,0 +1,69 @@
+import importlib.util
+from pathlib import Path
+import pytest
+from app import db
+from app.models import StockTransaction, Position, LotSale
+from app.positions import ledger_differences
+
+def lot(name, quantity, price=100.0, buy_date='2024-01-02'):
+    return {'stock_name': name, 'buy_quantity': quantity, 'buy_price_per_stock': price, 'buy_date': buy_date}
+
+@pytest.fixture
+def commands():
+    # app.py, loaded by path: the name is taken by the package
+    spec = importlib.util.spec_from_file_location('manage', Path(__file__).parent.parent / 'app.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def assert_ledger_matches():
+    db.session.remove()
+    assert ledger_differences(db.session.connection()) == []
+
+def test_ledger_follows_every_write_path(app, client, commands):
+    ids = [client.post('/api/transactions', json=lot('AAPL', 10)).get_json()['id'] for _ in range(3)]
+    client.post('/api/transactions', json=lot('MSFT', 20, 250.0))
+    assert_ledger_matches()
+
+    response = client.put(f'/api/transactions/{ids[0]}', json={**lot('AAPL', 15, 110.0), 'sell_quantity': 5,
+                                                              'sell_price_per_stock': 130.0, 'sell_date': '2024-03-01'})
+    assert response.status_code == 200
+    assert_ledger_matches()
+
+    response = client.patch('/api/transactions', json={'stock_name': 'MSFT', 'set': {'buy_price_per_stock': 260.0}})
+    assert response.get_json()['updated'] == 1
+    assert_ledger_matches()
+
+    response = client.post('/api/transactions/batch', json={
+        'create': [lot('NVDA', 8, 400.0)],
+        'update': [{'id': ids[1], 'buy_quantity': 12}],
+        'delete': [ids[2]]
+    })
+    assert response.status_code == 200
+    assert_ledger_matches()
+
+    response = client.post('/api/positions/AAPL/sell', json={'quantity': 7, 'price_per_stock': 150.0, 'sell_date': '2024-04-01'})
+    assert response.status_code == 200
+    assert_ledger_matches()
+
+    assert client.delete(f'/api/transactions/{ids[1]}').status_code == 200
+    assert_ledger_matches()
+
+    result = app.test_cli_runner().invoke(commands.seed_db)
+    assert result.exit_code == 0, result.output
+    assert_ledger_matches()
+
+def test_reseeding_clears_what_the_old_transactions_left(app, client, commands):
+    for _ in range(3):
+        client.post('/api/transactions', json=lot('AAPL', 10))
+    client.post('/api/positions/AAPL/sell', json={'quantity': 5, 'price_per_stock': 150.0})
+    assert LotSale.query.count() == 1
+
+    app.test_cli_runner().invoke(commands.seed_db)
+    db.session.remove()
+    assert LotSale.query.count() == 0
+    assert Position.query.filter_by(stock_name='AAPL').first() is None
+    assert sum(p.open_lots for p in Position.query) == StockTransaction.query.filter(
+        StockTransaction.buy_quantity > db.func.coalesce(StockTransaction.sell_quantity, 0)
+    ).count()
+    assert_ledger_matches()
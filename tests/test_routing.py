@@ -0,0 +1,82 @@
+import time
+from datetime import date
+from types import SimpleNamespace
+import pytest
+from flask import g
+from app import create_app, db
+from app import routing
+from app.models import StockTransaction
+from config import config, TestingConfig
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # Two SQLite files standing in for the primary and its replica
+    settings = type('RoutingConfig', (TestingConfig,), {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp_path / "primary.db"}',
+        'SQLALCHEMY_REPLICA_URI': f'sqlite:///{tmp_path / "replica.db"}',
+        # Every response should show where it read from
+        'RESPONSE_CACHE_ENABLED': False
+    })
+    monkeypatch.setitem(config, 'routing', settings)
+    # The replica bind registers a metadata on the shared db; keep it to this test
+    monkeypatch.setattr(db, 'metadatas', dict(db.metadatas))
+    app = create_app('routing')
+    with app.app_context():
+        db.create_all()
+        db.metadata.create_all(db.engines[routing.REPLICA_BIND])
+        for engine, name in ((db.engine, 'PRIMARY'), (db.engines[routing.REPLICA_BIND], 'REPLICA')):
+            with engine.begin() as connection:
+                connection.execute(StockTransaction.__table__.insert(), [{
+                    'stock_name': name, 'search_name': name, 'buy_quantity': 10,
+                    'buy_price_per_stock': 100.0, 'buy_date': date(2024, 1, 2)
+                }])
+        yield app
+        db.session.remove()
+
+def names(client):
+    transactions = client.get('/api/transactions?per_page=-1').get_json()['transactions']
+    return sorted(transaction['stock_name'] for transaction in transactions)
+
+def count(engine):
+    with engine.connect() as connection:
+        return connection.execute(db.select(db.func.count()).select_from(StockTransaction)).scalar()
+
+def test_reads_go_to_the_replica(client):
+    assert names(client) == ['REPLICA']
+    assert client.get('/api/dashboard/stats').get_json()['total_transactions'] == 1
+    assert b'REPLICA' in client.get('/api/export/csv').get_data()
+    assert b'PRIMARY' not in client.get('/api/export/csv').get_data()
+
+def test_writes_go_to_the_primary(app, client):
+    lot = {'stock_name': 'NEW', 'buy_quantity': 1, 'buy_price_per_stock': 1.0, 'buy_date': '2024-02-01'}
+    assert client.post('/api/transactions', json=lot).status_code == 201
+    assert count(db.engine) == 2
+    assert count(db.engines[routing.REPLICA_BIND]) == 1
+
+def test_session_with_changes_stays_on_the_primary(app):
+    with app.test_request_context():
+        g.db_route = routing.REPLICA_BIND
+        assert StockTransaction.query.one().stock_name == 'REPLICA'
+
+        db.session.add(StockTransaction(
+            stock_name='PENDING', buy_quantity=1, buy_price_per_stock=1.0, buy_date=date(2024, 2, 1)
+        ))
+        with db.session.no_autoflush:
+            assert StockTransaction.query.count() == 1
+            assert StockTransaction.query.filter_by(stock_name='PRIMARY').count() == 1
+        # Flushed but not committed: only the primary has the row
+        assert StockTransaction.query.filter_by(stock_name='PENDING').count() == 1
+
+        db.session.rollback()
+        assert StockTransaction.query.one().stock_name == 'REPLICA'
+
+def test_sticky_cookie_pins_reads_to_the_primary(app, client, monkeypatch):
+    lot = {'stock_name': 'NEW', 'buy_quantity': 1, 'buy_price_per_stock': 1.0, 'buy_date': '2024-02-01'}
+    response = client.post('/api/transactions', json=lot)
+    assert routing.STICKY_COOKIE in response.headers['Set-Cookie']
+    assert names(client) == ['NEW', 'PRIMARY']
+
+    # Once the sticky window has passed, reads go back to the replica
+    later = time.time() + app.config['REPLICA_STICKY_SECONDS'] + 1
+    monkeypatch.setattr(routing, 'time', SimpleNamespace(time=lambda: later))
+    assert names(client) == ['REPLICA']
@@ -0,0 +1,77 @@
+from datetime import date
+import pytest
+from sqlalchemy import inspect
+from app import create_app, db
+from app.models import StockTransaction, ImportJob
+from app.schema import upgrade_schema
+
+# stock_transactions and import_jobs as the first releases created them
+BASELINE = [
+    '''CREATE TABLE stock_transactions (
+        id INTEGER NOT NULL PRIMARY KEY,
+        stock_name VARCHAR(100) NOT NULL,
+        buy_quantity INTEGER NOT NULL,
+        buy_price_per_stock NUMERIC(10, 4) NOT NULL,
+        total_cost NUMERIC(15, 4) NOT NULL,
+        buy_date DATE NOT NULL,
+        sell_quantity INTEGER,
+        sell_price_per_stock NUMERIC(10, 4),
+        total_selling_cost NUMERIC(15, 4),
+        sell_date DATE,
+        remaining_quantity INTEGER NOT NULL,
+        profit_loss_percentage NUMERIC(10, 4),
+        created_at DATETIME,
+        updated_at DATETIME
+    )''',
+    'CREATE INDEX ix_stock_transactions_stock_name ON stock_transactions (stock_name)',
+    '''INSERT INTO stock_transactions VALUES (
+        1, 'AAPL', 10, 150, 1500, '2024-01-02', 0, 0, 0, NULL, 10, 0, NULL, NULL
+    )''',
+    '''CREATE TABLE import_jobs (
+        id INTEGER NOT NULL PRIMARY KEY,
+        filename VARCHAR(255) NOT NULL,
+        spool_path VARCHAR(500) NOT NULL,
+        status VARCHAR(20) NOT NULL,
+        total_rows INTEGER,
+        chunks_committed INTEGER NOT NULL,
+        rows_processed INTEGER NOT NULL,
+        rows_imported INTEGER NOT NULL,
+        rows_failed INTEGER NOT NULL,
+        errors TEXT,
+        error_message TEXT,
+        created_at DATETIME,
+        updated_at DATETIME
+    )''',
+    "INSERT INTO import_jobs VALUES (1, 'a.csv', '/tmp/a.csv', 'finished', 3, 1, 3, 3, 0, NULL, NULL, NULL, NULL)"
+]
+
+@pytest.fixture
+def old_app():
+    app = create_app('testing')
+    with app.app_context():
+        with db.engine.begin() as connection:
+            for statement in BASELINE:
+                connection.exec_driver_sql(statement)
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+def test_upgrade_adds_missing_columns_and_indexes(old_app):
+    changes = upgrade_schema()
+    assert 'added column stock_transactions.search_name' in changes
+    assert 'added column stock_transactions.import_key' in changes
+    assert 'added column import_jobs.rows_updated' in changes
+    assert 'added index ix_stock_transactions_updated_at' in changes
+    assert 'created table positions' in changes
+
+    indexes = {index['name'] for index in inspect(db.engine).get_indexes('stock_transactions')}
+    assert {'ix_stock_transactions_search_name', 'ix_stock_transactions_import_key'} <= indexes
+
+    lot = db.session.get(StockTransaction, 1)
+    assert (lot.stock_name, lot.search_name, lot.buy_date) == ('AAPL', None, date(2024, 1, 2))
+    job = db.session.get(ImportJob, 1)
+    assert (job.rows_updated, job.rows_unchanged) == (0, 0)
+
+def test_upgrade_is_idempotent(old_app):
+    assert upgrade_schema()
+    assert upgrade_schema() == []
@@ -0,0 +1,39 @@
+from datetime import date
+import pytest
+from flask import jsonify
+from app import db
+from app.models import StockTransaction
+from app.serializers import TRANSACTION_FIELDS, transaction_query, serialize_rows, json_response
+
+def seed():
+    db.session.add_all([
+        StockTransaction(stock_name='AAPL', buy_quantity=10, buy_price_per_stock=150.1234, buy_date=date(2024, 1, 2),
+                         sell_quantity=4, sell_price_per_stock=171.5, sell_date=date(2024, 3, 1)),
+        StockTransaction(stock_name='Nestlé Société Générale 日本', buy_quantity=3, buy_price_per_stock=99.99,
+                         buy_date=date(2024, 2, 1))
+    ])
+    db.session.commit()
+    # Sell fields left NULL, as rows written before they had defaults
+    db.session.execute(StockTransaction.__table__.insert(), [{
+        'stock_name': 'Zürich', 'search_name': 'ZÜRICH', 'buy_quantity': 7, 'buy_price_per_stock': 12.5,
+        'buy_date': date(2024, 2, 3), 'sell_quantity': None, 'sell_price_per_stock': None, 'sell_date': None
+    }])
+    db.session.commit()
+
+@pytest.mark.parametrize('debug', [False, True])
+@pytest.mark.parametrize('only', [('AAPL',), ('Nestlé Société Générale 日本', 'Zürich'), None])
+def test_rows_encode_like_jsonify_to_dict(app, debug, only):
+    seed()
+    app.debug = debug
+    fields = list(TRANSACTION_FIELDS)
+    query = transaction_query(fields).order_by(StockTransaction.id)
+    lots = StockTransaction.query.order_by(StockTransaction.id)
+    if only is not None:
+        query = query.filter(StockTransaction.stock_name.in_(only))
+        lots = lots.filter(StockTransaction.stock_name.in_(only))
+
+    with app.test_request_context():
+        fast = json_response({'transactions': serialize_rows(query.all(), fields), 'total': 3})
+        expected = jsonify({'transactions': [lot.to_dict() for lot in lots], 'total': 3})
+        assert fast.get_data() == expected.get_data()
+        assert fast.mimetype == expected.mimetype
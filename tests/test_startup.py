@@ -0,0 +1,43 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+import pytest
+from config import config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Set by `flask check-startup` from its options
+CONFIG_NAME = os.environ.get('STARTUP_CHECK_CONFIG', 'testing')
+RUNS = int(os.environ.get('STARTUP_CHECK_RUNS', 3))
+
+PROBE = '''
+import json, sys
+from app import create_app
+app = create_app(sys.argv[1])
+print(json.dumps({
+    "seconds": app.extensions["startup_seconds"],
+    "loaded": [name for name in json.loads(sys.argv[2]) if name in sys.modules]
+}))
+'''
+
+@pytest.fixture(scope='module')
+def startups():
+    """What create_app() took and loaded in each of RUNS fresh interpreters."""
+    lazy_modules = json.dumps(config[CONFIG_NAME].STARTUP_LAZY_MODULES)
+    results = []
+    for _ in range(RUNS):
+        output = subprocess.run(
+            [sys.executable, '-c', PROBE, CONFIG_NAME, lazy_modules],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return results
+
+def test_startup_within_budget(startups):
+    median = statistics.median(result['seconds'] for result in startups)
+    assert median <= config[CONFIG_NAME].STARTUP_TIME_BUDGET
+
+def test_heavy_modules_load_on_first_use(startups):
+    loaded = sorted({name for result in startups for name in result['loaded']})
+    assert loaded == []
@@ -0,0 +1,81 @@
+from datetime import date
+from app import db
+from app.analytics import stats_statement, stats_from_row
+from app.models import StockTransaction
+
+def loop_stats(transactions):
+    """The stats as /api/dashboard/stats and the dashboard script added them up row by row."""
+    net_profit_loss = 0.0
+    for t in transactions:
+        if t.sell_quantity > 0 and t.total_selling_cost > 0:
+            sold_cost_ratio = float(t.sell_quantity) / float(t.buy_quantity)
+            proportional_buy_cost = float(t.total_cost) * sold_cost_ratio
+            net_profit_loss += float(t.total_selling_cost) - proportional_buy_cost
+
+    total_profit_loss = 0.0
+    with_profit_loss = 0
+    profitable = 0
+    for t in transactions:
+        percentage = t.to_dict()['profit_loss_percentage']
+        if percentage != 0:
+            total_profit_loss += percentage
+            with_profit_loss += 1
+            if percentage > 0:
+                profitable += 1
+
+    return {
+        'total_transactions': len(transactions),
+        'total_investment': sum(float(t.total_cost) for t in transactions),
+        'total_returns': sum(float(t.total_selling_cost or 0) for t in transactions),
+        'net_profit_loss': net_profit_loss,
+        'active_stocks': sum(1 for t in transactions if t.remaining_quantity > 0),
+        'total_shares': sum(t.remaining_quantity for t in transactions),
+        'avg_profit_loss_percentage': total_profit_loss / with_profit_loss if with_profit_loss else 0,
+        'profitable_transactions': profitable
+    }
+
+def seed_lots():
+    lots = [
+        # Open
+        dict(stock_name='AAPL', buy_quantity=10, buy_price_per_stock=150.25, buy_date=date(2024, 1, 2)),
+        dict(stock_name='MSFT', buy_quantity=7, buy_price_per_stock=310.1, buy_date=date(2024, 1, 3)),
+        # Partly sold, at a gain and at a loss
+        dict(stock_name='AAPL', buy_quantity=20, buy_price_per_stock=140.0, buy_date=date(2024, 1, 5),
+             sell_quantity=5, sell_price_per_stock=171.5, sell_date=date(2024, 3, 1)),
+        dict(stock_name='TCS', buy_quantity=3, buy_price_per_stock=3550.0, buy_date=date(2024, 2, 1),
+             sell_quantity=1, sell_price_per_stock=3333.3333, sell_date=date(2024, 2, 20)),
+        # Fully sold
+        dict(stock_name='INFY', buy_quantity=12, buy_price_per_stock=1450.75, buy_date=date(2024, 1, 10),
+             sell_quantity=12, sell_price_per_stock=1602.4, sell_date=date(2024, 4, 2)),
+        dict(stock_name='HDFC', buy_quantity=9, buy_price_per_stock=1620.0, buy_date=date(2024, 1, 11),
+             sell_quantity=9, sell_price_per_stock=1500.0, sell_date=date(2024, 4, 3)),
+        # Shares sold without a selling price
+        dict(stock_name='MSFT', buy_quantity=4, buy_price_per_stock=300.0, buy_date=date(2024, 2, 5),
+             sell_quantity=4, sell_price_per_stock=0.0, sell_date=date(2024, 5, 1)),
+    ]
+    db.session.add_all(StockTransaction(**lot) for lot in lots)
+    db.session.commit()
+
+    # A NULL selling price only gets in through Core, as legacy rows did
+    db.session.execute(StockTransaction.__table__.insert(), [{
+        'stock_name': 'INFY', 'search_name': 'INFY', 'buy_quantity': 6, 'buy_price_per_stock': 1500.0,
+        'buy_date': date(2024, 3, 4), 'sell_quantity': 2, 'sell_price_per_stock': None,
+        'sell_date': date(2024, 3, 9)
+    }])
+    db.session.commit()
+
+def test_aggregate_matches_row_loop(app):
+    seed_lots()
+    expected = loop_stats(StockTransaction.query.all())
+    stats = stats_from_row(db.session.execute(stats_statement()).one())
+
+    assert set(stats) == set(expected)
+    for name, value in expected.items():
+        if isinstance(value, int):
+            assert stats[name] == value, name
+        else:
+            assert abs(stats[name] - value) < 1e-6, name
+
+def test_empty_table(app):
+    expected = loop_stats([])
+    assert stats_from_row(db.session.execute(stats_statement()).one()) == expected
@@ -0,0 +1,29 @@
+from datetime import date
+from app import db
+from app.cache import DatabaseVersionBackend
+from app.models import StockTransaction
+
+def lot(buy_date):
+    return {'stock_name': 'AAPL', 'buy_quantity': 10, 'buy_price_per_stock': 150.0, 'buy_date': buy_date}
+
+def test_per_process_version_caps_the_ttl(app):
+    assert app.extensions['day_totals'].ttl == app.config['RESPONSE_CACHE_TTL']
+
+def test_write_by_another_worker_rebuilds_day_totals(app, client):
+    app.extensions['response_cache'] = DatabaseVersionBackend()
+    other = DatabaseVersionBackend()
+    totals = app.extensions['day_totals']
+
+    assert client.post('/api/transactions', json=lot('2024-01-02')).status_code == 201
+    assert list(totals.totals()) == [date(2024, 1, 2)]
+
+    # Another worker's write, then one in this process: the dates this
+    # process was told about do not cover the other worker's
+    db.session.execute(StockTransaction.__table__.insert(), [dict(
+        lot(date(2024, 2, 1)), search_name='AAPL'
+    )])
+    db.session.commit()
+    other.bump()
+    assert client.post('/api/transactions', json=lot('2024-03-01')).status_code == 201
+
+    assert sorted(totals.totals()) == [date(2024, 1, 2), date(2024, 2, 1), date(2024, 3, 1)]
@@ -0,0 +1,56 @@
+import io
+import pandas as pd
+from app.importer import validate_frame, check_row
+
+CSV = '''stock_name,buy_quantity,buy_price_per_stock,buy_date,sell_quantity,sell_price_per_stock,sell_date
+AAPL,10,150.25,2024-01-02,,,
+MSFT,5,310,01/03/2024,5,320.5,02/01/2024
+,4,100,2024-01-04,,,
+   ,4,100,2024-01-04,,,
+TCS,0,3500,2024-01-05,,,
+INFY,3,-1500,2024-01-06,,,
+HDFC,9,0,2024-01-07,,,
+WIPRO,2,450,,,,
+ITC,8,410,2024-13-45,,,
+ITC,8,410,Jan 5 2024,,,
+SBIN,6,600,2024-01-08,2,610,not a date
+RELI,6,2500,2024-01-09,7,2600,2024-02-01
+TATA,7,900,2024-01-10,3,-5,2024-02-02
+LT,4,3400.5,2024-01-12,4,3500,2024-03-01
+'''
+
+def loop_validate(df):
+    """The importer's original per-row loop: valid records and errors in row order."""
+    records, errors = [], []
+    for index, row in df.iterrows():
+        record, error = check_row(index, row)
+        if error:
+            errors.append(error)
+        else:
+            records.append(record)
+    return records, errors
+
+def check_against_loop(df):
+    expected_records, expected_errors = loop_validate(df)
+    rows, errors = validate_frame(df)
+
+    assert errors == expected_errors
+    records = [
+        {name: (None if pd.isna(value) else value) for name, value in record.items()}
+        for record in rows.to_dict('records')
+    ]
+    assert records == expected_records
+
+def test_vectorized_errors_match_row_loop():
+    df = pd.read_csv(io.StringIO(CSV))
+    check_against_loop(df)
+    assert [error.split(':')[0] for error in validate_frame(df)[1]] == [
+        'Row 4', 'Row 5', 'Row 6', 'Row 7', 'Row 8', 'Row 9', 'Row 10', 'Row 11', 'Row 12', 'Row 13'
+    ]
+
+def test_cells_of_unexpected_types_match_row_loop():
+    # A text quantity or a numeric name goes through the per-row rules
+    df = pd.read_csv(io.StringIO(CSV)).astype({'stock_name': object, 'buy_quantity': object})
+    df.loc[1, 'buy_quantity'] = 'ten'
+    df.loc[2, 'stock_name'] = 42
+    check_against_loop(df)